@@ -1,9 +1,117 @@
 // electron-app\public\scripts\flow-manager.js
+
+// Interaction events (state changes, disposals, ratings, photos) are buffered
+// here, kept in localStorage across restarts, and posted to /events in order.
+// Each carries a key, so a batch resent after a lost response is not applied
+// twice; failed posts are retried with backoff.
+class EventBuffer {
+  constructor(url, kioskId) {
+    this.url = url;
+    this.kioskId = kioskId;
+    this.storageKey = 'pendingEvents';
+    this.maxBatch = 100;
+    this.flushDelay = 3000;
+    this.retryDelay = 1000;
+    this.maxRetryDelay = 60000;
+    this.inFlight = false;
+    this.timer = null;
+    try {
+      this.events = JSON.parse(localStorage.getItem(this.storageKey)) || [];
+    } catch (error) {
+      this.events = [];
+    }
+    if (this.events.length) this.schedule(0);
+  }
+
+  newKey() {
+    if (window.crypto?.randomUUID) return window.crypto.randomUUID();
+    return `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+  }
+
+  push(type, fields) {
+    const event = {
+      key: this.newKey(),
+      type,
+      timestamp: new Date().toISOString(),
+      ...fields,
+    };
+    this.events.push(event);
+    this.persist();
+    this.schedule(this.flushDelay);
+    return event.key;
+  }
+
+  persist() {
+    try {
+      localStorage.setItem(this.storageKey, JSON.stringify(this.events));
+    } catch (error) {
+      console.error('Could not persist pending events:', error);
+    }
+  }
+
+  schedule(delay) {
+    if (this.timer) clearTimeout(this.timer);
+    this.timer = setTimeout(() => {
+      this.timer = null;
+      this.flush();
+    }, delay);
+  }
+
+  flush() {
+    if (this.inFlight || this.events.length === 0) return;
+    if (this.timer) {
+      clearTimeout(this.timer);
+      this.timer = null;
+    }
+
+    this.inFlight = true;
+    const batch = this.events.slice(0, this.maxBatch);
+    fetch(this.url, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        'X-Kiosk-Id': this.kioskId,
+      },
+      body: JSON.stringify({ kiosk_id: this.kioskId, events: batch }),
+    })
+      .then((response) =>
+        response.json().then((data) => ({ status: response.status, data }))
+      )
+      .then(({ status, data }) => {
+        if (status === 200) {
+          this.events.splice(0, batch.length);
+          this.retryDelay = 1000;
+        } else if (status === 400 && data.index != null) {
+          // That event can never be applied; drop it and send the rest
+          console.error('Dropping rejected event:', batch[data.index], data.error);
+          this.events.splice(this.events.indexOf(batch[data.index]), 1);
+        } else {
+          throw new Error(data.error || `HTTP ${status}`);
+        }
+        this.persist();
+        this.inFlight = false;
+        if (this.events.length) this.schedule(0);
+      })
+      .catch((error) => {
+        // Server down, starting up or overloaded: keep the events and retry
+        console.warn('Event upload failed, retrying:', error.message);
+        this.inFlight = false;
+        this.schedule(this.retryDelay);
+        this.retryDelay = Math.min(this.retryDelay * 2, this.maxRetryDelay);
+      });
+  }
+}
+
 class FlowManager {
   constructor() {
     this.currentFlow = 'ewaste-selection';
     this.selectedBox = '';
     this.selectedRating = 0;
+    this.lastRatingKey = null;
+    this.events = new EventBuffer(
+      'http://127.0.0.1:5000/events',
+      localStorage.getItem('kioskId') || 'default'
+    );
     this.initializeEventListeners();
   }
 
@@ -12,6 +120,11 @@ class FlowManager {
     document.querySelectorAll('.waste-btn').forEach(btn => {
       btn.addEventListener('click', (e) => {
         this.selectedBox = e.target.dataset.box;
+        this.events.push('disposal', {
+          vip_id: this.currentVIP(),
+          waste_type: e.target.dataset.waste,
+          box_number: this.selectedBox
+        });
         this.showBoxInstruction();
       });
     });
@@ -60,7 +173,23 @@ class FlowManager {
     
     // Show selected state
     document.getElementById(stateId).classList.remove('hidden');
+    const changed = this.currentFlow !== stateId;
     this.currentFlow = stateId;
+
+    // Flow history is kept per VIP; guests have none
+    const vipId = this.currentVIP();
+    if (changed && vipId) {
+      this.events.push('state', {
+        vip_id: vipId,
+        flow_state: stateId,
+        selected_box: this.selectedBox,
+        selected_rating: this.selectedRating
+      });
+    }
+  }
+
+  currentVIP() {
+    return window.cameraManager ? window.cameraManager.getCurrentVIP() : null;
   }
 
   showBoxInstruction() {
@@ -111,8 +240,10 @@ class FlowManager {
       return;
     }
 
-    // Save rating to database (implement later)
-    console.log('Rating submitted:', this.selectedRating);
+    this.lastRatingKey = this.events.push('rating', {
+      vip_id: this.currentVIP(),
+      rating: this.selectedRating
+    });
 
     if (this.selectedRating === 5) {
       this.showPhotoState();
@@ -143,16 +274,31 @@ class FlowManager {
   }
 
   takePhoto() {
-    // Implement photo capture
-    console.log('Photo taken!');
+    // The photo is uploaded on its own; the event links it to the rating
+    const ratingKey = this.lastRatingKey;
+    const vipId = this.currentVIP();
+    if (window.cameraManager) {
+      window.cameraManager.takePhoto((photoId) => {
+        this.events.push('photo', {
+          photo_id: photoId,
+          rating_key: ratingKey,
+          vip_id: vipId
+        });
+        this.events.flush();
+      });
+    }
     this.endFlow();
   }
 
   endFlow() {
     // Reset to initial state
+    this.lastRatingKey = null;
     this.selectedRating = 0;
     this.selectedBox = '';
     this.showState('ewaste-selection');
+
+    // Send this interaction's events now rather than after the delay
+    this.events.flush();
   }
 
   initializeFlappyBird() {
@@ -9,11 +9,22 @@ document.addEventListener("DOMContentLoaded", () => {
   const vipName = document.getElementById("vip-name");
   const vipStatus = document.getElementById("vip-status");
 
+  // Identifies this kiosk/camera to the backend (tracking, logs, latest
+  // detection); set localStorage "kioskId" when several kiosks share a server
+  const KIOSK_ID = localStorage.getItem("kioskId") || "default";
+
   let isDetecting = false;
   let detectionInterval = null;
+  let detectionInFlight = false;
+  let detectionSocket = null;
+  let framesInFlight = 0;
   let currentVIPState = null;
   let stream = null;
 
+  // Pacing hints from the backend (interval, max frame width, JPEG quality);
+  // every detection response carries the current ones
+  const pacing = { intervalMs: null, maxWidth: null, quality: 0.8 };
+
   // VIP state management queue
   let vipQueue = new Map();
 
@@ -116,51 +127,176 @@ document.addEventListener("DOMContentLoaded", () => {
     if (isDetecting) return;
 
     isDetecting = true;
-    detectionInterval = setInterval(() => {
-      if (videoElement.readyState === videoElement.HAVE_ENOUGH_DATA) {
+    fetch("http://127.0.0.1:5000/pacing")
+      .then((response) => response.json())
+      .then((data) => applyPacing(data.pacing))
+      .catch(() => {})
+      .finally(() => startStreamDetection());
+  }
+
+  function applyPacing(hints) {
+    if (!hints) return;
+    pacing.intervalMs = hints.interval_ms;
+    pacing.maxWidth = hints.max_width;
+    pacing.quality = hints.jpeg_quality;
+  }
+
+  function startStreamDetection() {
+    // Persistent channel: the backend keeps only the newest frame, so we can
+    // send at camera rate and let it drop whatever it can't keep up with
+    let opened = false;
+    try {
+      detectionSocket = new WebSocket(
+        `ws://127.0.0.1:5000/detect-stream?kiosk_id=${encodeURIComponent(KIOSK_ID)}`
+      );
+    } catch (error) {
+      console.error("Detection stream unavailable:", error);
+      startPollingDetection();
+      return;
+    }
+
+    const sendFrame = () => {
+      // Allow a couple of frames in flight; the server discards stale ones
+      if (
+        framesInFlight < 2 &&
+        videoElement.readyState === videoElement.HAVE_ENOUGH_DATA
+      ) {
+        framesInFlight++;
+        captureFrameBlob().then((blob) => {
+          if (detectionSocket?.readyState === WebSocket.OPEN) {
+            detectionSocket.send(blob);
+          }
+        });
+      }
+      detectionInterval = setTimeout(sendFrame, pacing.intervalMs || 66); // ~15 fps until told otherwise
+    };
+
+    detectionSocket.onopen = () => {
+      opened = true;
+      framesInFlight = 0;
+      console.log("Detection stream connected");
+      sendFrame();
+    };
+
+    detectionSocket.onmessage = (event) => {
+      framesInFlight = 0;
+      const data = JSON.parse(event.data);
+      applyPacing(data.pacing);
+      updateUI(data);
+    };
+
+    detectionSocket.onclose = () => {
+      if (detectionInterval) {
+        clearTimeout(detectionInterval);
+        detectionInterval = null;
+      }
+      detectionSocket = null;
+      if (!isDetecting) return;
+
+      if (opened) {
+        // Lost an established stream: try to reconnect shortly
+        setTimeout(() => {
+          if (isDetecting) startStreamDetection();
+        }, 1000);
+      } else {
+        console.warn("Detection stream not available, falling back to polling");
+        startPollingDetection();
+      }
+    };
+  }
+
+  function startPollingDetection() {
+    const poll = () => {
+      if (
+        !detectionInFlight &&
+        videoElement.readyState === videoElement.HAVE_ENOUGH_DATA
+      ) {
         detectFace();
       }
-    }, 200); // Check every 200ms for better responsiveness
+      // Every 200ms until the backend suggests a pace
+      detectionInterval = setTimeout(poll, pacing.intervalMs || 200);
+    };
+    poll();
   }
 
   function stopFaceDetection() {
     isDetecting = false;
     if (detectionInterval) {
-      clearInterval(detectionInterval);
+      clearTimeout(detectionInterval);
       detectionInterval = null;
     }
+    if (detectionSocket) {
+      detectionSocket.close();
+      detectionSocket = null;
+    }
   }
 
-  function captureFrame() {
-    const canvas = document.createElement("canvas");
-    canvas.width = videoElement.videoWidth;
-    canvas.height = videoElement.videoHeight;
+  // Reused for every detection frame instead of allocating a canvas per capture
+  const frameCanvas = document.createElement("canvas");
+
+  function drawFrame(canvas, maxWidth) {
+    // Downscale to the width the backend asked for, keeping the aspect ratio
+    const scale =
+      maxWidth && videoElement.videoWidth > maxWidth
+        ? maxWidth / videoElement.videoWidth
+        : 1;
+    canvas.width = Math.round(videoElement.videoWidth * scale);
+    canvas.height = Math.round(videoElement.videoHeight * scale);
     const ctx = canvas.getContext("2d");
     ctx.drawImage(videoElement, 0, 0, canvas.width, canvas.height);
-    return canvas.toDataURL("image/jpeg", 0.8);
+    return canvas;
   }
 
-  function detectFace() {
-    const imageData = captureFrame();
+  function captureFrame() {
+    return drawFrame(document.createElement("canvas")).toDataURL(
+      "image/jpeg",
+      0.8
+    );
+  }
 
-    fetch("http://127.0.0.1:5000/detect-face", {
-      method: "POST",
-      headers: {
-        "Content-Type": "application/json",
-      },
-      body: JSON.stringify({ image: imageData }),
-    })
+  function captureFrameBlob() {
+    return new Promise((resolve) => {
+      drawFrame(frameCanvas, pacing.maxWidth).toBlob(
+        resolve,
+        "image/jpeg",
+        pacing.quality
+      );
+    });
+  }
+
+  function detectFace() {
+    // Send the JPEG bytes directly rather than a base64 data URL in JSON
+    detectionInFlight = true;
+    captureFrameBlob()
+      .then((blob) =>
+        fetch("http://127.0.0.1:5000/detect-face", {
+          method: "POST",
+          headers: {
+            "Content-Type": "image/jpeg",
+            "X-Kiosk-Id": KIOSK_ID,
+          },
+          body: blob,
+        })
+      )
+      // Refused (429) frames carry pacing hints and are marked skipped
       .then((response) => response.json())
       .then((data) => {
+        applyPacing(data.pacing);
         updateUI(data);
       })
       .catch((error) => {
         console.error("Detection error:", error);
         updateUI({ error: "Detection failed" });
+      })
+      .finally(() => {
+        detectionInFlight = false;
       });
   }
 
   function updateUI(data) {
+    // Superseded by a newer frame from this kiosk; its result is on the way
+    if (data.skipped) return;
+
     // Always check for new VIPs or changes
     const detectedVIP = checkIfVIP(data);
 
@@ -253,33 +389,20 @@ document.addEventListener("DOMContentLoaded", () => {
   }
 
   function checkIfVIP(data) {
-    // Placeholder VIP detection logic
-    // In a real app, this would use proper face recognition
+    // The backend decides VIP identity and smooths it per tracked face,
+    // so the id stays stable while the same person is in front of the bin
     if (!data || data.error) return false;
 
-    const age = parseInt(data.age);
-    const gender = data.gender;
-
-    // Mock VIP detection based on age and gender
-    // Replace this with actual face recognition logic
-    if (age >= 20 && age <= 25 && gender === "Male") return 1;
-    if (age >= 26 && age <= 30 && gender === "Female") return 2;
-    if (age >= 31 && age <= 35 && gender === "Male") return 3;
-    if (age >= 36 && age <= 40 && gender === "Female") return 4;
-    if (age >= 41 && age <= 45 && gender === "Male") return 5;
-    if (age >= 46 && age <= 50 && gender === "Female") return 6;
-    if (age >= 51 && gender === "Male") return 7;
-
-    return false; // Not a VIP
+    return data.is_vip && data.vip_id ? data.vip_id : false;
   }
 
   // Store reference for flow manager integration
   window.cameraManager = {
-    takePhoto: function () {
+    takePhoto: function (onSaved) {
       // Capture photo for 5-star rating flow
       const photoData = captureFrame();
 
-      // Save to database (implement later)
+      // Saved in the background by the backend; the response carries the photo id
       fetch("http://127.0.0.1:5000/save-photo", {
         method: "POST",
         headers: {
@@ -287,13 +410,14 @@ document.addEventListener("DOMContentLoaded", () => {
         },
         body: JSON.stringify({
           photo: photoData,
-          vipId: currentVIPState,
+          vip_id: currentVIPState,
           timestamp: new Date().toISOString(),
         }),
       })
         .then((response) => response.json())
         .then((data) => {
           console.log("Photo saved:", data);
+          if (onSaved && data.photo_id) onSaved(data.photo_id);
         })
         .catch((error) => {
           console.error("Error saving photo:", error);
@@ -0,0 +1,132 @@
+# python-backend\analytics.py
+"""Time-bucketed rollups of detections and disposals.
+
+Every face_data and waste_disposal insert also bumps counters in
+face_rollup / disposal_rollup for its minute, hour and day bucket, in the
+same transaction. Dashboards query the rollups by bucket size and time
+range through the primary key, so they never scan raw detection rows or
+compete with the detection writer for long.
+"""
+
+from collections import Counter
+
+BUCKET_SIZES = ('minute', 'hour', 'day')
+
+# Bucket start as a prefix of the '%Y-%m-%d %H:%M:%S' timestamp, padded back
+# to a full timestamp so ranges compare as plain strings
+_BUCKET_PREFIX = {'minute': (16, ':00'), 'hour': (13, ':00:00'), 'day': (10, ' 00:00:00')}
+
+# (label, lowest age); a band runs up to the next band's lowest age
+AGE_BANDS = (
+    ('0-17', 1), ('18-24', 18), ('25-34', 25), ('35-44', 35),
+    ('45-54', 45), ('55-64', 55), ('65+', 65),
+)
+UNKNOWN_AGE_BAND = 'unknown'
+
+# Stored in place of NULL so the dimensions can be part of the primary key
+NO_VIP = -1
+
+FACE_DIMENSIONS = ('gender', 'age_band', 'vip_id')
+DISPOSAL_DIMENSIONS = ('box_number', 'waste_type', 'vip_id')
+
+def bucket_start(timestamp, size):
+    length, suffix = _BUCKET_PREFIX[size]
+    return timestamp[:length] + suffix
+
+def age_band(age):
+    try:
+        age = int(age)
+    except (TypeError, ValueError):
+        return UNKNOWN_AGE_BAND
+    if age < AGE_BANDS[0][1]:
+        return UNKNOWN_AGE_BAND
+    label = AGE_BANDS[0][0]
+    for band, lowest in AGE_BANDS:
+        if age >= lowest:
+            label = band
+    return label
+
+def record_faces(cursor, rows):
+    """Fold face_data row tuples (timestamp, gender, age, vip_id, confidence) into the rollups"""
+    counts = Counter()
+    aged_counts = Counter()
+    age_sums = Counter()
+    for timestamp, gender, age, vip_id, *_ in rows:
+        band = age_band(age)
+        dims = (gender or '', band, NO_VIP if vip_id is None else vip_id)
+        for size in BUCKET_SIZES:
+            key = (size, bucket_start(timestamp, size)) + dims
+            counts[key] += 1
+            if band != UNKNOWN_AGE_BAND:
+                aged_counts[key] += 1
+                age_sums[key] += int(age)
+
+    # A batch usually collapses to a few keys, so this is a handful of upserts
+    cursor.executemany(
+        """INSERT INTO face_rollup
+               (bucket, bucket_start, gender, age_band, vip_id, count, aged_count, age_sum)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+           ON CONFLICT (bucket, bucket_start, gender, age_band, vip_id) DO UPDATE SET
+               count = count + excluded.count,
+               aged_count = aged_count + excluded.aged_count,
+               age_sum = age_sum + excluded.age_sum""",
+        [key + (count, aged_counts[key], age_sums[key]) for key, count in counts.items()]
+    )
+
+def record_disposal(cursor, vip_id, waste_type, box_number, timestamp):
+    dims = (box_number or '', waste_type or '', NO_VIP if vip_id is None else vip_id)
+    cursor.executemany(
+        """INSERT INTO disposal_rollup (bucket, bucket_start, box_number, waste_type, vip_id, count)
+           VALUES (?, ?, ?, ?, ?, 1)
+           ON CONFLICT (bucket, bucket_start, box_number, waste_type, vip_id) DO UPDATE SET
+               count = count + 1""",
+        [(size, bucket_start(timestamp, size)) + dims for size in BUCKET_SIZES]
+    )
+
+def query_rollup(conn, table, bucket, start=None, end=None, group_by=()):
+    """Bucketed counts from `table` between `start` (inclusive) and `end` (exclusive).
+
+    `group_by` picks which dimensions stay separate; the rest are summed.
+    Returns a list of dicts ordered by bucket_start.
+    """
+    dimensions = FACE_DIMENSIONS if table == 'face_rollup' else DISPOSAL_DIMENSIONS
+    if bucket not in BUCKET_SIZES:
+        raise ValueError(f"bucket must be one of {', '.join(BUCKET_SIZES)}")
+    unknown = [name for name in group_by if name not in dimensions]
+    if unknown:
+        raise ValueError(f"Cannot group by {', '.join(unknown)}; use {', '.join(dimensions)}")
+
+    columns = ['bucket_start'] + list(group_by)
+    aggregates = 'SUM(count)'
+    if table == 'face_rollup':
+        aggregates += ', SUM(aged_count), SUM(age_sum)'
+
+    where = ['bucket = ?']
+    params = [bucket]
+    if start:
+        where.append('bucket_start >= ?')
+        params.append(start)
+    if end:
+        where.append('bucket_start < ?')
+        params.append(end)
+
+    rows = conn.execute(
+        f"""SELECT {', '.join(columns)}, {aggregates}
+            FROM {table}
+            WHERE {' AND '.join(where)}
+            GROUP BY {', '.join(columns)}
+            ORDER BY {', '.join(columns)}""",
+        params
+    ).fetchall()
+
+    results = []
+    for row in rows:
+        entry = dict(zip(columns, row))
+        if entry.get('vip_id') == NO_VIP:
+            entry['vip_id'] = None
+        entry['count'] = row[len(columns)]
+        if table == 'face_rollup':
+            aged_count, age_sum = row[len(columns) + 1:]
+            entry['average_age'] = round(age_sum / aged_count, 1) if aged_count else None
+        results.append(entry)
+    return results
@@ -1,292 +1,116 @@
 # python-backend\app.py
 
-from flask import Flask, request, jsonify, make_response
+from flask import Flask, Response, request, jsonify, make_response, g
 from flask_cors import CORS, cross_origin
+try:
+    from flask_sock import Sock
+except ImportError:  # Streaming endpoint is optional; HTTP polling still works without it
+    Sock = None
 import os
-import sqlite3
-import cv2
-import numpy as np
 import base64
 import datetime
 import traceback
-import random
+import hmac
+import importlib
 import json
 from pathlib import Path
 import threading
 import time
+import logging
+import sys
+
+import analytics
+import db
+import events
+import export
+import migrations
+from config import DB_PATH, PHOTOS_DIR, VIP_MODELS_DIR
+from config import DEFAULT_KIOSK_ID
+from profiler import profiler
+from face_log import face_data_writer
+from flow_states import flow_state_store
+from vip_stats import vip_stats_aggregator
+from retention import retention_manager
+import photo_store
+from photo_store import photo_pipeline
+from config import ADMIN_TOKEN, RETENTION_ENABLED
+from metrics import metrics
 
 app = Flask(__name__)
+log = logging.getLogger(__name__)
 
 # Configure CORS properly
 CORS(app, 
      origins='*',
-     allow_headers=['Content-Type', 'Authorization'],
-     methods=['GET', 'POST', 'OPTIONS'],
+     allow_headers=['Content-Type', 'Authorization', 'X-Kiosk-Id',
+                    'X-Frame-Width', 'X-Frame-Height', 'X-Frame-Channels'],
+     methods=['GET', 'POST', 'DELETE', 'OPTIONS'],
      expose_headers=['Content-Range', 'X-Content-Range'])
 
+# WebSocket support for the streaming detection channel
+sock = Sock(app) if Sock is not None else None
+
+@app.before_request
+def before_request():
+    g.request_start = time.perf_counter()
+
 # Add after_request handler to ensure CORS headers
 @app.after_request
 def after_request(response):
+    # Request rate and latency per route (the rule, so ids in URLs don't add series)
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    metrics.inc('ewaste_http_requests_total', endpoint=endpoint, method=request.method,
+                status=str(response.status_code))
+    if 'request_start' in g:
+        metrics.observe('ewaste_http_request_seconds', time.perf_counter() - g.request_start,
+                        endpoint=endpoint)
+    
     response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,X-Kiosk-Id,X-Frame-Width,X-Frame-Height,X-Frame-Channels')
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
     return response
 
-# Database and storage paths
-BASE_DIR = os.path.dirname(__file__)
-DB_PATH = os.path.join(BASE_DIR, 'database.db')
-PHOTOS_DIR = os.path.join(BASE_DIR, 'photos')
-VIP_MODELS_DIR = os.path.join(BASE_DIR, 'vip_models')
-
 # Ensure required directories exist
 os.makedirs(PHOTOS_DIR, exist_ok=True)
 os.makedirs(VIP_MODELS_DIR, exist_ok=True)
 
-# Global variables
-face_cascade = None
-vip_recognizers = {}  # Will store VIP face recognizers when implemented
+# Set by warm_up_models(); detection is refused and /health reports 503 until then
+models_ready = threading.Event()
+
+# The detection routes (detection_api), imported by warm_up_models() so that
+# OpenCV, numpy and the models don't hold up the database routes
+detection_api = None
 
 def init_db():
-    """Initialize the SQLite database with all required tables"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    """Bring the SQLite database up to the current schema"""
+    # Versioned migrations; existing data is never dropped
+    migrations.migrate()
     
-    # Drop the existing table if it exists to recreate with correct schema
-    cursor.execute('DROP TABLE IF EXISTS face_data')
+    # Indexes on the history tables are built after startup
+    migrations.build_indexes_in_background()
     
-    # Face detection data table with correct columns
-    cursor.execute('''
-    CREATE TABLE face_data (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        timestamp TEXT,
-        gender TEXT,
-        age INTEGER,
-        vip_id INTEGER DEFAULT NULL,
-        detection_confidence REAL DEFAULT 0.0
-    )''')
+    # Active flow states are served from memory from here on
+    flow_state_store.load()
     
-    # VIP flow states table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS vip_flow_states (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        vip_id INTEGER,
-        flow_state TEXT,
-        selected_box TEXT,
-        selected_rating INTEGER,
-        timestamp TEXT,
-        is_active BOOLEAN DEFAULT 1
-    )''')
+    # Photo workers; also finishes photos a previous run left pending
+    photo_pipeline.start()
     
-    # Feedback/ratings table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS ratings (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        vip_id INTEGER,
-        rating INTEGER,
-        timestamp TEXT,
-        photo_taken BOOLEAN DEFAULT 0
-    )''')
-    
-    # Photos table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS photos (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        vip_id INTEGER,
-        photo_path TEXT,
-        timestamp TEXT,
-        rating_id INTEGER,
-        FOREIGN KEY (rating_id) REFERENCES ratings (id)
-    )''')
-    
-    # Waste disposal records
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS waste_disposal (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        vip_id INTEGER,
-        waste_type TEXT,
-        box_number TEXT,
-        timestamp TEXT
-    )''')
-    
-    # VIP profile table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS vip_profiles (
-        vip_id INTEGER PRIMARY KEY,
-        name TEXT,
-        gender TEXT,
-        age INTEGER,
-        registration_date TEXT,
-        total_disposals INTEGER DEFAULT 0,
-        average_rating REAL DEFAULT 0.0
-    )''')
-    
-    conn.commit()
-    conn.close()
+    # Periodic archival of old detections and photos
+    if RETENTION_ENABLED:
+        retention_manager.start()
     print("Database initialized successfully")
 
-def init_models():
-    """Initialize computer vision models"""
-    global face_cascade
+def warm_up_models():
+    """Import the detection routes, load and warm up the models, start the
+    detection workers, then mark ready"""
+    global detection_api
+    start = time.perf_counter()
+    detection_api = importlib.import_module('detection_api')
+    loaded = detection_api.warm_up()
     
-    try:
-        # Load face detection classifier
-        face_cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-        face_cascade = cv2.CascadeClassifier(face_cascade_path)
-        
-        if face_cascade.empty():
-            print(f"Error: Couldn't load face cascade from {face_cascade_path}")
-            return False
-            
-        print("Face detection model loaded successfully")
-        
-        # TODO: Load VIP recognition models if they exist
-        # load_vip_models()
-        
-        return True
-    except Exception as e:
-        print(f"Error loading models: {str(e)}")
-        traceback.print_exc()
-        return False
-
-def detect_face_age_gender(image_data):
-    """Detect face, estimate age and gender"""
-    global face_cascade
-    
-    try:
-        # Decode image
-        header, encoded = image_data.split(',', 1)
-        nparr = np.frombuffer(base64.b64decode(encoded), np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if img is None or img.size == 0:
-            return {"gender": "Unknown", "age": 0, "error": "Invalid image data"}
-            
-        # Get original dimensions for scaling
-        img_height, img_width = img.shape[:2]
-        print(f"Image dimensions: {img_width}x{img_height}")  # Debug line
-            
-        # Convert to grayscale for face detection
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        
-        # Detect faces with adjusted parameters
-        faces = face_cascade.detectMultiScale(
-            gray, 
-            scaleFactor=1.05,  # More sensitive detection
-            minNeighbors=3,    # Fewer required neighbors
-            minSize=(20, 20),  # Smaller minimum face size
-            flags=cv2.CASCADE_SCALE_IMAGE
-        )
-        
-        print(f"Detected {len(faces)} faces")  # Debug line
-        
-        results = []
-        
-        # Process detected faces
-        for (x, y, w, h) in faces:
-            print(f"Face at: ({x}, {y}) size: {w}x{h}")  # Debug line
-            
-            # Extract face region
-            face_roi = img[y:y+h, x:x+w]
-            
-            if face_roi.size == 0:
-                continue
-            
-            # Simple heuristic for gender (replace with actual model)
-            face_ratio = w / h
-            gender = "Male" if face_ratio > 0.9 else "Female"
-            
-            # Simple age estimation (replace with actual model)
-            # Using face size and position as rough indicators
-            face_area = w * h
-            age = 25 + int(face_area / 1000) + random.randint(-5, 5)
-            age = max(18, min(65, age))  # Clamp between 18-65
-            
-            # Calculate face coordinates as percentages
-            face_coords = {
-                "x": float(x) / img_width,
-                "y": float(y) / img_height,
-                "width": float(w) / img_width,
-                "height": float(h) / img_height
-            }
-            
-            # Check if face is in center detection area
-            face_center_x = x + w/2
-            face_center_y = y + h/2
-            img_center_x = img_width / 2
-            img_center_y = img_height / 2
-            
-            # Calculate if face is in detection circle (300px radius)
-            distance_from_center = np.sqrt(
-                (face_center_x - img_center_x)**2 + 
-                (face_center_y - img_center_y)**2
-            )
-            
-            detection_radius = 200  # Increased from 150 for more lenient detection
-            in_detection_area = distance_from_center < detection_radius
-            
-            print(f"Distance from center: {distance_from_center}, In area: {in_detection_area}")  # Debug line
-            
-            result = {
-                "gender": gender,
-                "age": int(age),  # Ensure it's an integer
-                "gender_confidence": round(random.uniform(75, 95), 2),
-                "age_confidence": round(random.uniform(70, 90), 2),
-                "face_confidence": round(85.0 + random.uniform(0, 10), 2),
-                "face_coords": face_coords,
-                "in_detection_area": bool(in_detection_area),  # Explicitly convert to bool
-                "distance_from_center": float(distance_from_center)  # For debugging
-            }
-            
-            # Add VIP detection placeholder
-            # TODO: Implement actual VIP recognition here
-            result["is_vip"] = False
-            result["vip_id"] = None
-            
-            # Mock VIP detection based on age and gender ranges
-            # This is temporary until you implement actual face recognition
-            if in_detection_area:
-                if age >= 20 and age <= 25 and gender == "Male":
-                    result["is_vip"] = True
-                    result["vip_id"] = 1
-                elif age >= 26 and age <= 30 and gender == "Female":
-                    result["is_vip"] = True
-                    result["vip_id"] = 2
-                elif age >= 31 and age <= 35 and gender == "Male":
-                    result["is_vip"] = True
-                    result["vip_id"] = 3
-                elif age >= 36 and age <= 40 and gender == "Female":
-                    result["is_vip"] = True
-                    result["vip_id"] = 4
-                elif age >= 41 and age <= 45 and gender == "Male":
-                    result["is_vip"] = True
-                    result["vip_id"] = 5
-                elif age >= 46 and age <= 50 and gender == "Female":
-                    result["is_vip"] = True
-                    result["vip_id"] = 6
-                elif age >= 51 and gender == "Male":
-                    result["is_vip"] = True
-                    result["vip_id"] = 7
-            
-            results.append(result)
-        
-        # Return the first face in detection area, or first face if none in area
-        if not results:
-            return {"gender": "Unknown", "age": 0, "error": "No face detected"}
-        
-        # First try to find a face in detection area
-        in_area_faces = [r for r in results if r.get("in_detection_area", False)]
-        if in_area_faces:
-            print(f"Returning face in detection area: {in_area_faces[0]}")  # Debug line
-            return in_area_faces[0]
-        
-        # If no face in area, return the first face found
-        print(f"No face in area, returning first face: {results[0]}")  # Debug line
-        return results[0]
-    
-    except Exception as e:
-        print(f"Error in face detection: {str(e)}")
-        traceback.print_exc()
-        return {"gender": "Unknown", "age": 0, "error": str(e)}
+    models_ready.set()
+    print(f"Detection ready in {time.perf_counter() - start:.2f}s")
+    return loaded
 
 @app.route('/test', methods=['GET'])
 @cross_origin()
@@ -298,35 +122,53 @@ def test():
         'database': 'Connected' if os.path.exists(DB_PATH) else 'Not found'
     })
 
-@app.route('/detect-face', methods=['POST', 'OPTIONS'])
-@cross_origin()
-def detect_face():
-    """Face detection endpoint"""
-    if request.method == 'OPTIONS':
-        return make_response('', 204)
-        
-    data = request.json
-    image_data = data.get('image', '')
-    
-    if not image_data:
-        return jsonify({'error': 'No image provided'}), 400
-        
-    try:
-        result = detect_face_age_gender(image_data)
-        
-        # Debug print
-        print(f"Detection result: {result}")
-        
-        # Save detection data if valid
-        if not result.get('error'):
-            save_face_data(result)
-        
-        return jsonify(result)
-    except Exception as e:
-        print(f"Error in face detection endpoint: {str(e)}")
-        traceback.print_exc()
-        return jsonify({'error': str(e)}), 500
+def get_kiosk_id():
+    """Kiosk/camera a request belongs to (X-Kiosk-Id header or kiosk_id param)"""
+    return request.headers.get('X-Kiosk-Id') or request.args.get('kiosk_id') or DEFAULT_KIOSK_ID
 
+def warming_up_response():
+    response = jsonify({'gender': 'Unknown', 'age': 0, 'error': 'Models are still loading'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+# (rule, detection_api view, methods)
+DETECTION_ROUTES = (
+    ('/detect-face', 'detect_face', ['POST', 'OPTIONS']),
+    ('/vip/enroll', 'enroll_vip', ['POST']),
+    ('/vip/<int:vip_id>/update', 'update_vip', ['POST']),
+    ('/vip/<int:vip_id>', 'remove_vip', ['DELETE']),
+    ('/vip/index', 'vip_index_stats', ['GET']),
+    ('/vip/compact', 'compact_vip_index', ['POST']),
+    ('/pacing', 'get_pacing', ['GET']),
+)
+
+def detection_view(name):
+    """View that hands the request to detection_api once the models are warm"""
+    def view(**kwargs):
+        if request.method == 'OPTIONS':
+            return make_response('', 204)
+        if not models_ready.is_set():
+            return warming_up_response()
+        return getattr(detection_api, name)(**kwargs)
+    view.__name__ = name
+    return view
+
+for rule, name, methods in DETECTION_ROUTES:
+    app.add_url_rule(rule, view_func=cross_origin()(detection_view(name)), methods=methods)
+
+if sock is not None:
+    @sock.route('/detect-stream')
+    def detect_stream(ws):
+        """Persistent detection channel (detection_api.detect_stream).
+
+        While the models load, the client gets one 'still loading' message and
+        the socket is closed; the renderer reconnects a second later.
+        """
+        if not models_ready.is_set():
+            ws.send(json.dumps({'gender': 'Unknown', 'age': 0, 'error': 'Models are still loading'}))
+            return
+        detection_api.detect_stream(ws)
 
 @app.route('/save-face-data', methods=['POST'])
 @cross_origin()
@@ -343,29 +185,23 @@ def save_face_data_endpoint():
         'age': age,
         'vip_id': vip_id,
         'face_confidence': confidence
-    })
+    }, data.get('kiosk_id') or get_kiosk_id())
     
     return jsonify({'status': 'success', 'message': 'Face data saved'})
 
-def save_face_data(data):
-    """Helper function to save face data to database"""
+def save_face_data(data, kiosk_id=DEFAULT_KIOSK_ID):
+    """Queue face data for the background database writer"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
         timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
-        cursor.execute(
-            """INSERT INTO face_data (timestamp, gender, age, vip_id, detection_confidence) 
-               VALUES (?, ?, ?, ?, ?)""", 
+        face_data_writer.enqueue(
             (timestamp, 
              data.get('gender', 'Unknown'), 
              data.get('age', 0),
              data.get('vip_id'),
-             data.get('face_confidence', 0.0))
+             data.get('face_confidence', 0.0),
+             kiosk_id)
         )
-        
-        conn.commit()
-        conn.close()
     except Exception as e:
         print(f"Error saving face data: {str(e)}")
 
@@ -380,26 +216,9 @@ def save_vip_state():
         selected_box = data.get('selected_box', '')
         selected_rating = data.get('selected_rating', 0)
         
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        kiosk_id = data.get('kiosk_id') or get_kiosk_id()
         
-        # Deactivate previous states for this VIP
-        cursor.execute(
-            "UPDATE vip_flow_states SET is_active = 0 WHERE vip_id = ?",
-            (vip_id,)
-        )
-        
-        # Insert new state
-        cursor.execute(
-            """INSERT INTO vip_flow_states 
-               (vip_id, flow_state, selected_box, selected_rating, timestamp, is_active)
-               VALUES (?, ?, ?, ?, ?, 1)""",
-            (vip_id, flow_state, selected_box, selected_rating, timestamp)
-        )
-        
-        conn.commit()
-        conn.close()
+        flow_state_store.save(vip_id, flow_state, selected_box, selected_rating, kiosk_id)
         
         return jsonify({'status': 'success'})
     except Exception as e:
@@ -413,28 +232,10 @@ def get_vip_state():
     try:
         vip_id = request.args.get('vip_id')
         
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            """SELECT flow_state, selected_box, selected_rating, timestamp
-               FROM vip_flow_states
-               WHERE vip_id = ? AND is_active = 1
-               ORDER BY timestamp DESC
-               LIMIT 1""",
-            (vip_id,)
-        )
-        
-        result = cursor.fetchone()
-        conn.close()
+        result = flow_state_store.get(vip_id)
         
         if result:
-            return jsonify({
-                'flow_state': result[0],
-                'selected_box': result[1],
-                'selected_rating': result[2],
-                'timestamp': result[3]
-            })
+            return jsonify(result)
         else:
             return jsonify({'message': 'No active state found'})
             
@@ -450,20 +251,10 @@ def save_rating():
         data = request.json
         vip_id = data.get('vip_id')
         rating = data.get('rating')
-        
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
         timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
-        cursor.execute(
-            """INSERT INTO ratings (vip_id, rating, timestamp, photo_taken)
-               VALUES (?, ?, ?, 0)""",
-            (vip_id, rating, timestamp)
-        )
-        
-        rating_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        with db.transaction() as cursor:
+            rating_id = events.record_rating(cursor, vip_id, rating, timestamp)
         
         return jsonify({
             'status': 'success',
@@ -476,50 +267,74 @@ def save_rating():
 @app.route('/save-photo', methods=['POST'])
 @cross_origin()
 def save_photo():
-    """Save VIP photo"""
+    """Save VIP photo; the file is written in the background"""
     try:
         data = request.json
         photo_data = data.get('photo')
-        vip_id = data.get('vip_id')
-        rating_id = data.get('rating_id')
-        
-        # Generate unique filename
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"vip_{vip_id}_{timestamp}.jpg"
-        filepath = os.path.join(PHOTOS_DIR, filename)
+        # The renderer has sent camelCase keys
+        vip_id = data.get('vip_id', data.get('vipId'))
+        rating_id = data.get('rating_id', data.get('ratingId'))
         
-        # Save photo file
-        header, encoded = photo_data.split(',', 1)
-        with open(filepath, 'wb') as f:
-            f.write(base64.b64decode(encoded))
+        if not photo_data:
+            return jsonify({'error': 'No photo provided'}), 400
         
-        # Save photo record
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
+        # Decode and hash here (cheap); the disk work goes to the photo workers
+        header, encoded = photo_data.split(',', 1) if ',' in photo_data else ('', photo_data)
+        raw = base64.b64decode(encoded)
+        digest = photo_store.content_digest(raw)
+        filepath = photo_store.content_path(digest)
         
-        cursor.execute(
-            """INSERT INTO photos (vip_id, photo_path, timestamp, rating_id)
-               VALUES (?, ?, ?, ?)""",
-            (vip_id, filepath, timestamp, rating_id)
-        )
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
-        # Update rating record
-        cursor.execute(
-            "UPDATE ratings SET photo_taken = 1 WHERE id = ?",
-            (rating_id,)
-        )
+        # Save photo record
+        with db.transaction() as cursor:
+            cursor.execute(
+                """INSERT INTO photos (vip_id, photo_path, timestamp, rating_id, content_hash, status)
+                   VALUES (?, ?, ?, ?, ?, 'pending')""",
+                (vip_id, filepath, timestamp, rating_id, digest)
+            )
+            photo_id = cursor.lastrowid
+            
+            # Update rating record
+            if rating_id is not None:
+                cursor.execute(
+                    "UPDATE ratings SET photo_taken = 1 WHERE id = ?",
+                    (rating_id,)
+                )
+                vip_stats_aggregator.record_photo(cursor, vip_id, rating_id)
         
-        conn.commit()
-        conn.close()
+        photo_pipeline.submit(photo_id, raw, filepath)
         
         return jsonify({
             'status': 'success',
-            'photo_path': filepath
+            'photo_id': photo_id,
+            'photo_path': filepath,
+            'photo_status': 'pending'
         })
     except Exception as e:
         print(f"Error saving photo: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/photo/<int:photo_id>', methods=['GET'])
+@cross_origin()
+def get_photo(photo_id):
+    """Storage status and file paths of one photo"""
+    try:
+        row = db.query_one(
+            """SELECT id, vip_id, rating_id, timestamp, status, photo_path, thumbnail_path, preview_path
+               FROM photos WHERE id = ?""",
+            (photo_id,)
+        )
+        if row is None:
+            return jsonify({'error': 'Photo not found'}), 404
+        
+        keys = ('photo_id', 'vip_id', 'rating_id', 'timestamp', 'status',
+                'photo_path', 'thumbnail_path', 'preview_path')
+        return jsonify(dict(zip(keys, row)))
+    except Exception as e:
+        print(f"Error getting photo: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/save-waste-disposal', methods=['POST'])
 @cross_origin()
 def save_waste_disposal():
@@ -529,33 +344,45 @@ def save_waste_disposal():
         vip_id = data.get('vip_id')
         waste_type = data.get('waste_type')
         box_number = data.get('box_number')
+        kiosk_id = data.get('kiosk_id') or get_kiosk_id()
         
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        cursor.execute(
-            """INSERT INTO waste_disposal (vip_id, waste_type, box_number, timestamp)
-               VALUES (?, ?, ?, ?)""",
-            (vip_id, waste_type, box_number, timestamp)
-        )
-        
-        # Update VIP profile disposal count
-        cursor.execute(
-            """UPDATE vip_profiles 
-               SET total_disposals = total_disposals + 1
-               WHERE vip_id = ?""",
-            (vip_id,)
-        )
-        
-        conn.commit()
-        conn.close()
+        with db.transaction() as cursor:
+            events.apply_disposal(cursor, {
+                'vip_id': vip_id, 'waste_type': waste_type, 'box_number': box_number
+            }, kiosk_id)
         
         return jsonify({'status': 'success'})
     except Exception as e:
         print(f"Error saving waste disposal: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/events', methods=['POST'])
+@cross_origin()
+def post_events():
+    """Apply an ordered batch of kiosk events in one transaction.
+
+    Body: {"kiosk_id": ..., "events": [{"key": ..., "type": "state" | "rating"
+    | "disposal" | "photo", ...}]}. Keys that were already applied are
+    answered with their stored result instead of being applied again.
+    """
+    try:
+        data = request.json or {}
+        kiosk_id = data.get('kiosk_id') or get_kiosk_id()
+        
+        with db.transaction() as cursor:
+            results = events.apply_batch(cursor, data.get('events'), kiosk_id)
+        
+        return jsonify({
+            'status': 'success',
+            'results': results
+        })
+    except events.EventError as e:
+        # Nothing was written; resending the same batch will fail again
+        return jsonify({'error': str(e), 'index': e.index}), 400
+    except Exception as e:
+        print(f"Error applying events: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/get-vip-stats', methods=['GET'])
 @cross_origin()
 def get_vip_stats():
@@ -563,44 +390,19 @@ def get_vip_stats():
     try:
         vip_id = request.args.get('vip_id')
         
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # Get VIP profile
-        cursor.execute(
+        profile = db.query_one(
             "SELECT * FROM vip_profiles WHERE vip_id = ?",
             (vip_id,)
         )
-        profile = cursor.fetchone()
         
-        # Get disposal history
-        cursor.execute(
-            """SELECT waste_type, box_number, timestamp 
-               FROM waste_disposal 
-               WHERE vip_id = ? 
-               ORDER BY timestamp DESC 
-               LIMIT 10""",
-            (vip_id,)
-        )
-        disposals = cursor.fetchall()
-        
-        # Get rating history
-        cursor.execute(
-            """SELECT rating, timestamp, photo_taken 
-               FROM ratings 
-               WHERE vip_id = ? 
-               ORDER BY timestamp DESC 
-               LIMIT 10""",
-            (vip_id,)
-        )
-        ratings = cursor.fetchall()
-        
-        conn.close()
+        # History and totals are maintained on write; no scans or sorts here
+        disposals, ratings, totals = vip_stats_aggregator.stats(vip_id)
         
         return jsonify({
             'profile': profile,
             'recent_disposals': disposals,
-            'rating_history': ratings
+            'rating_history': ratings,
+            'totals': totals
         })
     except Exception as e:
         print(f"Error getting VIP stats: {str(e)}")
@@ -609,27 +411,43 @@ def get_vip_stats():
 @app.route('/fetch-latest', methods=['GET'])
 @cross_origin()
 def fetch_latest():
-    """Fetch latest face detection data"""
+    """Fetch latest face detection data.
+
+    Pass `kiosk_id` (or X-Kiosk-Id) for one kiosk's latest row; without it
+    the newest row of any kiosk is returned.
+    """
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            """SELECT timestamp, gender, age, vip_id 
-               FROM face_data 
-               ORDER BY id DESC 
-               LIMIT 1"""
-        )
-        result = cursor.fetchone()
-        
-        conn.close()
-        
-        if result:
+        kiosk_id = request.headers.get('X-Kiosk-Id') or request.args.get('kiosk_id')
+        
+        # Rows logged since startup are answered from memory
+        latest = face_data_writer.latest(kiosk_id)
+        if latest is None:
+            if kiosk_id is None:
+                result = db.query_one(
+                    """SELECT timestamp, gender, age, vip_id, kiosk_id 
+                       FROM face_data 
+                       ORDER BY id DESC 
+                       LIMIT 1"""
+                )
+            else:
+                result = db.query_one(
+                    """SELECT timestamp, gender, age, vip_id, kiosk_id 
+                       FROM face_data 
+                       WHERE kiosk_id = ? 
+                       ORDER BY id DESC 
+                       LIMIT 1""",
+                    (kiosk_id,)
+                )
+            if result:
+                latest = dict(zip(('timestamp', 'gender', 'age', 'vip_id', 'kiosk_id'), result))
+        
+        if latest:
             return jsonify({
-                'timestamp': result[0],
-                'gender': result[1],
-                'age': result[2],
-                'vip_id': result[3]
+                'timestamp': latest['timestamp'],
+                'gender': latest['gender'],
+                'age': latest['age'],
+                'vip_id': latest['vip_id'],
+                'kiosk_id': latest['kiosk_id']
             })
         else:
             return jsonify({'message': 'No data found'})
@@ -637,32 +455,201 @@ def fetch_latest():
         print(f"Error fetching latest: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def rollup_response(table):
+    """Shared handler for the /analytics endpoints"""
+    bucket = request.args.get('bucket', 'hour')
+    start = request.args.get('start')
+    end = request.args.get('end')
+    group_by = [name for name in request.args.get('group_by', '').split(',') if name]
+    
+    try:
+        with db.connection() as conn:
+            buckets = analytics.query_rollup(conn, table, bucket, start, end, group_by)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'bucket': bucket,
+        'start': start,
+        'end': end,
+        'group_by': group_by,
+        'buckets': buckets
+    })
+
+@app.route('/analytics/faces', methods=['GET'])
+@cross_origin()
+def analytics_faces():
+    """Detections per time bucket, optionally split by gender, age_band and/or vip_id"""
+    try:
+        return rollup_response('face_rollup')
+    except Exception as e:
+        print(f"Error querying face analytics: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/analytics/disposals', methods=['GET'])
+@cross_origin()
+def analytics_disposals():
+    """Disposals per time bucket, optionally split by box_number, waste_type and/or vip_id"""
+    try:
+        return rollup_response('disposal_rollup')
+    except Exception as e:
+        print(f"Error querying disposal analytics: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/export/<table>', methods=['GET'])
+@cross_origin()
+def export_table(table):
+    """Stream a history table as NDJSON (default) or CSV.
+
+    Query parameters: format, start, end (timestamps, end exclusive),
+    after_id (resume after this id) and limit.
+    """
+    try:
+        query = export.ExportQuery(
+            table,
+            start=request.args.get('start'),
+            end=request.args.get('end'),
+            after_id=request.args.get('after_id'),
+            limit=request.args.get('limit')
+        )
+        fmt = request.args.get('format', 'ndjson')
+        stream, mimetype = export.export_stream(query, fmt)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Sent as it is read; the body is never held in memory
+    response = Response(stream, mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={table}.{fmt}'
+    return response
+
+
+def admin_authorized():
+    """True if the request carries `Authorization: Bearer <ADMIN_TOKEN>`"""
+    if not ADMIN_TOKEN:
+        return False
+    header = request.headers.get('Authorization', '')
+    token = header[len('Bearer '):] if header.startswith('Bearer ') else ''
+    return hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+def admin_denied_response():
+    if not ADMIN_TOKEN:
+        return jsonify({'error': 'Admin endpoints are disabled; set EWASTE_ADMIN_TOKEN'}), 403
+    return jsonify({'error': 'Unauthorized'}), 401
+
+@app.route('/retention', methods=['GET'])
+@cross_origin()
+def retention_status():
+    """Retention policy and the summary of the last pass"""
+    if not admin_authorized():
+        return admin_denied_response()
+    return jsonify(retention_manager.stats())
+
+@app.route('/retention/run', methods=['POST'])
+@cross_origin()
+def run_retention():
+    """Start a retention pass now, in the background"""
+    # Deletes raw detections and rewrites photos, so it's an admin action
+    if not admin_authorized():
+        return admin_denied_response()
+    try:
+        if retention_manager.running:
+            return jsonify({'status': 'already_running'}), 409
+        retention_manager.trigger()
+        return jsonify({'status': 'started'}), 202
+    except Exception as e:
+        print(f"Error starting retention: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/profile/start', methods=['POST'])
+@cross_origin()
+def start_profile():
+    """Profile the next `requests` detection requests and/or `seconds` seconds"""
+    if not admin_authorized():
+        return admin_denied_response()
+    try:
+        data = request.get_json(silent=True) or {}
+        status = profiler.start(
+            requests=int(data['requests']) if data.get('requests') is not None else None,
+            seconds=float(data['seconds']) if data.get('seconds') is not None else None,
+            interval_ms=float(data['interval_ms']) if data.get('interval_ms') is not None else None
+        )
+        return jsonify(status)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({'error': str(e), 'session': profiler.status()}), 409
+
+@app.route('/profile/stop', methods=['POST'])
+@cross_origin()
+def stop_profile():
+    if not admin_authorized():
+        return admin_denied_response()
+    return jsonify(profiler.stop() or {'running': False})
+
+@app.route('/profile', methods=['GET'])
+@cross_origin()
+def profile_status():
+    if not admin_authorized():
+        return admin_denied_response()
+    return jsonify(profiler.status())
+
+@app.route('/profile/<view>', methods=['GET'])
+@cross_origin()
+def profile_stacks(view):
+    """Collapsed stacks of the current or last session: `python` (samples)
+    or `opencv` (microseconds inside cv2 calls)"""
+    if not admin_authorized():
+        return admin_denied_response()
+    try:
+        text = profiler.collapsed(view)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    response = make_response(text)
+    response.headers['Content-Type'] = 'text/plain; charset=utf-8'
+    response.headers['Content-Disposition'] = f'attachment; filename=profile-{view}.collapsed'
+    return response
+
+
 @app.route('/health', methods=['GET'])
 @cross_origin()
 def health_check():
-    """Health check endpoint"""
-    return jsonify({
-        'status': 'healthy',
+    """Health check endpoint; 503 until the models are loaded and warmed up"""
+    ready = models_ready.is_set()
+    health = {
+        'status': 'healthy' if ready else 'starting',
+        'ready': ready,
         'services': {
             'database': 'running' if os.path.exists(DB_PATH) else 'error',
-            'face_detection': 'running' if face_cascade is not None else 'error',
+            'face_detection': 'running' if ready else 'starting',
             'storage': 'running' if os.path.exists(PHOTOS_DIR) else 'error'
-        }
-    })
+        },
+        'face_log': face_data_writer.stats(),
+        'photos': photo_pipeline.stats(),
+        'schema': migrations.status(),
+        'metrics': metrics.summary()
+    }
+    if ready:
+        # Models, workers, scheduler and pacing
+        detection = detection_api.health()
+        health['services'].update(detection.pop('services'))
+        health.update(detection)
+    return jsonify(health), 200 if ready else 503
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus scrape endpoint"""
+    response = make_response(metrics.render())
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    return response
 
-# Initialize everything when the app starts
+# Queue depths, read at scrape time (detection_api adds the detection queue)
+metrics.gauge('ewaste_queue_depth', lambda: face_data_writer.stats()['pending'], queue='face_log')
+metrics.gauge('ewaste_queue_depth', lambda: photo_pipeline.stats()['pending'], queue='photos')
+
+# `python app.py` runs the production server with this module; `python serve.py`
+# starts listening before the app (and OpenCV/numpy) is even imported
 if __name__ == '__main__':
-    # Create database and tables
-    init_db()
-    
-    # Load computer vision models
-    if init_models():
-        print("All models initialized successfully!")
-        print(f"Starting server on http://127.0.0.1:5000")
-        print("Database path:", DB_PATH)
-        print("Photos directory:", PHOTOS_DIR)
-        app.run(host='127.0.0.1', port=5000, debug=True, threaded=True)
-    else:
-        print("Failed to initialize models. Some features may not work correctly.")
-        print("Starting server anyway...")
-        app.run(host='127.0.0.1', port=5000, debug=True, threaded=True)
\ No newline at end of file
+    # detection_api imports helpers from `app`; make that this module, not a second copy
+    sys.modules.setdefault('app', sys.modules[__name__])
+    import serve
+    serve.main(app_module=sys.modules[__name__])
@@ -0,0 +1,327 @@
+# python-backend\benchmark.py
+"""Offline benchmarks for the detection and persistence paths.
+
+    python benchmark.py --frames recorded_frames/ --output before.json
+    python benchmark.py --synthetic 200 --suites detect,writes
+
+Detection suites replay a directory of JPEG frames (or generated ones with
+--synthetic) through the same code the server runs: `inprocess` calls the
+detection pipeline directly (decode, motion gate, detection, classification),
+`flask` posts the JPEG bytes to /detect-face through the Flask test client.
+Write suites drive save_face_data (write-behind queue, timed until flushed),
+/save-rating and /save-waste-disposal.
+
+Everything runs against a throwaway database and photo directory unless
+--db is given, needs no camera or network, and prints one JSON document with
+p50/p95/p99 latencies, frames/sec and rows/sec so runs from different
+commits can be compared. Settings that affect the numbers (detector, motion
+gate, tracking, ...) can be changed through the usual EWASTE_* variables,
+e.g. the opt-in motion gate with EWASTE_MOTION_GATE=1.
+"""
+
+import argparse
+import contextlib
+import datetime
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+SUITES = ('inprocess', 'flask', 'face_data', 'ratings', 'disposals')
+SUITE_GROUPS = {
+    'detect': ('inprocess', 'flask'),
+    'writes': ('face_data', 'ratings', 'disposals'),
+    'all': SUITES,
+}
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', help='directory of recorded .jpg frames to replay')
+    parser.add_argument('--synthetic', type=int, default=0,
+                        help='generate this many frames instead of (or when --frames has none)')
+    parser.add_argument('--suites', default='all',
+                        help=f"comma-separated: {', '.join(SUITES)}, detect, writes or all")
+    parser.add_argument('--repeat', type=int, default=1, help='replay the frames this many times')
+    parser.add_argument('--warmup', type=int, default=5, help='untimed frames before each detection suite')
+    parser.add_argument('--rows', type=int, default=2000, help='rows per write suite')
+    parser.add_argument('--kiosk', default='benchmark', help='kiosk id the frames are sent as')
+    parser.add_argument('--db', help='database to write to (default: a temporary one)')
+    parser.add_argument('--output', help='write the JSON report here as well as to stdout')
+    return parser.parse_args(argv)
+
+def select_suites(spec):
+    selected = []
+    for name in spec.split(','):
+        name = name.strip()
+        for suite in SUITE_GROUPS.get(name, (name,)):
+            if suite not in SUITES:
+                raise SystemExit(f"Unknown suite: {suite}")
+            if suite not in selected:
+                selected.append(suite)
+    return selected
+
+def configure_environment(args):
+    """Point the server at scratch storage; must run before config is imported"""
+    scratch = tempfile.mkdtemp(prefix='ewaste-bench-')
+    os.environ['EWASTE_DB_PATH'] = args.db or os.path.join(scratch, 'benchmark.db')
+    os.environ.setdefault('EWASTE_PHOTOS_DIR', os.path.join(scratch, 'photos'))
+    os.environ.setdefault('EWASTE_ARCHIVE_DIR', os.path.join(scratch, 'archive'))
+    # Enrollments made by the run stay out of the real VIP index
+    os.environ.setdefault('EWASTE_VIP_MODELS_DIR', os.path.join(scratch, 'vip_models'))
+    # Background retention would compete with the measured work
+    os.environ.setdefault('EWASTE_RETENTION', '0')
+    # Shedding would refuse the very load being measured
+    os.environ.setdefault('EWASTE_PACING', '0')
+    return scratch
+
+def percentiles(samples):
+    """Latency summary in milliseconds"""
+    import numpy as np
+
+    if not samples:
+        return {'count': 0}
+    values = np.asarray(samples) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        'count': len(samples),
+        'mean_ms': round(float(values.mean()), 3),
+        'p50_ms': round(float(p50), 3),
+        'p95_ms': round(float(p95), 3),
+        'p99_ms': round(float(p99), 3),
+        'max_ms': round(float(values.max()), 3),
+    }
+
+def load_frames(args):
+    """Encoded JPEG frames as bytes, in replay order"""
+    frames = []
+    if args.frames:
+        paths = sorted(glob.glob(os.path.join(args.frames, '*.jpg')) + glob.glob(os.path.join(args.frames, '*.jpeg')))
+        for path in paths:
+            with open(path, 'rb') as f:
+                frames.append(f.read())
+    if not frames and args.synthetic:
+        frames = synthetic_frames(args.synthetic)
+    if not frames:
+        raise SystemExit("No frames: pass --frames with .jpg files or --synthetic N")
+    return frames
+
+def synthetic_frames(count, width=640, height=480):
+    """Camera-like JPEGs: a static noisy background, with a bright oval
+    drifting through for the middle third (so gated and detected frames mix)"""
+    import cv2
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    background = cv2.GaussianBlur(rng.integers(60, 190, (height, width, 3), dtype=np.uint8), (0, 0), 9)
+    frames = []
+    for i in range(count):
+        frame = background.copy()
+        noise = rng.integers(-3, 4, frame.shape, dtype=np.int16)
+        frame = np.clip(frame.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+        if count // 3 <= i < 2 * count // 3:
+            x = int(width * 0.3 + (i - count // 3) * 4) % width
+            cv2.ellipse(frame, (x, height // 2), (70, 95), 0, 0, 360, (170, 190, 225), -1)
+        ok, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
+        frames.append(encoded.tobytes())
+    return frames
+
+def frame_outcomes(results):
+    outcomes = {'faces': 0, 'no_face': 0, 'gated': 0, 'tracked': 0, 'errors': 0}
+    for result in results:
+        if result.get('gated'):
+            outcomes['gated'] += 1
+        if result.get('tracked'):
+            outcomes['tracked'] += 1
+        error = result.get('error')
+        if not error:
+            outcomes['faces'] += 1
+        elif error == 'No face detected':
+            outcomes['no_face'] += 1
+        else:
+            outcomes['errors'] += 1
+    return outcomes
+
+def run_frames(frames, args, detect):
+    """Time detect(frame) over the replay; returns the suite report"""
+    for frame in frames[:args.warmup]:
+        detect(frame)
+
+    latencies = []
+    results = []
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        for frame in frames:
+            start = time.perf_counter()
+            results.append(detect(frame))
+            latencies.append(time.perf_counter() - start)
+    elapsed = time.perf_counter() - started
+    return {
+        'frames': len(latencies),
+        'seconds': round(elapsed, 3),
+        'frames_per_second': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'latency': percentiles(latencies),
+        'outcomes': frame_outcomes(results),
+    }
+
+def bench_inprocess(frames, args):
+    import numpy as np
+    from detect_pool import detect_frame
+    from motion_gate import motion_gate
+
+    motion_gate.reset()
+    return run_frames(frames, args, lambda frame: detect_frame(args.kiosk, encoded=np.frombuffer(frame, np.uint8)))
+
+def bench_flask(frames, args, client):
+    from motion_gate import motion_gate
+
+    motion_gate.reset()
+    headers = {'Content-Type': 'image/jpeg', 'X-Kiosk-Id': args.kiosk}
+
+    def detect(frame):
+        return client.post('/detect-face', data=frame, headers=headers).get_json()
+    return run_frames(frames, args, detect)
+
+def run_writes(rows, write, finish=None):
+    latencies = []
+    started = time.perf_counter()
+    for i in range(rows):
+        start = time.perf_counter()
+        write(i)
+        latencies.append(time.perf_counter() - start)
+    if finish is not None:
+        finish()
+    elapsed = time.perf_counter() - started
+    return {
+        'rows': rows,
+        'seconds': round(elapsed, 3),
+        'rows_per_second': round(rows / elapsed, 2) if elapsed else None,
+        'latency': percentiles(latencies),
+    }
+
+def bench_face_data(args):
+    import app
+    from face_log import face_data_writer
+
+    genders = ('Male', 'Female')
+
+    def write(i):
+        app.save_face_data({
+            'gender': genders[i % 2], 'age': 18 + i % 50,
+            'vip_id': i % 7 or None, 'face_confidence': 90.0,
+        }, args.kiosk)
+
+    # Rows/sec counts until the writer has committed everything
+    report = run_writes(args.rows, write, lambda: face_data_writer.flush(timeout=60))
+    report['writer'] = face_data_writer.stats()
+    return report
+
+def bench_route(client, path, payload, rows):
+    def write(i):
+        response = client.post(path, json=payload(i))
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} returned {response.status_code}: {response.get_data(as_text=True)}")
+    return run_writes(rows, write)
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def environment_report():
+    import cv2
+    import config
+
+    return {
+        'python': platform.python_version(),
+        'opencv': cv2.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'face_detector': config.FACE_DETECTOR,
+        'detection_mode': config.DETECTION_MODE,
+        'tracking': config.TRACKING_ENABLED,
+        'motion_gate': config.MOTION_GATE_ENABLED,
+        'detect_workers': config.DETECT_WORKERS,
+        'db_synchronous': config.DB_SYNCHRONOUS,
+    }
+
+@contextlib.contextmanager
+def stdout_to_stderr():
+    """Send the server's prints (and its worker processes') to stderr, so
+    stdout carries only the report"""
+    sys.stdout.flush()
+    saved = os.dup(1)
+    os.dup2(2, 1)
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            yield
+    finally:
+        sys.stdout.flush()
+        os.dup2(saved, 1)
+        os.close(saved)
+
+def main(argv=None):
+    args = parse_args(argv)
+    suites = select_suites(args.suites)
+    configure_environment(args)
+
+    with stdout_to_stderr():
+        report = run(args, suites)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    print(text)
+    return report
+
+def run(args, suites):
+    import app
+    import vision
+
+    app.init_db()
+    # Loads and warms the models, and starts worker processes when
+    # EWASTE_DETECT_WORKERS is set, as in the server
+    if not app.warm_up_models():
+        raise SystemExit("Models failed to load")
+    client = app.app.test_client()
+
+    report = {
+        'revision': git_revision(),
+        'started': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'environment': environment_report(),
+        'face_detector': vision.face_detector.name,
+        'suites': {},
+    }
+
+    frames = None
+    for suite in suites:
+        print(f"Running {suite}...")
+        if suite in ('inprocess', 'flask'):
+            if frames is None:
+                frames = load_frames(args)
+                report['frame_count'] = len(frames)
+            result = bench_inprocess(frames, args) if suite == 'inprocess' else bench_flask(frames, args, client)
+        elif suite == 'face_data':
+            result = bench_face_data(args)
+        elif suite == 'ratings':
+            result = bench_route(client, '/save-rating',
+                                 lambda i: {'vip_id': i % 50 + 1, 'rating': i % 5 + 1}, args.rows)
+        else:
+            result = bench_route(client, '/save-waste-disposal',
+                                 lambda i: {'vip_id': i % 50 + 1, 'waste_type': ('battery', 'phone', 'cable')[i % 3],
+                                            'box_number': str(i % 4 + 1), 'kiosk_id': args.kiosk}, args.rows)
+        report['suites'][suite] = result
+
+    app.detection_api.detection_pool.stop()
+    return report
+
+if __name__ == '__main__':
+    main()
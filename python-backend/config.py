@@ -0,0 +1,232 @@
+# python-backend\config.py
+"""Deployment settings.
+
+Everything here can be overridden per kiosk with an environment variable so
+the same code runs on different hardware without edits.
+"""
+
+import os
+
+def _env_str(name, default):
+    return os.environ.get(name, default)
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, '') else default
+
+def _env_float(name, default):
+    value = os.environ.get(name)
+    return float(value) if value not in (None, '') else default
+
+def _env_bool(name, default):
+    value = os.environ.get(name)
+    if value in (None, ''):
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+# Database and storage paths
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = _env_str('EWASTE_DB_PATH', os.path.join(BASE_DIR, 'database.db'))
+PHOTOS_DIR = _env_str('EWASTE_PHOTOS_DIR', os.path.join(BASE_DIR, 'photos'))
+VIP_MODELS_DIR = _env_str('EWASTE_VIP_MODELS_DIR', os.path.join(BASE_DIR, 'vip_models'))
+MODELS_DIR = _env_str('EWASTE_MODELS_DIR', os.path.join(BASE_DIR, 'models'))
+
+# SQLite tuning. synchronous=NORMAL is durable across application crashes in
+# WAL mode; only an OS crash or power loss can drop the last commits.
+DB_POOL_SIZE = _env_int('EWASTE_DB_POOL_SIZE', 8)
+DB_BUSY_TIMEOUT_MS = _env_int('EWASTE_DB_BUSY_TIMEOUT_MS', 5000)
+DB_SYNCHRONOUS = _env_str('EWASTE_DB_SYNCHRONOUS', 'NORMAL')
+DB_CACHE_SIZE_KB = _env_int('EWASTE_DB_CACHE_SIZE_KB', 16384)
+DB_STATEMENT_CACHE = _env_int('EWASTE_DB_STATEMENT_CACHE', 128)
+
+# Exports read EXPORT_CHUNK_ROWS rows per query on their own read-only
+# connection; each chunk is a short read, so the WAL can still be checkpointed
+EXPORT_CHUNK_ROWS = _env_int('EWASTE_EXPORT_CHUNK_ROWS', 1000)
+
+# Detection logging is write-behind: rows are batched into one transaction
+# every FACE_LOG_FLUSH_MS or FACE_LOG_BATCH_ROWS rows. At most
+# FACE_LOG_MAX_QUEUE rows wait in memory; beyond that new rows are dropped.
+FACE_LOG_BATCH_ROWS = _env_int('EWASTE_FACE_LOG_BATCH_ROWS', 200)
+FACE_LOG_FLUSH_MS = _env_int('EWASTE_FACE_LOG_FLUSH_MS', 1000)
+FACE_LOG_MAX_QUEUE = _env_int('EWASTE_FACE_LOG_MAX_QUEUE', 10000)
+
+# Age/gender networks (Caffe). The prototxts ship with the repo; the trained
+# weights are downloaded separately and dropped next to them.
+AGE_PROTO = os.path.join(MODELS_DIR, 'deploy_age.prototxt')
+AGE_MODEL = _env_str('EWASTE_AGE_MODEL', os.path.join(MODELS_DIR, 'age_net.caffemodel'))
+GENDER_PROTO = os.path.join(MODELS_DIR, 'deploy_gender.prototxt')
+GENDER_MODEL = _env_str('EWASTE_GENDER_MODEL', os.path.join(MODELS_DIR, 'gender_net.caffemodel'))
+
+# cv2.dnn execution settings: backend is one of default/opencv/openvino/cuda,
+# target one of cpu/opencl/opencl_fp16/cuda/cuda_fp16. Threads 0 keeps
+# OpenCV's own default.
+DNN_BACKEND = _env_str('EWASTE_DNN_BACKEND', 'default')
+DNN_TARGET = _env_str('EWASTE_DNN_TARGET', 'cpu')
+DNN_THREADS = _env_int('EWASTE_DNN_THREADS', 0)
+
+# Face detector: 'haar' (OpenCV cascade) or 'ssd' (ResNet-10 SSD from
+# models/deploy.prototxt.txt). SSD falls back to Haar if its weights are missing.
+FACE_DETECTOR = _env_str('EWASTE_FACE_DETECTOR', 'haar')
+
+# Haar cascade settings. A max input width > 0 downsizes frames before
+# building the detection pyramid; 640 and a 1.1 step cut the pyramid to a
+# fraction of full-resolution 1.05 while still finding faces at kiosk
+# distance. 0 and 1.05 restore the old exhaustive search.
+HAAR_SCALE_FACTOR = _env_float('EWASTE_HAAR_SCALE_FACTOR', 1.1)
+HAAR_MIN_NEIGHBORS = _env_int('EWASTE_HAAR_MIN_NEIGHBORS', 3)
+HAAR_MIN_SIZE = _env_int('EWASTE_HAAR_MIN_SIZE', 20)
+HAAR_MAX_INPUT_WIDTH = _env_int('EWASTE_HAAR_MAX_INPUT_WIDTH', 640)
+
+# SSD settings
+SSD_PROTO = os.path.join(MODELS_DIR, 'deploy.prototxt.txt')
+SSD_MODEL = _env_str('EWASTE_SSD_MODEL', os.path.join(MODELS_DIR, 'res10_300x300_ssd_iter_140000.caffemodel'))
+SSD_INPUT_SIZE = _env_int('EWASTE_SSD_INPUT_SIZE', 300)
+SSD_CONFIDENCE = _env_float('EWASTE_SSD_CONFIDENCE', 0.5)
+
+# Faces whose centre is within this many pixels of the frame centre count as
+# being at the bin (the on-screen detection circle)
+DETECTION_RADIUS = _env_int('EWASTE_DETECTION_RADIUS', 200)
+
+# 'full' searches the whole frame; 'roi' only searches the detection circle's
+# bounding box, grown by ROI_MARGIN * radius so faces centred near the edge
+# still fit. ROI_WORKING_WIDTH > 0 downsizes the crop before detection.
+DETECTION_MODE = _env_str('EWASTE_DETECTION_MODE', 'full')
+ROI_MARGIN = _env_float('EWASTE_ROI_MARGIN', 0.5)
+ROI_WORKING_WIDTH = _env_int('EWASTE_ROI_WORKING_WIDTH', 0)
+
+# Face tracking between full detections, per kiosk. The detector runs every
+# TRACK_DETECT_INTERVAL frames; frames in between follow the last box with
+# template matching as long as the match score stays above TRACK_MIN_SCORE.
+TRACKING_ENABLED = _env_bool('EWASTE_TRACKING', True)
+TRACK_DETECT_INTERVAL = _env_int('EWASTE_TRACK_DETECT_INTERVAL', 5)
+TRACK_MIN_SCORE = _env_float('EWASTE_TRACK_MIN_SCORE', 0.6)
+TRACK_IDLE_TIMEOUT = _env_float('EWASTE_TRACK_IDLE_TIMEOUT', 30.0)
+TRACK_AGE_SMOOTHING = _env_float('EWASTE_TRACK_AGE_SMOOTHING', 0.3)
+TRACK_VIP_WINDOW = _env_int('EWASTE_TRACK_VIP_WINDOW', 5)
+
+# Detection worker processes. 0 runs detection on the request thread; N > 0
+# starts N processes, each with its own models, and pins every kiosk to one
+# of them so its tracking state stays in one place. Frames travel through a
+# DETECT_SLOT_BYTES shared-memory slot per worker; larger frames are
+# processed in the server process instead.
+DETECT_WORKERS = _env_int('EWASTE_DETECT_WORKERS', 0)
+DETECT_SLOT_BYTES = _env_int('EWASTE_DETECT_SLOT_BYTES', 1920 * 1080 * 3)
+DETECT_TIMEOUT = _env_float('EWASTE_DETECT_TIMEOUT', 10.0)
+
+# Detections allowed to run at once across all kiosks. Streams are served
+# round-robin and only their newest frame is kept, so a busy camera can't
+# starve the others. 0 picks twice DETECT_WORKERS, or the CPU count when
+# detection runs in the server process.
+DETECT_CONCURRENCY = _env_int('EWASTE_DETECT_CONCURRENCY', 0)
+
+# Motion gate in front of detection. Each frame is reduced to a
+# MOTION_THUMB_WIDTH-wide grayscale thumbnail and compared with the thumbnail
+# of the kiosk's last detected frame; if fewer than MOTION_MIN_CHANGE of its
+# pixels moved by more than MOTION_PIXEL_DELTA, the last result is returned
+# without decoding or detecting. After MOTION_MAX_SKIPS gated frames in a row
+# the frame is detected anyway so results never go stale. Off until
+# benchmark.py shows a win on recorded kiosk footage (compare runs with
+# EWASTE_MOTION_GATE=0 and =1).
+MOTION_GATE_ENABLED = _env_bool('EWASTE_MOTION_GATE', False)
+MOTION_THUMB_WIDTH = _env_int('EWASTE_MOTION_THUMB_WIDTH', 64)
+MOTION_PIXEL_DELTA = _env_int('EWASTE_MOTION_PIXEL_DELTA', 15)
+MOTION_MIN_CHANGE = _env_float('EWASTE_MOTION_MIN_CHANGE', 0.02)
+MOTION_MAX_SKIPS = _env_int('EWASTE_MOTION_MAX_SKIPS', 25)
+
+# Client pacing. Detection responses carry hints (interval, max frame width,
+# JPEG quality) sized so the active kiosks together stay within detection
+# capacity with PACING_HEADROOM to spare: the interval grows from
+# PACING_MIN_INTERVAL_MS towards PACING_MAX_INTERVAL_MS as load rises, and
+# width and quality step down towards their minimums once it nears the
+# maximum. Frames are refused with 429 when the expected queue wait exceeds
+# PACING_SHED_WAIT_MS, or when an overloaded kiosk sends faster than asked.
+PACING_ENABLED = _env_bool('EWASTE_PACING', True)
+PACING_MIN_INTERVAL_MS = _env_int('EWASTE_PACING_MIN_INTERVAL_MS', 66)
+PACING_MAX_INTERVAL_MS = _env_int('EWASTE_PACING_MAX_INTERVAL_MS', 1000)
+PACING_HEADROOM = _env_float('EWASTE_PACING_HEADROOM', 1.25)
+PACING_MAX_FRAME_WIDTH = _env_int('EWASTE_PACING_MAX_FRAME_WIDTH', 1280)
+PACING_MIN_FRAME_WIDTH = _env_int('EWASTE_PACING_MIN_FRAME_WIDTH', 480)
+PACING_MAX_JPEG_QUALITY = _env_float('EWASTE_PACING_MAX_JPEG_QUALITY', 0.8)
+PACING_MIN_JPEG_QUALITY = _env_float('EWASTE_PACING_MIN_JPEG_QUALITY', 0.6)
+PACING_SHED_WAIT_MS = _env_int('EWASTE_PACING_SHED_WAIT_MS', 1000)
+
+# Kiosk used when a client doesn't identify itself
+DEFAULT_KIOSK_ID = _env_str('EWASTE_DEFAULT_KIOSK_ID', 'default')
+
+# VIP recognition. The embedding network (OpenFace nn4.small2.v1 Torch model)
+# is optional; without it a normalized-pixel descriptor is used, which only
+# works for near-identical captures. VIP_MATCH_THRESHOLD is the minimum cosine
+# similarity to count as a match. Pixel descriptors of any two frontal faces
+# easily score above that, so without the network VIP_FALLBACK_THRESHOLD
+# applies instead.
+EMBEDDING_MODEL = _env_str('EWASTE_EMBEDDING_MODEL', os.path.join(VIP_MODELS_DIR, 'nn4.small2.v1.t7'))
+VIP_MATCH_THRESHOLD = _env_float('EWASTE_VIP_MATCH_THRESHOLD', 0.6)
+VIP_FALLBACK_THRESHOLD = _env_float('EWASTE_VIP_FALLBACK_THRESHOLD', 0.95)
+
+# Journal records (enrollments/removals) before the VIP index is compacted
+# into a new base segment in the background
+VIP_COMPACT_THRESHOLD = _env_int('EWASTE_VIP_COMPACT_THRESHOLD', 256)
+
+# Retention. Raw face_data rows older than RETENTION_FACE_DATA_DAYS are moved
+# to per-day CSV.gz files in ARCHIVE_DIR (their counts stay in the analytics
+# rollups); minute and hour rollup buckets are dropped after their own limits,
+# day buckets are kept. Photos older than RETENTION_PHOTO_DAYS are
+# 'transcode'd (downsized into ARCHIVE_DIR), 'delete'd or left alone ('keep').
+# Any day limit of 0 disables that step. The pass runs every
+# RETENTION_INTERVAL_HOURS in the background.
+ARCHIVE_DIR = _env_str('EWASTE_ARCHIVE_DIR', os.path.join(BASE_DIR, 'archive'))
+RETENTION_ENABLED = _env_bool('EWASTE_RETENTION', True)
+RETENTION_INTERVAL_HOURS = _env_float('EWASTE_RETENTION_INTERVAL_HOURS', 24.0)
+RETENTION_FACE_DATA_DAYS = _env_int('EWASTE_RETENTION_FACE_DATA_DAYS', 30)
+RETENTION_MINUTE_BUCKET_DAYS = _env_int('EWASTE_RETENTION_MINUTE_BUCKET_DAYS', 14)
+RETENTION_HOUR_BUCKET_DAYS = _env_int('EWASTE_RETENTION_HOUR_BUCKET_DAYS', 365)
+RETENTION_PHOTO_DAYS = _env_int('EWASTE_RETENTION_PHOTO_DAYS', 90)
+RETENTION_PHOTO_ACTION = _env_str('EWASTE_RETENTION_PHOTO_ACTION', 'transcode')
+RETENTION_PHOTO_MAX_WIDTH = _env_int('EWASTE_RETENTION_PHOTO_MAX_WIDTH', 640)
+RETENTION_PHOTO_QUALITY = _env_int('EWASTE_RETENTION_PHOTO_QUALITY', 70)
+# Idempotency keys of applied /events are kept this long; a renderer retrying
+# a batch older than that would apply it again
+RETENTION_EVENT_KEY_DAYS = _env_int('EWASTE_RETENTION_EVENT_KEY_DAYS', 30)
+# Rows deleted per transaction, so the detection writer never waits long
+RETENTION_BATCH_ROWS = _env_int('EWASTE_RETENTION_BATCH_ROWS', 5000)
+# Pages returned to the OS per incremental_vacuum step
+RETENTION_VACUUM_PAGES = _env_int('EWASTE_RETENTION_VACUUM_PAGES', 2000)
+# Older databases without incremental auto_vacuum are converted by one full
+# VACUUM, which blocks every writer until it finishes. Off by default; enable
+# it for a maintenance window (or run VACUUM offline) to start reclaiming space
+RETENTION_FULL_VACUUM = _env_bool('EWASTE_RETENTION_FULL_VACUUM', False)
+
+# Photo storage. /save-photo returns as soon as the capture is queued;
+# PHOTO_WORKERS threads write it (content-addressed, via temp file + rename)
+# and render the thumbnail and preview variants. When more than
+# PHOTO_MAX_QUEUE photos are waiting, the request writes its own file rather
+# than dropping it.
+PHOTO_WORKERS = _env_int('EWASTE_PHOTO_WORKERS', 2)
+PHOTO_MAX_QUEUE = _env_int('EWASTE_PHOTO_MAX_QUEUE', 64)
+PHOTO_THUMBNAIL_WIDTH = _env_int('EWASTE_PHOTO_THUMBNAIL_WIDTH', 160)
+PHOTO_PREVIEW_WIDTH = _env_int('EWASTE_PHOTO_PREVIEW_WIDTH', 640)
+PHOTO_VARIANT_QUALITY = _env_int('EWASTE_PHOTO_VARIANT_QUALITY', 85)
+
+# Logging. Per-frame detail (face boxes, full results) is logged at DEBUG and
+# skipped entirely at the default INFO level.
+LOG_LEVEL = _env_str('EWASTE_LOG_LEVEL', 'INFO').upper()
+
+# Production server (serve.py). 'werkzeug' (the default) is Werkzeug's
+# threaded server without the debugger or reloader, and serves the
+# /detect-stream WebSocket. 'waitress' (pip install waitress) handles
+# SERVER_THREADS requests at once from a fixed pool but has no WebSocket
+# support, so kiosks fall back to HTTP polling. Detection parallelism comes
+# from DETECT_WORKERS either way.
+SERVER_BACKEND = _env_str('EWASTE_SERVER', 'werkzeug').lower()
+SERVER_HOST = _env_str('EWASTE_HOST', '127.0.0.1')
+SERVER_PORT = _env_int('EWASTE_PORT', 5000)
+SERVER_THREADS = _env_int('EWASTE_SERVER_THREADS', 8)
+
+# Admin endpoints: on-demand profiling of detection requests (/profile/*)
+# and retention (/retention, /retention/run). They need
+# `Authorization: Bearer <ADMIN_TOKEN>` and are disabled while it is empty.
+# Python stacks are sampled every PROFILE_SAMPLE_INTERVAL_MS; a session
+# never runs longer than PROFILE_MAX_SECONDS.
+ADMIN_TOKEN = _env_str('EWASTE_ADMIN_TOKEN', '')
+PROFILE_SAMPLE_INTERVAL_MS = _env_float('EWASTE_PROFILE_SAMPLE_INTERVAL_MS', 5.0)
+PROFILE_MAX_SECONDS = _env_int('EWASTE_PROFILE_MAX_SECONDS', 300)
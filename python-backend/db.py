@@ -0,0 +1,158 @@
+# python-backend\db.py
+"""Shared SQLite access layer.
+
+All routes borrow connections from one pool instead of opening and closing a
+connection per request. Connections are opened once in WAL mode, so readers
+never wait for the detection writer, and keep sqlite3's prepared-statement
+cache warm across requests.
+"""
+
+import contextlib
+import os
+import pathlib
+import queue
+import sqlite3
+import threading
+
+from config import (
+    DB_BUSY_TIMEOUT_MS, DB_CACHE_SIZE_KB, DB_PATH, DB_POOL_SIZE,
+    DB_STATEMENT_CACHE, DB_SYNCHRONOUS,
+)
+
+class ConnectionPool:
+    """Fixed-size pool of configured SQLite connections"""
+
+    def __init__(self, path, size=DB_POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=DB_BUSY_TIMEOUT_MS / 1000,
+            # Connections move between request threads, but only one uses it at a time
+            check_same_thread=False,
+            cached_statements=DB_STATEMENT_CACHE,
+            # Autocommit; transactions are explicit via transaction()
+            isolation_level=None,
+        )
+        # Only takes effect on a new database; retention converts old ones
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(f'PRAGMA synchronous={DB_SYNCHRONOUS}')
+        conn.execute(f'PRAGMA cache_size=-{DB_CACHE_SIZE_KB}')
+        conn.execute(f'PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        return conn
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return self._connect()
+
+        # Pool exhausted: wait for a connection to come back
+        try:
+            return self._idle.get(timeout=DB_BUSY_TIMEOUT_MS / 1000)
+        except queue.Empty:
+            raise sqlite3.OperationalError('Timed out waiting for a database connection')
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._created = 0
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_PATH)
+    return _pool
+
+@contextlib.contextmanager
+def connection():
+    """Borrow a pooled connection (autocommit) for reads"""
+    pool = get_pool()
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+class TransactionCursor(sqlite3.Cursor):
+    """Cursor that can queue work to run once its transaction has committed"""
+
+    def __init__(self, conn):
+        super().__init__(conn)
+        self.on_commit = []
+
+@contextlib.contextmanager
+def transaction():
+    """Run the block in one write transaction and yield a cursor.
+
+    BEGIN IMMEDIATE takes the write lock up front, so concurrent writers
+    queue on busy_timeout instead of failing with SQLITE_BUSY mid-transaction.
+    Callables appended to `cursor.on_commit` run after a successful COMMIT,
+    which is where in-memory caches of the written rows get updated.
+    """
+    with connection() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        cursor = conn.cursor(TransactionCursor)
+        try:
+            yield cursor
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+    for callback in cursor.on_commit:
+        callback()
+
+@contextlib.contextmanager
+def read_only_connection(path=None):
+    """A dedicated connection that cannot write, for long-running reads.
+
+    It is opened outside the pool, so an export never holds a connection
+    the request handlers are waiting for.
+    """
+    uri = pathlib.Path(os.path.abspath(path or DB_PATH)).as_uri() + '?mode=ro'
+    conn = sqlite3.connect(
+        uri, uri=True,
+        timeout=DB_BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,
+        isolation_level=None,
+    )
+    try:
+        conn.execute('PRAGMA query_only=ON')
+        conn.execute(f'PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}')
+        yield conn
+    finally:
+        conn.close()
+
+def query_one(sql, params=()):
+    with connection() as conn:
+        return conn.execute(sql, params).fetchone()
+
+def query_all(sql, params=()):
+    with connection() as conn:
+        return conn.execute(sql, params).fetchall()
@@ -0,0 +1,285 @@
+# python-backend\detect_pool.py
+"""Detection execution layer.
+
+With DETECT_WORKERS = 0 frames are processed on the request thread, as
+before. With N > 0 the server starts N worker processes, each of which runs
+init_models() and keeps its own detector, networks, VIP index and face
+trackers, so detection scales with cores instead of sharing one GIL.
+
+Each worker owns one shared-memory slot of DETECT_SLOT_BYTES. A request
+copies the frame (encoded JPEG/PNG bytes, or raw pixels) into the slot of
+its kiosk's worker and sends a small header over a pipe; only the result
+dict comes back pickled. Decoding happens in the worker too. Kiosks map to
+a fixed worker, so the tracking state of a camera always lives in the same
+process.
+"""
+
+import atexit
+import multiprocessing
+import os
+import threading
+import traceback
+import zlib
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import vision
+from config import (
+    DETECT_SLOT_BYTES, DETECT_TIMEOUT, DETECT_WORKERS, MOTION_GATE_ENABLED, TRACKING_ENABLED,
+)
+from metrics import configure_logging, metrics
+from motion_gate import motion_gate
+from tracker import face_trackers
+
+# Seconds a new worker gets to load its models
+WORKER_START_TIMEOUT = 120
+
+def process_frame(img, kiosk_id):
+    """Run the detection pipeline on a decoded frame for one kiosk"""
+    if TRACKING_ENABLED:
+        return face_trackers.process(kiosk_id, img)
+    return vision.analyze_frame(img)
+
+def detect_frame(kiosk_id, img=None, encoded=None):
+    """Decode `encoded` (if given) and run detection in this process"""
+    try:
+        thumbnail = None
+        if MOTION_GATE_ENABLED:
+            # Unchanged scene: answer before the full decode
+            with metrics.stage('motion_gate'):
+                thumbnail = motion_gate.thumbnail(img=img, encoded=encoded)
+                result = motion_gate.check(kiosk_id, thumbnail)
+            if result is not None:
+                return result
+
+        if encoded is not None:
+            with metrics.stage('decode'):
+                img = vision.decode_frame_bytes(encoded)
+        result = process_frame(img, kiosk_id)
+        if MOTION_GATE_ENABLED:
+            motion_gate.update(kiosk_id, thumbnail, result)
+        return result
+    except Exception as e:
+        print(f"Error in face detection: {str(e)}")
+        return {"gender": "Unknown", "age": 0, "error": str(e)}
+
+def _worker_main(conn, shm_name):
+    """Entry point of a detection worker process"""
+    # Spawned workers share the server's resource tracker, so attaching here
+    # doesn't make the segment theirs to unlink
+    shm = shared_memory.SharedMemory(name=shm_name)
+    configure_logging()
+    # The server owns the VIP index files; workers only read them
+    vision.init_models(read_only_index=True)
+    vision.warm_up()
+    conn.send(('ready', os.getpid()))
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        command = message[0]
+
+        if command == 'detect':
+            _, kiosk_id, size, shape, dtype = message
+            # Stage timings go back with the result to the server's registry
+            with metrics.capture() as observed:
+                if shape is None:
+                    # Encoded frame; imdecode copies it out of the slot
+                    result = detect_frame(kiosk_id, encoded=np.frombuffer(shm.buf, np.uint8, count=size))
+                else:
+                    # Raw pixels; copied because trackers keep slices of the frame
+                    img = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf).copy()
+                    result = detect_frame(kiosk_id, img=img)
+            conn.send(('result', result, observed))
+        elif command == 'reload_vip_index':
+            try:
+                if vision.vip_index is not None:
+                    vision.vip_index.load()
+                # Gated results carry VIP matches made against the old index
+                motion_gate.reset()
+                conn.send(('ok', None))
+            except Exception as e:
+                conn.send(('error', str(e)))
+        elif command == 'stop':
+            break
+
+    conn.close()
+    try:
+        shm.close()
+    except BufferError:
+        pass  # A numpy view is still alive; the OS reclaims the mapping on exit
+
+class DetectionWorker:
+    """One worker process, its pipe and its shared-memory frame slot"""
+
+    def __init__(self, index, context, slot_bytes=DETECT_SLOT_BYTES):
+        self.index = index
+        self.context = context
+        self.slot_bytes = slot_bytes
+        self.lock = threading.Lock()
+        self.process = None
+        self.conn = None
+        self.shm = None
+        self.frames = 0
+        self.restarts = 0
+
+    def start(self):
+        self.shm = shared_memory.SharedMemory(create=True, size=self.slot_bytes)
+        self.conn, child_conn = self.context.Pipe()
+        self.process = self.context.Process(
+            target=_worker_main, args=(child_conn, self.shm.name),
+            name=f'detect-worker-{self.index}', daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+
+    def wait_ready(self, timeout=WORKER_START_TIMEOUT):
+        if not self.conn.poll(timeout):
+            raise TimeoutError(f"Detection worker {self.index} didn't start in {timeout}s")
+        status, pid = self.conn.recv()
+        print(f"Detection worker {self.index} ready (pid {pid})")
+
+    def stop(self, timeout=5.0):
+        if self.process is None:
+            return
+        try:
+            self.conn.send(('stop',))
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join(timeout)
+        self.conn.close()
+        self.shm.close()
+        self.shm.unlink()
+        self.process = None
+
+    def restart(self):
+        """Replace a dead or hung worker; its kiosks lose their tracks"""
+        self.stop(timeout=1.0)
+        self.restarts += 1
+        self.start()
+        self.wait_ready()
+
+    def ensure_running(self):
+        if self.process is None or not self.process.is_alive():
+            self.restart()
+
+    def request(self, message, timeout):
+        """Send `message` and wait for the reply; the caller holds self.lock"""
+        self.ensure_running()
+        self.conn.send(message)
+        if not self.conn.poll(timeout):
+            self.restart()
+            raise TimeoutError(f"Detection worker {self.index} timed out")
+        return self.conn.recv()
+
+    def detect(self, kiosk_id, img=None, encoded=None, timeout=DETECT_TIMEOUT):
+        with self.lock:
+            # A restart replaces the slot, so do it before the frame is copied in
+            self.ensure_running()
+            if encoded is not None:
+                size, shape, dtype = len(encoded), None, None
+                self.shm.buf[:size] = memoryview(encoded).cast('B')
+            else:
+                size, shape, dtype = img.nbytes, img.shape, img.dtype.str
+                slot = np.ndarray(shape, dtype=img.dtype, buffer=self.shm.buf)
+                slot[...] = img
+                del slot
+
+            try:
+                _, result, observed = self.request(('detect', kiosk_id, size, shape, dtype), timeout)
+            except (EOFError, OSError) as e:
+                self.restart()
+                raise RuntimeError(f"Detection worker {self.index} failed: {str(e)}")
+            metrics.merge(observed)
+            self.frames += 1
+            return result
+
+class DetectionPool:
+    """Routes frames to worker processes, or runs them inline when disabled"""
+
+    def __init__(self, workers=DETECT_WORKERS, slot_bytes=DETECT_SLOT_BYTES, timeout=DETECT_TIMEOUT):
+        self.size = max(0, workers)
+        self.slot_bytes = slot_bytes
+        self.timeout = timeout
+        self._workers = []
+        self.inline_frames = 0
+
+    @property
+    def enabled(self):
+        return bool(self._workers)
+
+    def start(self):
+        """Start the workers and wait for their models to load"""
+        if self._workers or not self.size:
+            return False
+        # spawn everywhere: fork would copy the server's threads and locks
+        context = multiprocessing.get_context('spawn')
+        workers = [DetectionWorker(i, context, self.slot_bytes) for i in range(self.size)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.wait_ready()
+        self._workers = workers
+        atexit.register(self.stop)
+        return True
+
+    def stop(self):
+        workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.stop()
+
+    def worker_for(self, kiosk_id):
+        """Stable kiosk -> worker assignment (crc32, unlike hash(), is the same every run)"""
+        return self._workers[zlib.crc32(str(kiosk_id).encode()) % len(self._workers)]
+
+    def detect(self, kiosk_id, img=None, encoded=None):
+        """Detection result for one frame; pass either a decoded `img` or `encoded` bytes"""
+        if not self._workers:
+            return detect_frame(kiosk_id, img=img, encoded=encoded)
+
+        size = len(encoded) if encoded is not None else (img.nbytes if img is not None else 0)
+        if not size or size > self.slot_bytes:
+            # Doesn't fit the slot (or nothing to send): handle it here
+            self.inline_frames += 1
+            return detect_frame(kiosk_id, img=img, encoded=encoded)
+
+        try:
+            return self.worker_for(kiosk_id).detect(kiosk_id, img=img, encoded=encoded, timeout=self.timeout)
+        except Exception as e:
+            print(f"Error in detection worker: {str(e)}")
+            traceback.print_exc()
+            return {"gender": "Unknown", "age": 0, "error": str(e)}
+
+    def reload_vip_index(self):
+        """Have every worker reload the VIP index after an enrollment change"""
+        motion_gate.reset()
+        for worker in self._workers:
+            try:
+                with worker.lock:
+                    worker.request(('reload_vip_index',), self.timeout)
+            except Exception as e:
+                print(f"Error reloading VIP index in worker {worker.index}: {str(e)}")
+
+    def stats(self):
+        if not self._workers:
+            return 'disabled'
+        return {
+            'inline_frames': self.inline_frames,
+            'workers': [
+                {
+                    'pid': worker.process.pid if worker.process is not None else None,
+                    'alive': worker.process is not None and worker.process.is_alive(),
+                    'frames': worker.frames,
+                    'restarts': worker.restarts,
+                }
+                for worker in self._workers
+            ],
+        }
+
+detection_pool = DetectionPool()
@@ -0,0 +1,449 @@
+# python-backend\detection_api.py
+"""Detection, VIP enrollment and pacing routes.
+
+These are the only routes that need OpenCV, numpy and the models, so they
+live apart from app.py: app.warm_up_models() imports this module after the
+database routes are already being served, and until warm_up() has finished
+app.py answers these routes with 503 (see DETECTION_ROUTES there). The
+functions here read `flask.request` like any view, and assume the models
+are loaded.
+"""
+
+import datetime
+import json
+import logging
+import math
+import os
+import threading
+import traceback
+
+import numpy as np
+from flask import jsonify, request
+
+try:
+    from flask_sock import ConnectionClosed
+except ImportError:  # Only needed by the optional /detect-stream channel
+    ConnectionClosed = None
+
+import db
+import vision
+from app import get_kiosk_id, save_face_data
+from config import PHOTOS_DIR, TRACKING_ENABLED
+from detect_pool import detection_pool
+from metrics import metrics
+from pacing import pacing
+from profiler import profiler
+from scheduler import frame_scheduler
+from tracker import face_trackers
+from vision import (
+    init_models,
+    read_frame_body, decode_data_url, decode_frame_bytes, data_url_bytes,
+)
+
+log = logging.getLogger(__name__)
+
+# Binary frame uploads accepted by /detect-face (in addition to JSON data URLs)
+BINARY_FRAME_MIMETYPES = ('image/jpeg', 'image/png', 'application/octet-stream')
+MAX_FRAME_BYTES = 16 * 1024 * 1024
+
+def warm_up():
+    """Load and warm up the models and start the detection workers"""
+    loaded = init_models()
+    if loaded:
+        vision.warm_up()
+    else:
+        print("Failed to initialize models. Some features may not work correctly.")
+    if vision.vip_index is not None:
+        # Workers hold read-only copies; a compaction switches them to new files
+        vision.vip_index.on_compact.append(detection_pool.reload_vip_index)
+
+    # Detection worker processes (EWASTE_DETECT_WORKERS); each loads and warms its own models
+    detection_pool.start()
+    return loaded
+
+def health():
+    """Detection parts of /health"""
+    return {
+        'services': {
+            'face_detection': 'running' if vision.face_detector is not None else 'error',
+            'face_detector': vision.face_detector.name if vision.face_detector is not None else None,
+            'age_gender_model': 'running' if vision.age_net is not None and vision.gender_net is not None else 'heuristic',
+            'vip_recognition': 'running' if vision.embedding_net is not None else 'pixel_descriptor',
+            'vip_enrolled_embeddings': vision.vip_index.size if vision.vip_index is not None else 0,
+        },
+        'tracking': face_trackers.stats() if TRACKING_ENABLED else 'disabled',
+        'detection_workers': detection_pool.stats(),
+        'scheduler': frame_scheduler.stats(),
+        'pacing': pacing.stats(),
+    }
+
+def run_detection(kiosk_id, img=None, encoded=None):
+    """Run the detection pipeline for one kiosk on a decoded or encoded frame.
+
+    Encoded frames are decoded wherever the detection runs, so with worker
+    processes enabled the request thread never touches the pixels. Frames go
+    through the per-kiosk scheduler: if a newer frame from the same kiosk
+    arrives before this one starts, this one is answered with `skipped`.
+    """
+    result = frame_scheduler.detect(kiosk_id, img=img, encoded=encoded)
+    if pacing.enabled:
+        # Results can be shared (motion gate); hints go on a copy
+        result = dict(result, pacing=pacing.hints())
+    return result
+
+def shed_response(hints):
+    """429 for a frame refused by load shedding, with the pacing to follow"""
+    response = jsonify(pacing.shed_result(hints))
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, math.ceil(hints['interval_ms'] / 1000)))
+    return response
+
+def detect_face():
+    """Face detection endpoint"""
+    # Refused before the body is even read
+    shed = pacing.admit(get_kiosk_id())
+    if shed is not None:
+        return shed_response(shed)
+
+    # A no-op unless an admin has started a profiling session
+    with profiler.request():
+        if request.mimetype in BINARY_FRAME_MIMETYPES:
+            return detect_face_binary()
+        return detect_face_json()
+
+def detect_face_json():
+    """Handle a /detect-face request with a JSON `{"image": <data URL>}` body"""
+    data = request.json
+    image_data = data.get('image', '')
+
+    if not image_data:
+        return jsonify({'error': 'No image provided'}), 400
+
+    try:
+        try:
+            encoded = data_url_bytes(image_data)
+        except Exception as e:
+            log.warning("Error decoding image: %s", e)
+            encoded = None
+        kiosk_id = get_kiosk_id()
+        result = run_detection(kiosk_id, encoded=encoded)
+
+        log.debug("detection kiosk=%s result=%s", kiosk_id, result)
+
+        # Save detection data if valid
+        if not result.get('error'):
+            save_face_data(result, kiosk_id)
+
+        with metrics.stage('serialize'):
+            return jsonify(result)
+    except Exception as e:
+        print(f"Error in face detection endpoint: {str(e)}")
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+def detect_face_binary():
+    """Handle a /detect-face request whose body is the frame itself.
+
+    `image/jpeg` (or `image/png`) bodies are decoded directly. Raw pixel bodies
+    (`application/octet-stream`) need `X-Frame-Width` and `X-Frame-Height`
+    headers, plus `X-Frame-Channels` (1 = grayscale, the default, or 3 = BGR).
+    """
+    content_length = request.content_length
+    if not content_length:
+        return jsonify({'error': 'No image provided'}), 400
+    if content_length > MAX_FRAME_BYTES:
+        return jsonify({'error': 'Frame too large'}), 413
+
+    try:
+        width = height = channels = None
+        if request.mimetype == 'application/octet-stream':
+            try:
+                width = int(request.headers['X-Frame-Width'])
+                height = int(request.headers['X-Frame-Height'])
+                channels = int(request.headers.get('X-Frame-Channels', 1))
+            except (KeyError, ValueError):
+                return jsonify({'error': 'Raw frames need X-Frame-Width and X-Frame-Height headers'}), 400
+
+        kiosk_id = get_kiosk_id()
+        frame_bytes = read_frame_body(request.stream, content_length)
+        if width is None:
+            # JPEG/PNG: decoded by whichever process runs the detection
+            result = run_detection(kiosk_id, encoded=frame_bytes)
+        else:
+            try:
+                img = decode_frame_bytes(frame_bytes, width, height, channels)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            result = run_detection(kiosk_id, img=img)
+
+        log.debug("detection kiosk=%s result=%s", kiosk_id, result)
+
+        # Save detection data if valid
+        if not result.get('error'):
+            save_face_data(result, kiosk_id)
+
+        with metrics.stage('serialize'):
+            return jsonify(result)
+    except Exception as e:
+        print(f"Error in face detection endpoint: {str(e)}")
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+class LatestFrameSlot:
+    """Single-slot mailbox that only ever holds the newest frame.
+
+    The receiving side overwrites whatever is waiting, so a slow consumer
+    always processes the most recent frame and stale ones are dropped.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._frame = None
+        self._closed = False
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, frame):
+        with self._cond:
+            if self._frame is not None:
+                self.dropped += 1
+            self._frame = frame
+            self.received += 1
+            self._cond.notify()
+
+    def take(self):
+        """Block until a frame is available; returns None once closed"""
+        with self._cond:
+            while self._frame is None and not self._closed:
+                self._cond.wait()
+            frame, self._frame = self._frame, None
+            return frame
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+def stream_message_bytes(message):
+    """Encoded frame from a WebSocket message: binary JPEG bytes or JSON with a data URL"""
+    if isinstance(message, (bytes, bytearray)):
+        return np.frombuffer(message, dtype=np.uint8)
+
+    data = json.loads(message)
+    image_data = data.get('image', '')
+    if not image_data:
+        raise ValueError('No image provided')
+    return data_url_bytes(image_data)
+
+def _stream_detection_worker(ws, slot, kiosk_id):
+    """Process the newest frame from `slot` and push results back over `ws`"""
+    while True:
+        frame = slot.take()
+        if frame is None:
+            return
+        seq, message = frame
+
+        try:
+            shed = pacing.admit(kiosk_id)
+            if shed is not None:
+                result = pacing.shed_result(shed)
+            else:
+                with profiler.request():
+                    result = run_detection(kiosk_id, encoded=stream_message_bytes(message))
+            if not result.get('error'):
+                save_face_data(result, kiosk_id)
+        except Exception as e:
+            print(f"Error in stream detection: {str(e)}")
+            result = {"gender": "Unknown", "age": 0, "error": str(e)}
+
+        result['seq'] = seq
+        result['dropped_frames'] = slot.dropped
+        try:
+            with metrics.stage('serialize'):
+                message = json.dumps(result)
+            ws.send(message)
+        except ConnectionClosed:
+            slot.close()
+            return
+
+def detect_stream(ws):
+    """Persistent detection channel.
+
+    Clients send frames (binary JPEG, or JSON `{"image": <data URL>}`) and
+    receive one JSON result per processed frame, tagged with the frame's
+    `seq`. Frames that arrive while a detection is running replace the
+    pending one, so only the newest frame is ever processed. Pass
+    `?kiosk_id=` to share tracking state with that kiosk's HTTP requests.
+    """
+    slot = LatestFrameSlot()
+    worker = threading.Thread(
+        target=_stream_detection_worker, args=(ws, slot, get_kiosk_id()), daemon=True
+    )
+    worker.start()
+
+    seq = 0
+    try:
+        while True:
+            message = ws.receive()
+            if message is None:
+                continue
+            seq += 1
+            slot.put((seq, message))
+    except ConnectionClosed:
+        pass
+    finally:
+        slot.close()
+        worker.join(timeout=5)
+
+def resolve_photo_path(photo):
+    """Absolute path of a photo under PHOTOS_DIR, or None if it points elsewhere"""
+    photos_dir = os.path.realpath(PHOTOS_DIR)
+    path = os.path.realpath(os.path.join(photos_dir, photo))
+    if os.path.commonpath([photos_dir, path]) != photos_dir:
+        return None
+    return path
+
+def collect_enrollment_embeddings(data):
+    """Embeddings for the `photos` (files in PHOTOS_DIR) and `images` (data URLs) of a request.
+
+    Returns (embeddings, skipped) where skipped lists inputs without a usable face.
+    """
+    embeddings = []
+    skipped = []
+
+    for photo in data.get('photos', []):
+        path = resolve_photo_path(photo)
+        img = vision.read_image_file(path) if path else None
+        embedding = vision.enrollment_embedding(img) if img is not None else None
+        if embedding is None:
+            skipped.append(photo)
+        else:
+            embeddings.append(embedding)
+
+    for i, image_data in enumerate(data.get('images', [])):
+        try:
+            img = decode_data_url(image_data)
+        except Exception:
+            img = None
+        embedding = vision.enrollment_embedding(img) if img is not None else None
+        if embedding is None:
+            skipped.append(f'images[{i}]')
+        else:
+            embeddings.append(embedding)
+
+    return embeddings, skipped
+
+def upsert_vip_profile(vip_id, data):
+    """Create the VIP's profile row or update the fields present in `data`"""
+    with db.transaction() as cursor:
+        if vip_id is None:
+            cursor.execute("SELECT COALESCE(MAX(vip_id), 0) + 1 FROM vip_profiles")
+            vip_id = cursor.fetchone()[0]
+
+        cursor.execute(
+            """INSERT INTO vip_profiles (vip_id, name, gender, age, registration_date)
+               VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT(vip_id) DO UPDATE SET
+                   name = COALESCE(excluded.name, name),
+                   gender = COALESCE(excluded.gender, gender),
+                   age = COALESCE(excluded.age, age)""",
+            (vip_id, data.get('name'), data.get('gender'), data.get('age'),
+             datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        )
+    return vip_id
+
+def enroll_vip():
+    """Enroll a VIP (or add photos to an existing one) in the recognition index"""
+    try:
+        data = request.json
+        if vision.vip_index is None:
+            return jsonify({'error': 'VIP recognition not initialized'}), 503
+
+        embeddings, skipped = collect_enrollment_embeddings(data)
+        if not embeddings:
+            return jsonify({'error': 'No face found in the provided photos', 'skipped': skipped}), 400
+
+        vip_id = upsert_vip_profile(data.get('vip_id'), data)
+        vision.vip_index.add(vip_id, np.stack(embeddings))
+        detection_pool.reload_vip_index()
+
+        return jsonify({
+            'status': 'success',
+            'vip_id': vip_id,
+            'enrolled': len(embeddings),
+            'skipped': skipped
+        })
+    except Exception as e:
+        print(f"Error enrolling VIP: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+def update_vip(vip_id):
+    """Replace a VIP's enrolled photos and/or update their profile"""
+    try:
+        data = request.json
+        if vision.vip_index is None:
+            return jsonify({'error': 'VIP recognition not initialized'}), 503
+
+        embeddings, skipped = collect_enrollment_embeddings(data)
+        if (data.get('photos') or data.get('images')) and not embeddings:
+            return jsonify({'error': 'No face found in the provided photos', 'skipped': skipped}), 400
+
+        upsert_vip_profile(vip_id, data)
+        if embeddings:
+            vision.vip_index.update(vip_id, np.stack(embeddings))
+            detection_pool.reload_vip_index()
+
+        return jsonify({
+            'status': 'success',
+            'vip_id': vip_id,
+            'enrolled': len(embeddings),
+            'skipped': skipped
+        })
+    except Exception as e:
+        print(f"Error updating VIP: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+def remove_vip(vip_id):
+    """Remove a VIP from the recognition index (their history is kept)"""
+    try:
+        if vision.vip_index is None:
+            return jsonify({'error': 'VIP recognition not initialized'}), 503
+
+        removed = vision.vip_index.remove(vip_id)
+        detection_pool.reload_vip_index()
+        return jsonify({'status': 'success', 'vip_id': vip_id, 'removed': removed})
+    except Exception as e:
+        print(f"Error removing VIP: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+def vip_index_stats():
+    """Recognition index status"""
+    if vision.vip_index is None:
+        return jsonify({'error': 'VIP recognition not initialized'}), 503
+    return jsonify(vision.vip_index.stats())
+
+def compact_vip_index():
+    """Fold the enrollment journal into a new base segment now"""
+    try:
+        if vision.vip_index is None:
+            return jsonify({'error': 'VIP recognition not initialized'}), 503
+        # Workers reload through the index's on_compact callback
+        vision.vip_index.compact()
+        return jsonify({'status': 'success', **vision.vip_index.stats()})
+    except Exception as e:
+        print(f"Error compacting VIP index: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+def get_pacing():
+    """Current pacing hints, for clients that aren't sending frames yet"""
+    try:
+        return jsonify({
+            'pacing': pacing.hints(),
+            'ready': True
+        })
+    except Exception as e:
+        print(f"Error getting pacing hints: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+# Frames waiting for a dispatcher, read at scrape time
+metrics.gauge('ewaste_queue_depth', frame_scheduler.waiting, queue='detection')
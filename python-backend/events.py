@@ -0,0 +1,208 @@
+# python-backend\events.py
+"""Typed kiosk events, applied in batches with idempotency keys.
+
+The renderer buffers what happens during an interaction (flow state
+changes, the disposal, the rating, the photo reference) and posts them to
+/events as one ordered list. The whole list is applied in a single
+transaction, so one interaction costs one round trip and one commit, and a
+failed batch leaves nothing behind.
+
+Every event may carry a client-generated `key`. Applied keys are recorded in
+processed_events together with the event's result, in the same transaction,
+so a batch that is retried after a lost response is answered from there
+instead of being applied twice. The single-record routes (/save-rating,
+/save-waste-disposal) write through the same code without a key.
+"""
+
+import datetime
+import json
+
+import analytics
+from flow_states import flow_state_store
+from vip_stats import vip_stats_aggregator
+
+# Upper bound on events per request
+MAX_BATCH_EVENTS = 500
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+class EventError(ValueError):
+    """An event that can never be applied (bad type, missing field, ...)"""
+
+    def __init__(self, message, index=None):
+        super().__init__(message)
+        self.index = index
+
+def event_timestamp(event):
+    """The event's own time (buffered events keep it across retries), else now"""
+    value = event.get('timestamp')
+    if not value:
+        return datetime.datetime.now().strftime(TIMESTAMP_FORMAT)
+    value = str(value)
+    if value.endswith(('Z', 'z')):
+        # toISOString() writes UTC as "Z", which fromisoformat() only reads from 3.11
+        value = value[:-1] + '+00:00'
+    try:
+        when = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise EventError(f"Invalid timestamp: {value}")
+    if when.tzinfo is not None:
+        # Stored timestamps are local time, like everything the server writes
+        when = when.astimezone().replace(tzinfo=None)
+    return when.strftime(TIMESTAMP_FORMAT)
+
+def _required(event, *fields):
+    missing = [field for field in fields if event.get(field) in (None, '')]
+    if missing:
+        raise EventError(f"{event.get('type')} event needs {', '.join(missing)}")
+
+# Appliers: (cursor, event, kiosk_id, batch) -> result dict. `batch` maps the
+# keys applied so far in this request to their results.
+
+def apply_state(cursor, event, kiosk_id, batch=None):
+    _required(event, 'vip_id', 'flow_state')
+    state = flow_state_store.record(
+        cursor, event['vip_id'], event['flow_state'],
+        event.get('selected_box', ''), event.get('selected_rating', 0),
+        kiosk_id, event_timestamp(event)
+    )
+    return {'timestamp': state['timestamp']}
+
+def record_rating(cursor, vip_id, rating, timestamp):
+    """Insert a ratings row and fold it into the VIP's totals; returns its id.
+
+    `rating` may be None: /save-rating has always stored a row without one.
+    """
+    cursor.execute(
+        """INSERT INTO ratings (vip_id, rating, timestamp, photo_taken)
+           VALUES (?, ?, ?, 0)""",
+        (vip_id, rating, timestamp)
+    )
+    rating_id = cursor.lastrowid
+
+    # Running totals and the profile's average rating
+    vip_stats_aggregator.record_rating(cursor, rating_id, vip_id, rating, timestamp)
+    return rating_id
+
+def apply_rating(cursor, event, kiosk_id, batch=None):
+    _required(event, 'rating')
+    rating_id = record_rating(cursor, event.get('vip_id'), event['rating'], event_timestamp(event))
+    return {'rating_id': rating_id}
+
+def apply_disposal(cursor, event, kiosk_id, batch=None):
+    vip_id = event.get('vip_id')
+    waste_type = event.get('waste_type')
+    box_number = event.get('box_number')
+    timestamp = event_timestamp(event)
+
+    cursor.execute(
+        """INSERT INTO waste_disposal (vip_id, waste_type, box_number, timestamp, kiosk_id)
+           VALUES (?, ?, ?, ?, ?)""",
+        (vip_id, waste_type, box_number, timestamp, kiosk_id)
+    )
+    disposal_id = cursor.lastrowid
+    vip_stats_aggregator.record_disposal(cursor, disposal_id, vip_id, waste_type, box_number, timestamp)
+    analytics.record_disposal(cursor, vip_id, waste_type, box_number, timestamp)
+
+    # Update VIP profile disposal count
+    cursor.execute(
+        """UPDATE vip_profiles
+           SET total_disposals = total_disposals + 1
+           WHERE vip_id = ?""",
+        (vip_id,)
+    )
+    return {'disposal_id': disposal_id}
+
+def apply_photo(cursor, event, kiosk_id, batch=None):
+    """Attach a photo uploaded through /save-photo to a rating.
+
+    The rating is `rating_id`, or the rating event named by `rating_key`
+    (earlier in this batch or in a previous one).
+    """
+    _required(event, 'photo_id')
+    rating_id = event.get('rating_id')
+    rating_key = event.get('rating_key')
+    if rating_id is None and rating_key:
+        result = (batch or {}).get(rating_key) or processed_result(cursor, rating_key)
+        if result is None or 'rating_id' not in result:
+            raise EventError(f"Unknown rating_key: {rating_key}")
+        rating_id = result['rating_id']
+
+    cursor.execute("SELECT vip_id, rating_id FROM photos WHERE id = ?", (event['photo_id'],))
+    row = cursor.fetchone()
+    if row is None:
+        raise EventError(f"Unknown photo_id: {event['photo_id']}")
+    vip_id = event['vip_id'] if event.get('vip_id') is not None else row[0]
+
+    cursor.execute(
+        "UPDATE photos SET vip_id = ?, rating_id = COALESCE(?, rating_id) WHERE id = ?",
+        (vip_id, rating_id, event['photo_id'])
+    )
+    # Already counted if /save-photo was given the same rating
+    if rating_id is not None and rating_id != row[1]:
+        cursor.execute("UPDATE ratings SET photo_taken = 1 WHERE id = ?", (rating_id,))
+        vip_stats_aggregator.record_photo(cursor, vip_id, rating_id)
+    return {'photo_id': event['photo_id'], 'rating_id': rating_id}
+
+APPLIERS = {
+    'state': apply_state,
+    'rating': apply_rating,
+    'disposal': apply_disposal,
+    'photo': apply_photo,
+}
+
+def processed_result(cursor, key):
+    cursor.execute("SELECT result FROM processed_events WHERE event_key = ?", (key,))
+    row = cursor.fetchone()
+    return json.loads(row[0]) if row is not None else None
+
+def validate(events):
+    """Reject a batch up front if any event is malformed; nothing is written"""
+    if not isinstance(events, list):
+        raise EventError("events must be a list")
+    if len(events) > MAX_BATCH_EVENTS:
+        raise EventError(f"At most {MAX_BATCH_EVENTS} events per request")
+    for index, event in enumerate(events):
+        if not isinstance(event, dict):
+            raise EventError("Every event must be an object", index)
+        if event.get('type') not in APPLIERS:
+            raise EventError(f"Unknown event type: {event.get('type')}", index)
+        key = event.get('key')
+        if key is not None and not isinstance(key, str):
+            raise EventError("key must be a string", index)
+
+def apply_batch(cursor, events, kiosk_id):
+    """Apply `events` in order within the caller's transaction.
+
+    Returns one result per event: `applied` with the applier's result, or
+    `duplicate` with the result recorded when its key was first applied.
+    An EventError aborts the batch; the caller rolls the transaction back.
+    """
+    validate(events)
+    processed_at = datetime.datetime.now().strftime(TIMESTAMP_FORMAT)
+    batch = {}
+    results = []
+    for index, event in enumerate(events):
+        key = event.get('key')
+        previous = batch.get(key) if key else None
+        if key and previous is None:
+            previous = processed_result(cursor, key)
+        if previous is not None:
+            results.append({'key': key, 'status': 'duplicate', **previous})
+            continue
+
+        try:
+            result = APPLIERS[event['type']](cursor, event, event.get('kiosk_id') or kiosk_id, batch)
+        except EventError as e:
+            e.index = index
+            raise
+
+        if key:
+            batch[key] = result
+            cursor.execute(
+                """INSERT INTO processed_events (event_key, event_type, kiosk_id, result, processed_at)
+                   VALUES (?, ?, ?, ?, ?)""",
+                (key, event['type'], kiosk_id, json.dumps(result), processed_at)
+            )
+        results.append({'key': key, 'status': 'applied', **result})
+    return results
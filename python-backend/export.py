@@ -0,0 +1,141 @@
+# python-backend\export.py
+"""Streaming exports of the history tables.
+
+/export/<table> streams face_data, ratings, waste_disposal or photos as
+NDJSON or CSV. Rows are read in chunks of EXPORT_CHUNK_ROWS with keyset
+pagination on id (`WHERE id > last_id ORDER BY id LIMIT n`), each chunk a
+separate short query on a read-only connection of its own. Memory stays at
+one chunk however many rows are exported, and no read transaction stays
+open between chunks, so the detection writer and WAL checkpoints carry on
+as usual while a long export runs.
+
+A time range is applied to the rows, and also narrowed to an id range
+first through the timestamp index, so a recent range does not scan from the
+first row. An interrupted export resumes with `after_id` set to the last id
+received.
+"""
+
+import csv
+import io
+import json
+
+import db
+from config import EXPORT_CHUNK_ROWS
+from metrics import metrics
+
+# Exportable tables and their columns, in output order
+EXPORT_TABLES = {
+    'face_data': ('id', 'timestamp', 'gender', 'age', 'vip_id', 'detection_confidence', 'kiosk_id'),
+    'ratings': ('id', 'timestamp', 'vip_id', 'rating', 'photo_taken'),
+    'waste_disposal': ('id', 'timestamp', 'vip_id', 'waste_type', 'box_number', 'kiosk_id'),
+    'photos': ('id', 'timestamp', 'vip_id', 'rating_id', 'status', 'photo_path',
+               'thumbnail_path', 'preview_path', 'content_hash'),
+}
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+class ExportQuery:
+    """Validated export parameters for one table"""
+
+    def __init__(self, table, start=None, end=None, after_id=None, limit=None,
+                 chunk_rows=EXPORT_CHUNK_ROWS):
+        if table not in EXPORT_TABLES:
+            raise ValueError(f"table must be one of {', '.join(EXPORT_TABLES)}")
+        try:
+            after_id = int(after_id) if after_id not in (None, '') else 0
+            limit = int(limit) if limit not in (None, '') else None
+        except ValueError:
+            raise ValueError("after_id and limit must be integers")
+        if limit is not None and limit < 0:
+            raise ValueError("limit must not be negative")
+        self.table = table
+        self.columns = EXPORT_TABLES[table]
+        self.start = start or None
+        self.end = end or None
+        self.after_id = after_id
+        self.limit = limit
+        self.chunk_rows = max(1, chunk_rows)
+
+    def _id_bounds(self, conn):
+        """(lowest id - 1, highest id) that can hold rows in the time range"""
+        low, high = self.after_id, None
+        if self.start:
+            first = conn.execute(
+                f"SELECT MIN(id) FROM {self.table} WHERE timestamp >= ?", (self.start,)
+            ).fetchone()[0]
+            if first is None:
+                return None
+            low = max(low, first - 1)
+        if self.end:
+            high = conn.execute(
+                f"SELECT MAX(id) FROM {self.table} WHERE timestamp < ?", (self.end,)
+            ).fetchone()[0]
+            if high is None:
+                return None
+        return low, high
+
+    def chunks(self, path=None):
+        """Lists of row tuples, in id order, one query per chunk"""
+        # Unary + keeps the planner on the id order instead of the timestamp
+        # index, which would need a temp b-tree to sort the whole range
+        where = ['id > ?']
+        params = []
+        if self.start:
+            where.append('+timestamp >= ?')
+            params.append(self.start)
+        if self.end:
+            where.append('+timestamp < ?')
+            params.append(self.end)
+
+        with db.read_only_connection(path) as conn:
+            bounds = self._id_bounds(conn)
+            if bounds is None:
+                return
+            last_id, high = bounds
+            if high is not None:
+                where.append('id <= ?')
+                params.append(high)
+            sql = (f"SELECT {', '.join(self.columns)} FROM {self.table} "
+                   f"WHERE {' AND '.join(where)} ORDER BY id LIMIT ?")
+
+            remaining = self.limit
+            while remaining is None or remaining > 0:
+                size = self.chunk_rows if remaining is None else min(self.chunk_rows, remaining)
+                rows = conn.execute(sql, [last_id] + params + [size]).fetchall()
+                if not rows:
+                    return
+                metrics.inc('ewaste_export_rows_total', len(rows), table=self.table)
+                yield rows
+                if len(rows) < size:
+                    return
+                last_id = rows[-1][0]
+                if remaining is not None:
+                    remaining -= len(rows)
+
+def ndjson_stream(query, path=None):
+    columns = query.columns
+    for rows in query.chunks(path):
+        yield ''.join(json.dumps(dict(zip(columns, row))) + '\n' for row in rows)
+
+def csv_stream(query, path=None):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(query.columns)
+    for rows in query.chunks(path):
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()  # Header only: nothing matched
+
+STREAMS = {'ndjson': ndjson_stream, 'csv': csv_stream}
+
+def export_stream(query, fmt='ndjson', path=None):
+    """(generator of text chunks, mimetype) for `query` in `fmt`"""
+    if fmt not in STREAMS:
+        raise ValueError(f"format must be one of {', '.join(STREAMS)}")
+    return STREAMS[fmt](query, path), FORMATS[fmt]
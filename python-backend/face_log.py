@@ -0,0 +1,165 @@
+# python-backend\face_log.py
+"""Write-behind logging of face detections.
+
+/detect-face only appends a row to an in-memory queue; a background thread
+writes queued rows to face_data in multi-row transactions every
+FACE_LOG_FLUSH_MS or FACE_LOG_BATCH_ROWS rows, whichever comes first, and
+folds each batch into the analytics rollups in the same transaction. The
+queue is bounded: when the disk can't keep up, new rows are dropped and
+counted rather than growing memory or slowing detection.
+
+The newest row of every kiosk is also kept in memory, so /fetch-latest is
+answered without a query and sees rows that are still queued.
+"""
+
+import atexit
+import collections
+import threading
+import time
+import traceback
+
+import analytics
+import db
+from config import FACE_LOG_BATCH_ROWS, FACE_LOG_FLUSH_MS, FACE_LOG_MAX_QUEUE
+from metrics import metrics
+
+INSERT_FACE_DATA = """INSERT INTO face_data (timestamp, gender, age, vip_id, detection_confidence, kiosk_id)
+                      VALUES (?, ?, ?, ?, ?, ?)"""
+
+LATEST_FIELDS = ('timestamp', 'gender', 'age', 'vip_id', 'detection_confidence', 'kiosk_id')
+
+class FaceDataWriter:
+    """Background batch writer for face_data rows"""
+
+    def __init__(self, batch_rows=FACE_LOG_BATCH_ROWS, flush_interval_ms=FACE_LOG_FLUSH_MS,
+                 max_queue=FACE_LOG_MAX_QUEUE):
+        self.batch_rows = max(1, batch_rows)
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_queue = max_queue
+        self._rows = collections.deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self._flush_requested = False
+        self._writing = False
+        self._latest = {}
+
+        # Counters
+        self.queued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+
+    def start(self):
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='face-data-writer', daemon=True)
+            self._thread.start()
+        atexit.register(self.stop)
+
+    def enqueue(self, row):
+        """Queue one face_data row tuple; returns False if it was dropped"""
+        if self._thread is None:
+            self.start()
+        with self._cond:
+            self._latest[row[5]] = row
+            if len(self._rows) >= self.max_queue:
+                self.dropped += 1
+                return False
+            self._rows.append(row)
+            self.queued += 1
+            if len(self._rows) >= self.batch_rows:
+                self._cond.notify()
+        return True
+
+    def latest(self, kiosk_id=None):
+        """Newest row dict for `kiosk_id` (any kiosk if None), or None if none seen since start"""
+        with self._cond:
+            if kiosk_id is not None:
+                row = self._latest.get(kiosk_id)
+            else:
+                # Timestamps are zero-padded, so the string max is the newest
+                row = max(self._latest.values(), key=lambda r: r[0], default=None)
+        return dict(zip(LATEST_FIELDS, row)) if row is not None else None
+
+    def flush(self, timeout=5.0):
+        """Block until everything queued so far has been written"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify()
+            while (self._rows or self._writing) and self._thread is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stop(self, timeout=5.0):
+        """Flush remaining rows and stop the writer thread"""
+        with self._cond:
+            thread = self._thread
+            if thread is None:
+                return
+            self._stopping = True
+            self._cond.notify()
+        thread.join(timeout)
+        with self._cond:
+            self._thread = None
+
+    def _take_batch(self):
+        with self._cond:
+            deadline = time.monotonic() + self.flush_interval
+            while (len(self._rows) < self.batch_rows and not self._stopping
+                   and not self._flush_requested):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            count = min(len(self._rows), self.batch_rows)
+            batch = [self._rows.popleft() for _ in range(count)]
+            # A flush covers every row queued before it, not just this batch
+            if not self._rows:
+                self._flush_requested = False
+            self._writing = bool(batch)
+            return batch, self._stopping and not self._rows
+
+    def _run(self):
+        while True:
+            batch, done = self._take_batch()
+            if batch:
+                self._write(batch)
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+            if done:
+                return
+
+    def _write(self, batch):
+        try:
+            with metrics.stage('db_write'), db.transaction() as cursor:
+                cursor.executemany(INSERT_FACE_DATA, batch)
+                analytics.record_faces(cursor, batch)
+            self.written += len(batch)
+            self.batches += 1
+        except Exception as e:
+            self.failed += len(batch)
+            print(f"Error writing face data batch: {str(e)}")
+            traceback.print_exc()
+
+    def stats(self):
+        return {
+            'queued': self.queued,
+            'pending': len(self._rows),
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'batches': self.batches,
+            'kiosks': len(self._latest),
+        }
+
+face_data_writer = FaceDataWriter()
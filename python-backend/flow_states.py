@@ -0,0 +1,116 @@
+# python-backend\flow_states.py
+"""Active kiosk flow state per VIP.
+
+The active state for each VIP lives in memory and is the source for
+/get-vip-state; every change is written through to vip_flow_states, which
+keeps the full history. The map is rebuilt from the table on startup.
+"""
+
+import datetime
+import threading
+
+import db
+
+def vip_key(vip_id):
+    """Normalize ids from JSON (int) and query strings (str) to one key"""
+    try:
+        return int(vip_id)
+    except (TypeError, ValueError):
+        return vip_id
+
+class FlowStateStore:
+    """In-process map of each VIP's active flow state, written through to SQLite"""
+
+    def __init__(self):
+        self._active = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Rebuild the map from the active rows in vip_flow_states"""
+        rows = db.query_all(
+            """SELECT vip_id, flow_state, selected_box, selected_rating, timestamp, kiosk_id
+               FROM vip_flow_states
+               WHERE is_active = 1
+               ORDER BY id"""
+        )
+        active = {}
+        for vip_id, flow_state, selected_box, selected_rating, timestamp, kiosk_id in rows:
+            # Later rows win if an old database has several active rows per VIP
+            active[vip_key(vip_id)] = {
+                'flow_state': flow_state,
+                'selected_box': selected_box,
+                'selected_rating': selected_rating,
+                'timestamp': timestamp,
+                'kiosk_id': kiosk_id
+            }
+        with self._lock:
+            self._active = active
+            self._loaded = True
+        return len(active)
+
+    def get(self, vip_id):
+        """Active state dict for `vip_id`, or None"""
+        if not self._loaded:
+            self.load()
+        return self._active.get(vip_key(vip_id))
+
+    def save(self, vip_id, flow_state, selected_box='', selected_rating=0, kiosk_id=None):
+        """Record a new active state for `vip_id` (history row + active map)"""
+        state = self._state(flow_state, selected_box, selected_rating, kiosk_id)
+
+        if not self._loaded:
+            self.load()
+
+        # Serialize writers so the map is updated in commit order
+        with self._lock:
+            with db.transaction() as cursor:
+                self._write(cursor, vip_id, state)
+            self._active[vip_key(vip_id)] = state
+        return state
+
+    def record(self, cursor, vip_id, flow_state, selected_box='', selected_rating=0,
+               kiosk_id=None, timestamp=None):
+        """Write a new active state within the caller's transaction; the map
+        is updated once it commits"""
+        state = self._state(flow_state, selected_box, selected_rating, kiosk_id, timestamp)
+
+        if not self._loaded:
+            self.load()
+
+        self._write(cursor, vip_id, state)
+
+        def activate():
+            with self._lock:
+                self._active[vip_key(vip_id)] = state
+        cursor.on_commit.append(activate)
+        return state
+
+    @staticmethod
+    def _state(flow_state, selected_box, selected_rating, kiosk_id, timestamp=None):
+        return {
+            'flow_state': flow_state,
+            'selected_box': selected_box,
+            'selected_rating': selected_rating,
+            'timestamp': timestamp or datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'kiosk_id': kiosk_id
+        }
+
+    @staticmethod
+    def _write(cursor, vip_id, state):
+        # Deactivate the previous state for this VIP (indexed on vip_id, is_active)
+        cursor.execute(
+            "UPDATE vip_flow_states SET is_active = 0 WHERE vip_id = ? AND is_active = 1",
+            (vip_id,)
+        )
+
+        # Insert new state
+        cursor.execute(
+            """INSERT INTO vip_flow_states
+               (vip_id, flow_state, selected_box, selected_rating, timestamp, kiosk_id, is_active)
+               VALUES (?, ?, ?, ?, ?, ?, 1)""",
+            (vip_id, state['flow_state'], state['selected_box'],
+             state['selected_rating'], state['timestamp'], state['kiosk_id'])
+        )
+
+flow_state_store = FlowStateStore()
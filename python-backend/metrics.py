@@ -0,0 +1,239 @@
+# python-backend\metrics.py
+"""In-process metrics and logging setup.
+
+Stage timings (decode, grayscale, detect, classify, ...), request latencies
+and model load times are kept as fixed-bucket histograms and gauges in one
+registry and rendered on /metrics in the Prometheus text format. Queue
+depths are gauges read from their owners at scrape time, so nothing is
+polled in between.
+
+Detection worker processes have their own copy of this module. While a
+worker handles a frame its observations are captured instead of recorded
+and sent back with the result, so the server's /metrics covers them too.
+"""
+
+import bisect
+import contextlib
+import logging
+import threading
+import time
+
+from config import LOG_LEVEL
+
+# Upper bounds in seconds, from sub-millisecond stages to slow requests
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s %(message)s'
+
+def configure_logging(level=LOG_LEVEL):
+    """Root logging setup for the server and worker processes"""
+    logging.basicConfig(level=getattr(logging, level, logging.INFO), format=LOG_FORMAT)
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in labels.values())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + '}'
+
+def _format_value(value):
+    return repr(float(value)) if not isinstance(value, int) else str(value)
+
+class Histogram:
+    """Cumulative-bucket histogram of one labelled series"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+    def quantile(self, q):
+        """Approximate quantile: upper bound of the bucket holding it"""
+        counts, _, count = self.snapshot()
+        if not count:
+            return None
+        rank = q * count
+        seen = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            seen += bucket_count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+class MetricsRegistry:
+    """Histograms, counters and gauges keyed by (name, labels)"""
+
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._values = {}
+        self._gauges = {}
+        self._help = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def _histogram(self, name, labels):
+        key = (name, tuple(labels.items()))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram())
+        return histogram
+
+    def observe(self, name, value, **labels):
+        captured = getattr(self._local, 'captured', None)
+        if captured is not None:
+            captured.append(('observe', name, value, labels))
+            return
+        self._histogram(name, labels).observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        captured = getattr(self._local, 'captured', None)
+        if captured is not None:
+            captured.append(('inc', name, amount, labels))
+            return
+        key = (name, tuple(labels.items()))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        self._values[(name, tuple(labels.items()))] = value
+
+    def gauge(self, name, read, **labels):
+        """Register `read()` as the current value of a gauge, read at scrape time"""
+        self._gauges[(name, tuple(labels.items()))] = read
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def stage(self, stage):
+        """Time one pipeline stage into ewaste_stage_seconds"""
+        return self.timer('ewaste_stage_seconds', stage=stage)
+
+    @contextlib.contextmanager
+    def capture(self):
+        """Collect this thread's observations in a list instead of recording them"""
+        captured = self._local.captured = []
+        try:
+            yield captured
+        finally:
+            self._local.captured = None
+
+    def merge(self, observations):
+        """Record observations captured in another process"""
+        for kind, name, value, labels in observations or ():
+            if kind == 'inc':
+                self.inc(name, value, **labels)
+            else:
+                self._histogram(name, labels).observe(value)
+
+    def counters(self, name):
+        """{labels tuple: value} of one counter"""
+        return {labels: value for (key, labels), value in list(self._counters.items()) if key == name}
+
+    def _gauge_values(self):
+        values = dict(self._values)
+        for key, read in list(self._gauges.items()):
+            try:
+                values[key] = read()
+            except Exception:
+                continue  # Owner not ready yet; leave the series out
+        return values
+
+    def render(self):
+        """All series in the Prometheus text exposition format"""
+        lines = []
+        seen = set()
+
+        def header(name, kind):
+            if name in seen:
+                return
+            seen.add(name)
+            if name in self._help:
+                lines.append(f'# HELP {name} {self._help[name]}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        for (name, labels), histogram in sorted(self._histograms.items()):
+            header(name, 'histogram')
+            labels = dict(labels)
+            counts, total, count = histogram.snapshot()
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{_label_text({**labels, "le": repr(bound)})} {cumulative}')
+            lines.append(f'{name}_bucket{_label_text({**labels, "le": "+Inf"})} {count}')
+            lines.append(f'{name}_sum{_label_text(labels)} {_format_value(total)}')
+            lines.append(f'{name}_count{_label_text(labels)} {count}')
+
+        for (name, labels), value in sorted(self._counters.items()):
+            header(name, 'counter')
+            lines.append(f'{name}{_label_text(dict(labels))} {_format_value(value)}')
+
+        for (name, labels), value in sorted(self._gauge_values().items()):
+            if value is None:
+                continue
+            header(name, 'gauge')
+            lines.append(f'{name}{_label_text(dict(labels))} {_format_value(value)}')
+
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """Per-stage count, mean and p95 (ms) for /health"""
+        stages = {}
+        for (name, labels), histogram in list(self._histograms.items()):
+            if name != 'ewaste_stage_seconds':
+                continue
+            _, total, count = histogram.snapshot()
+            if not count:
+                continue
+            p95 = histogram.quantile(0.95)
+            stages[dict(labels)['stage']] = {
+                'count': count,
+                'mean_ms': round(total / count * 1000, 3),
+                'p95_ms': round(p95 * 1000, 3) if p95 != float('inf') else None,
+            }
+        return {
+            'stages': stages,
+            'motion_gate': {
+                dict(labels)['outcome']: value
+                for labels, value in self.counters('ewaste_motion_gate_frames_total').items()
+            },
+            'model_load_seconds': {
+                dict(labels)['model']: round(value, 3)
+                for (name, labels), value in self._values.items()
+                if name == 'ewaste_model_load_seconds'
+            },
+        }
+
+metrics = MetricsRegistry()
+
+metrics.describe('ewaste_stage_seconds', 'Time spent in each detection/storage stage.')
+metrics.describe('ewaste_http_request_seconds', 'HTTP request latency by endpoint.')
+metrics.describe('ewaste_http_requests_total', 'HTTP requests by endpoint, method and status.')
+metrics.describe('ewaste_queue_depth', 'Items waiting in internal queues.')
+metrics.describe('ewaste_model_load_seconds', 'Time taken to load each model at startup.')
+metrics.describe('ewaste_motion_gate_frames_total', 'Frames detected or skipped by the motion gate.')
+metrics.describe('ewaste_export_rows_total', 'Rows streamed by /export, by table.')
+metrics.describe('ewaste_shed_frames_total', 'Frames refused by load shedding, by reason.')
+metrics.describe('ewaste_detection_timeouts_total', 'Frames answered with a timeout, queued or already running.')
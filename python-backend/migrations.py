@@ -0,0 +1,368 @@
+# python-backend\migrations.py
+"""Versioned, non-destructive schema migrations.
+
+schema_version records every migration that has been applied. On startup
+migrate() reads the current version and runs only the newer migrations, each
+in its own transaction together with its version row, so an interrupted
+upgrade resumes where it stopped and an up-to-date database costs one query.
+Migrations only ever add tables, columns and indexes; existing rows are kept.
+Each migration carries its own SQL rather than calling the modules that use
+the tables, so what a version does stays fixed as that code changes.
+
+Indexes on the large history tables are listed in BACKGROUND_INDEXES instead
+and built by a background thread after startup. SQLite builds an index under
+the write lock, so writers wait for each build, but the server is already
+answering requests while it runs.
+"""
+
+import datetime
+import threading
+import traceback
+
+import db
+
+def _base_tables(cursor):
+    # Face detection data table with correct columns
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS face_data (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT,
+        gender TEXT,
+        age INTEGER,
+        vip_id INTEGER DEFAULT NULL,
+        detection_confidence REAL DEFAULT 0.0
+    )''')
+
+    # VIP flow states table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS vip_flow_states (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        vip_id INTEGER,
+        flow_state TEXT,
+        selected_box TEXT,
+        selected_rating INTEGER,
+        timestamp TEXT,
+        is_active BOOLEAN DEFAULT 1
+    )''')
+
+    # Feedback/ratings table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS ratings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        vip_id INTEGER,
+        rating INTEGER,
+        timestamp TEXT,
+        photo_taken BOOLEAN DEFAULT 0
+    )''')
+
+    # Photos table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS photos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        vip_id INTEGER,
+        photo_path TEXT,
+        timestamp TEXT,
+        rating_id INTEGER,
+        FOREIGN KEY (rating_id) REFERENCES ratings (id)
+    )''')
+
+    # Waste disposal records
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS waste_disposal (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        vip_id INTEGER,
+        waste_type TEXT,
+        box_number TEXT,
+        timestamp TEXT
+    )''')
+
+    # VIP profile table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS vip_profiles (
+        vip_id INTEGER PRIMARY KEY,
+        name TEXT,
+        gender TEXT,
+        age INTEGER,
+        registration_date TEXT,
+        total_disposals INTEGER DEFAULT 0,
+        average_rating REAL DEFAULT 0.0
+    )''')
+
+def _face_data_columns(cursor):
+    # Databases from before the VIP/confidence columns were added used to be
+    # dropped and recreated on every start; add the columns in place instead
+    add_column(cursor, 'face_data', 'vip_id', 'INTEGER DEFAULT NULL')
+    add_column(cursor, 'face_data', 'detection_confidence', 'REAL DEFAULT 0.0')
+
+def _flow_state_index(cursor):
+    # Active-state and per-VIP history lookups
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_vip_flow_states_vip_active
+    ON vip_flow_states (vip_id, is_active, timestamp)''')
+
+def _photo_pipeline_columns(cursor):
+    # Rows from before the async pipeline were written synchronously: 'stored'
+    add_column(cursor, 'photos', 'content_hash', 'TEXT')
+    add_column(cursor, 'photos', 'status', "TEXT DEFAULT 'stored'")
+    add_column(cursor, 'photos', 'thumbnail_path', 'TEXT')
+    add_column(cursor, 'photos', 'preview_path', 'TEXT')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_photos_status ON photos (status)")
+
+def _kiosk_columns(cursor):
+    # NULL on rows from before multi-kiosk support
+    add_column(cursor, 'face_data', 'kiosk_id', 'TEXT')
+    add_column(cursor, 'vip_flow_states', 'kiosk_id', 'TEXT')
+    add_column(cursor, 'waste_disposal', 'kiosk_id', 'TEXT')
+
+def _vip_stats(cursor):
+    # Per-VIP running totals, filled from the raw history once
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS vip_stats (
+        vip_id INTEGER NOT NULL,
+        total_disposals INTEGER DEFAULT 0,
+        rating_count INTEGER DEFAULT 0,
+        rating_sum REAL DEFAULT 0,
+        last_disposal TEXT,
+        last_rating TEXT,
+        PRIMARY KEY (vip_id)
+    ) WITHOUT ROWID''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS vip_waste_counts (
+        vip_id INTEGER NOT NULL,
+        waste_type TEXT NOT NULL,
+        count INTEGER DEFAULT 0,
+        PRIMARY KEY (vip_id, waste_type)
+    ) WITHOUT ROWID''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS vip_box_counts (
+        vip_id INTEGER NOT NULL,
+        box_number TEXT NOT NULL,
+        count INTEGER DEFAULT 0,
+        PRIMARY KEY (vip_id, box_number)
+    ) WITHOUT ROWID''')
+
+    # Per-VIP history lookups for filling the ring buffers
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_waste_disposal_vip ON waste_disposal (vip_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_ratings_vip ON ratings (vip_id)')
+
+    cursor.execute('DELETE FROM vip_stats')
+    cursor.execute('DELETE FROM vip_waste_counts')
+    cursor.execute('DELETE FROM vip_box_counts')
+    cursor.execute(
+        """INSERT INTO vip_stats (vip_id, total_disposals, last_disposal)
+           SELECT vip_id, COUNT(*), MAX(timestamp)
+           FROM waste_disposal
+           WHERE vip_id IS NOT NULL
+           GROUP BY vip_id"""
+    )
+    cursor.execute(
+        """INSERT INTO vip_stats (vip_id, rating_count, rating_sum, last_rating)
+           SELECT vip_id, COUNT(rating), COALESCE(SUM(rating), 0), MAX(timestamp)
+           FROM ratings
+           WHERE vip_id IS NOT NULL
+           GROUP BY vip_id
+           ON CONFLICT (vip_id) DO UPDATE SET
+               rating_count = excluded.rating_count,
+               rating_sum = excluded.rating_sum,
+               last_rating = excluded.last_rating"""
+    )
+    cursor.execute(
+        """INSERT INTO vip_waste_counts (vip_id, waste_type, count)
+           SELECT vip_id, COALESCE(waste_type, ''), COUNT(*)
+           FROM waste_disposal
+           WHERE vip_id IS NOT NULL
+           GROUP BY vip_id, COALESCE(waste_type, '')"""
+    )
+    cursor.execute(
+        """INSERT INTO vip_box_counts (vip_id, box_number, count)
+           SELECT vip_id, COALESCE(box_number, ''), COUNT(*)
+           FROM waste_disposal
+           WHERE vip_id IS NOT NULL
+           GROUP BY vip_id, COALESCE(box_number, '')"""
+    )
+    cursor.execute(
+        """UPDATE vip_profiles
+           SET average_rating = (
+               SELECT rating_sum / rating_count FROM vip_stats
+               WHERE vip_stats.vip_id = vip_profiles.vip_id
+           )
+           WHERE vip_id IN (SELECT vip_id FROM vip_stats WHERE rating_count > 0)"""
+    )
+
+# Bucket start and age band as analytics computed them when migration 5 was
+# written; a later change to the live buckets or bands must not alter it
+_ROLLUP_BUCKETS = (
+    ('minute', "substr(timestamp, 1, 16) || ':00'"),
+    ('hour', "substr(timestamp, 1, 13) || ':00:00'"),
+    ('day', "substr(timestamp, 1, 10) || ' 00:00:00'"),
+)
+_ROLLUP_AGE_BAND = (
+    "CASE WHEN age >= 65 THEN '65+' WHEN age >= 55 THEN '55-64' WHEN age >= 45 THEN '45-54' "
+    "WHEN age >= 35 THEN '35-44' WHEN age >= 25 THEN '25-34' WHEN age >= 18 THEN '18-24' "
+    "WHEN age >= 1 THEN '0-17' ELSE 'unknown' END"
+)
+
+def _analytics_rollups(cursor):
+    # Minute/hour/day counters; vip_id -1 stands in for NULL in the key
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS face_rollup (
+        bucket TEXT NOT NULL,
+        bucket_start TEXT NOT NULL,
+        gender TEXT NOT NULL,
+        age_band TEXT NOT NULL,
+        vip_id INTEGER NOT NULL,
+        count INTEGER DEFAULT 0,
+        aged_count INTEGER DEFAULT 0,
+        age_sum INTEGER DEFAULT 0,
+        PRIMARY KEY (bucket, bucket_start, gender, age_band, vip_id)
+    ) WITHOUT ROWID''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS disposal_rollup (
+        bucket TEXT NOT NULL,
+        bucket_start TEXT NOT NULL,
+        box_number TEXT NOT NULL,
+        waste_type TEXT NOT NULL,
+        vip_id INTEGER NOT NULL,
+        count INTEGER DEFAULT 0,
+        PRIMARY KEY (bucket, bucket_start, box_number, waste_type, vip_id)
+    ) WITHOUT ROWID''')
+
+    cursor.execute('DELETE FROM face_rollup')
+    cursor.execute('DELETE FROM disposal_rollup')
+    for size, start in _ROLLUP_BUCKETS:
+        cursor.execute(
+            f"""INSERT INTO face_rollup
+                    (bucket, bucket_start, gender, age_band, vip_id, count, aged_count, age_sum)
+                SELECT ?, {start}, COALESCE(gender, ''), {_ROLLUP_AGE_BAND}, COALESCE(vip_id, -1),
+                       COUNT(*), SUM(age >= 1), SUM(CASE WHEN age >= 1 THEN age ELSE 0 END)
+                FROM face_data
+                WHERE timestamp IS NOT NULL
+                GROUP BY 2, 3, 4, 5""",
+            (size,)
+        )
+        cursor.execute(
+            f"""INSERT INTO disposal_rollup (bucket, bucket_start, box_number, waste_type, vip_id, count)
+                SELECT ?, {start}, COALESCE(box_number, ''), COALESCE(waste_type, ''),
+                       COALESCE(vip_id, -1), COUNT(*)
+                FROM waste_disposal
+                WHERE timestamp IS NOT NULL
+                GROUP BY 2, 3, 4, 5""",
+            (size,)
+        )
+
+def _processed_events(cursor):
+    # Idempotency keys of applied events, with the result to answer retries
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS processed_events (
+        event_key TEXT PRIMARY KEY,
+        event_type TEXT,
+        kiosk_id TEXT,
+        result TEXT,
+        processed_at TEXT
+    ) WITHOUT ROWID''')
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_processed_events_time ON processed_events (processed_at)"
+    )
+
+# (version, name, function); append only, never renumber or edit applied ones
+MIGRATIONS = [
+    (1, 'base tables', _base_tables),
+    (2, 'face_data vip/confidence columns', _face_data_columns),
+    (3, 'vip_flow_states active index', _flow_state_index),
+    (4, 'vip statistics aggregates', _vip_stats),
+    (5, 'analytics rollups', _analytics_rollups),
+    (6, 'photo pipeline columns', _photo_pipeline_columns),
+    (7, 'kiosk columns', _kiosk_columns),
+    (8, 'processed event keys', _processed_events),
+]
+
+# (name, table, columns); built after startup by build_indexes_in_background()
+BACKGROUND_INDEXES = [
+    ('idx_face_data_timestamp', 'face_data', 'timestamp'),
+    ('idx_waste_disposal_timestamp', 'waste_disposal', 'timestamp'),
+    ('idx_ratings_timestamp', 'ratings', 'timestamp'),
+    ('idx_photos_timestamp', 'photos', 'timestamp'),
+    ('idx_face_data_kiosk', 'face_data', 'kiosk_id, id'),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def add_column(cursor, table, column, definition):
+    """ALTER TABLE ADD COLUMN unless `table` already has `column`"""
+    cursor.execute(f'PRAGMA table_info({table})')
+    if column not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+def _ensure_version_table(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name TEXT,
+        applied_at TEXT
+    )''')
+
+def current_version(cursor):
+    cursor.execute('SELECT MAX(version) FROM schema_version')
+    return cursor.fetchone()[0] or 0
+
+def migrate():
+    """Apply pending migrations in order; returns the list of versions applied"""
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'")
+        if cursor.fetchone() is not None and current_version(cursor) >= LATEST_VERSION:
+            return []
+
+    with db.transaction() as cursor:
+        _ensure_version_table(cursor)
+
+    applied = []
+    for version, name, migration in MIGRATIONS:
+        with db.transaction() as cursor:
+            # Re-checked under the write lock in case another process got here first
+            if current_version(cursor) >= version:
+                continue
+            migration(cursor)
+            cursor.execute(
+                "INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)",
+                (version, name, datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            )
+        print(f"Applied migration {version}: {name}")
+        applied.append(version)
+    return applied
+
+def missing_indexes():
+    rows = db.query_all("SELECT name FROM sqlite_master WHERE type = 'index'")
+    existing = {name for name, in rows}
+    return [index for index in BACKGROUND_INDEXES if index[0] not in existing]
+
+def build_indexes():
+    """Create every missing background index, one transaction each"""
+    for name, table, columns in missing_indexes():
+        try:
+            with db.transaction() as cursor:
+                cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})')
+            print(f"Built index {name}")
+        except Exception as e:
+            print(f"Error building index {name}: {str(e)}")
+            traceback.print_exc()
+
+def status():
+    with db.connection() as conn:
+        version = current_version(conn.cursor())
+    return {
+        'version': version,
+        'latest': LATEST_VERSION,
+        'pending_indexes': [name for name, _, _ in missing_indexes()],
+    }
+
+def build_indexes_in_background():
+    """Start build_indexes() on a daemon thread if any index is missing"""
+    if not missing_indexes():
+        return None
+    thread = threading.Thread(target=build_indexes, name='index-builder', daemon=True)
+    thread.start()
+    return thread
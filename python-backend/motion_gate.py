@@ -0,0 +1,115 @@
+# python-backend\motion_gate.py
+"""Skip detection on frames where nothing has changed.
+
+Most frames show an empty, static scene. Before a frame is decoded in full,
+a small grayscale thumbnail is taken (for JPEGs, libjpeg's 1/8 scaled decode,
+which skips most of the work) and compared with the thumbnail of the last
+frame that was actually detected for the same kiosk. If the difference is
+below the thresholds, the kiosk's previous result is returned again, marked
+`gated`; for an empty scene that is the "No face detected" answer.
+
+The reference only moves when a frame is detected, so slow drift (lighting,
+someone creeping in) adds up until it passes the threshold, and every
+MOTION_MAX_SKIPS gated frames a detection is forced regardless.
+"""
+
+import threading
+
+import cv2
+import numpy as np
+
+from config import (
+    MOTION_MAX_SKIPS, MOTION_MIN_CHANGE, MOTION_PIXEL_DELTA, MOTION_THUMB_WIDTH,
+)
+from metrics import metrics
+
+class StreamReference:
+    def __init__(self, thumbnail, result):
+        self.thumbnail = thumbnail
+        self.result = result
+        self.skips = 0
+
+class MotionGate:
+    """Per-kiosk frame differencing against the last detected frame"""
+
+    def __init__(self, thumb_width=MOTION_THUMB_WIDTH, pixel_delta=MOTION_PIXEL_DELTA,
+                 min_change=MOTION_MIN_CHANGE, max_skips=MOTION_MAX_SKIPS):
+        self.thumb_width = thumb_width
+        self.pixel_delta = pixel_delta
+        self.min_change = min_change
+        self.max_skips = max_skips
+        self._streams = {}
+        self._lock = threading.Lock()
+
+        # Counters
+        self.detected = 0
+        self.skipped = 0
+
+    def _shrink(self, gray):
+        height, width = gray.shape[:2]
+        if width <= self.thumb_width:
+            # The thumbnail is kept as the next reference; gray may be a reused buffer
+            return gray.copy()
+        size = (self.thumb_width, max(1, int(height * self.thumb_width / width)))
+        return cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+
+    def thumbnail(self, img=None, encoded=None):
+        """Grayscale thumbnail of a decoded `img` or of `encoded` JPEG/PNG bytes"""
+        if encoded is not None:
+            img = cv2.imdecode(encoded, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+            if img is None:
+                return None
+        elif img is None or img.size == 0:
+            return None
+        elif img.ndim == 3:
+            # Decimate before the colour conversion; the thumbnail is tiny anyway
+            step = max(1, img.shape[1] // (self.thumb_width * 4))
+            img = cv2.cvtColor(np.ascontiguousarray(img[::step, ::step]), cv2.COLOR_BGR2GRAY)
+        return self._shrink(img)
+
+    def changed_fraction(self, reference, thumbnail):
+        if reference.shape != thumbnail.shape:
+            return 1.0
+        diff = cv2.absdiff(reference, thumbnail)
+        return np.count_nonzero(diff > self.pixel_delta) / diff.size
+
+    def check(self, kiosk_id, thumbnail):
+        """Previous result for `kiosk_id` if the scene is unchanged, else None"""
+        if thumbnail is None:
+            return None
+        with self._lock:
+            reference = self._streams.get(kiosk_id)
+            if (reference is None or reference.skips >= self.max_skips
+                    or self.changed_fraction(reference.thumbnail, thumbnail) >= self.min_change):
+                self.detected += 1
+                metrics.inc('ewaste_motion_gate_frames_total', outcome='detected')
+                return None
+            reference.skips += 1
+            self.skipped += 1
+        metrics.inc('ewaste_motion_gate_frames_total', outcome='skipped')
+        result = dict(reference.result)
+        result['gated'] = True
+        return result
+
+    def update(self, kiosk_id, thumbnail, result):
+        """Make this detected frame the kiosk's new reference"""
+        if thumbnail is None or (result.get('error') and result.get('error') != 'No face detected'):
+            return  # Failed frames are no reference
+        with self._lock:
+            self._streams[kiosk_id] = StreamReference(thumbnail, result)
+
+    def reset(self, kiosk_id=None):
+        with self._lock:
+            if kiosk_id is None:
+                self._streams.clear()
+            else:
+                self._streams.pop(kiosk_id, None)
+
+    def stats(self):
+        return {
+            'detected': self.detected,
+            'skipped': self.skipped,
+            'streams': len(self._streams),
+        }
+
+motion_gate = MotionGate()
@@ -0,0 +1,139 @@
+# python-backend\pacing.py
+"""Pacing hints for kiosk clients, and load shedding.
+
+Detection capacity is about `concurrency / service_time` frames per second,
+where service_time is the scheduler's running average per frame (decode,
+gate, detection, classification; it already reflects how big the frames
+are and how many the motion gate skips). Shared fairly between the kiosks
+that sent frames recently, with PACING_HEADROOM to spare, that gives each
+kiosk the interval it is asked to send at.
+
+While the interval fits between PACING_MIN_INTERVAL_MS and the maximum, only
+the rate changes. `load` measures how far towards PACING_MAX_INTERVAL_MS it
+has had to go; past half of that, frames are also asked to be narrower and
+more compressed, which shortens the service time and brings the interval
+back down.
+
+Frames are refused up front (429, or a `skipped` message on the stream)
+when the frames already queued would take longer than PACING_SHED_WAIT_MS,
+or when a kiosk sends well ahead of its interval while frames are queueing.
+The early rule waits for WARMUP_FRAMES measurements: the first frame (cold
+caches, lazy model init) is much slower than the rest and would otherwise
+make an idle server look loaded.
+"""
+
+import math
+import threading
+import time
+
+from config import (
+    PACING_ENABLED, PACING_HEADROOM, PACING_MAX_FRAME_WIDTH, PACING_MAX_INTERVAL_MS,
+    PACING_MAX_JPEG_QUALITY, PACING_MIN_FRAME_WIDTH, PACING_MIN_INTERVAL_MS,
+    PACING_MIN_JPEG_QUALITY, PACING_SHED_WAIT_MS,
+)
+from metrics import metrics
+from scheduler import frame_scheduler
+
+# Kiosks count as active if they sent a frame within this many seconds
+ACTIVE_WINDOW = 5.0
+
+# Load above which width and quality start to drop
+DEGRADE_FROM = 0.5
+
+# A loaded kiosk is refused when it sends sooner than this share of its interval
+EARLY_FRACTION = 0.5
+
+# Processed frames before the service time is trusted for the early rule
+WARMUP_FRAMES = 10
+
+def _between(high, low, fraction):
+    return high - (high - low) * fraction
+
+class PacingController:
+    """Turns scheduler measurements into per-kiosk pacing hints"""
+
+    def __init__(self, scheduler, enabled=PACING_ENABLED,
+                 min_interval_ms=PACING_MIN_INTERVAL_MS, max_interval_ms=PACING_MAX_INTERVAL_MS,
+                 headroom=PACING_HEADROOM, shed_wait_ms=PACING_SHED_WAIT_MS):
+        self.scheduler = scheduler
+        self.enabled = enabled
+        self.min_interval = min_interval_ms / 1000
+        self.max_interval = max(max_interval_ms / 1000, self.min_interval)
+        self.headroom = headroom
+        self.shed_wait = shed_wait_ms / 1000
+        self._last_frame = {}
+        self._lock = threading.Lock()
+
+        # Counters
+        self.shed = 0
+
+    def _interval(self):
+        """(interval seconds, load 0..1) for each active kiosk"""
+        service_time = self.scheduler.service_time
+        if service_time is None:
+            return self.min_interval, 0.0
+        streams = max(1, self.scheduler.active_streams(ACTIVE_WINDOW))
+        needed = streams * service_time / self.scheduler.concurrency * self.headroom
+        interval = min(max(needed, self.min_interval), self.max_interval)
+        if self.max_interval == self.min_interval:
+            return interval, 1.0 if needed > self.max_interval else 0.0
+        load = (needed - self.min_interval) / (self.max_interval - self.min_interval)
+        return interval, min(max(load, 0.0), 1.0)
+
+    def hints(self):
+        """Interval, max frame width and JPEG quality clients should use"""
+        interval, load = self._interval()
+        degrade = max(0.0, (load - DEGRADE_FROM) / (1 - DEGRADE_FROM))
+        return {
+            'interval_ms': int(math.ceil(interval * 1000)),
+            'max_width': int(_between(PACING_MAX_FRAME_WIDTH, PACING_MIN_FRAME_WIDTH, degrade)),
+            'jpeg_quality': round(_between(PACING_MAX_JPEG_QUALITY, PACING_MIN_JPEG_QUALITY, degrade), 2),
+            'load': round(load, 2),
+        }
+
+    def admit(self, kiosk_id):
+        """None to go ahead with the frame, or the hints to refuse it with"""
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            last, self._last_frame[kiosk_id] = self._last_frame.get(kiosk_id), now
+            if len(self._last_frame) > 1000:
+                self._last_frame = {kiosk_id: now}
+
+        service_time = self.scheduler.service_time
+        if service_time is None:
+            return None
+        queue_wait = self.scheduler.waiting() * service_time / self.scheduler.concurrency
+        hints = self.hints()
+        early = (last is not None and hints['load'] > 0
+                 and self.scheduler.service_samples >= WARMUP_FRAMES
+                 and self.scheduler.waiting() > 0
+                 and now - last < hints['interval_ms'] / 1000 * EARLY_FRACTION)
+        if queue_wait <= self.shed_wait and not early:
+            return None
+
+        self.shed += 1
+        metrics.inc('ewaste_shed_frames_total', reason='queue' if queue_wait > self.shed_wait else 'early')
+        return hints
+
+    def shed_result(self, hints):
+        """Detection-shaped answer for a refused frame"""
+        return {
+            "gender": "Unknown", "age": 0,
+            "error": "Server busy", "skipped": True, "shed": True,
+            "pacing": hints,
+        }
+
+    def stats(self):
+        service_time = self.scheduler.service_time
+        return {
+            'enabled': self.enabled,
+            'service_ms': round(service_time * 1000, 2) if service_time is not None else None,
+            'active_streams': self.scheduler.active_streams(ACTIVE_WINDOW),
+            'waiting': self.scheduler.waiting(),
+            'shed': self.shed,
+            'hints': self.hints(),
+        }
+
+pacing = PacingController(frame_scheduler)
@@ -0,0 +1,199 @@
+# python-backend\photo_store.py
+"""Asynchronous, content-addressed photo storage.
+
+/save-photo records the photo row as 'pending' and hands the decoded bytes
+to a small worker pool, so the request never waits on the disk. Files are
+named after the SHA-256 of their content and sharded by its first two hex
+digits:
+
+    PHOTOS_DIR/ab/ab12...ef.jpg          original capture
+    PHOTOS_DIR/ab/ab12...ef_thumb.jpg    PHOTO_THUMBNAIL_WIDTH wide
+    PHOTOS_DIR/ab/ab12...ef_preview.jpg  PHOTO_PREVIEW_WIDTH wide
+
+Every file is written to a temp file and renamed into place, so a crash
+never leaves a half-written JPEG, and identical captures share one file
+instead of overwriting each other. When a worker is done the row becomes
+'stored' (or 'failed'). Rows still 'pending' at startup are finished from
+the file if it made it to disk.
+"""
+
+import atexit
+import hashlib
+import os
+import queue
+import threading
+import traceback
+
+import db
+from config import (
+    PHOTO_MAX_QUEUE, PHOTO_PREVIEW_WIDTH, PHOTO_THUMBNAIL_WIDTH,
+    PHOTO_VARIANT_QUALITY, PHOTO_WORKERS, PHOTOS_DIR,
+)
+
+# (suffix, max width, photos column)
+VARIANTS = (
+    ('thumb', PHOTO_THUMBNAIL_WIDTH, 'thumbnail_path'),
+    ('preview', PHOTO_PREVIEW_WIDTH, 'preview_path'),
+)
+
+def content_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+def content_path(digest, variant=None, photos_dir=PHOTOS_DIR):
+    name = digest if variant is None else f'{digest}_{variant}'
+    return os.path.join(photos_dir, digest[:2], name + '.jpg')
+
+def is_variant(path):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return any(stem.endswith(f'_{suffix}') for suffix, _, _ in VARIANTS)
+
+def variant_paths(path):
+    """Existing variant files of the original at `path`"""
+    stem, ext = os.path.splitext(path)
+    paths = [f'{stem}_{suffix}{ext}' for suffix, _, _ in VARIANTS]
+    return [p for p in paths if os.path.exists(p)]
+
+def write_file_atomic(path, data, tag=''):
+    """Write `data` to `path` via a temp file + rename"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Unique temp name so two workers storing the same content don't collide
+    tmp_path = f'{path}.{tag or threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+class PhotoPipeline:
+    """Worker pool that stores photos and renders their variants"""
+
+    def __init__(self, workers=PHOTO_WORKERS, max_queue=PHOTO_MAX_QUEUE):
+        self.workers = max(1, workers)
+        self._jobs = queue.Queue(maxsize=max(1, max_queue))
+        self._threads = []
+        self._lock = threading.Lock()
+
+        # Counters
+        self.submitted = 0
+        self.stored = 0
+        self.failed = 0
+        self.inline = 0
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'photo-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        atexit.register(self.stop)
+        self.recover()
+
+    def submit(self, photo_id, data, path):
+        """Queue a photo for storage; `data` None means the file is already on disk"""
+        if not self._threads:
+            self.start()
+        self.submitted += 1
+        try:
+            self._jobs.put_nowait((photo_id, data, path))
+        except queue.Full:
+            # Never drop a capture: store it on the request thread instead
+            self.inline += 1
+            self._process(photo_id, data, path)
+
+    def recover(self):
+        """Finish photos left 'pending' by a previous run"""
+        rows = db.query_all("SELECT id, photo_path FROM photos WHERE status = 'pending'")
+        for photo_id, path in rows:
+            if path and os.path.exists(path):
+                self.submit(photo_id, None, path)
+            else:
+                self._mark(photo_id, 'failed')
+        return len(rows)
+
+    def stop(self, timeout=5.0):
+        """Store everything queued so far, then stop the workers"""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._jobs.put(None)
+        for thread in threads:
+            thread.join(timeout)
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            self._process(*job)
+
+    def _process(self, photo_id, data, path):
+        try:
+            if data is None:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            elif not os.path.exists(path):
+                write_file_atomic(path, data, tag=photo_id)
+
+            variants = self._write_variants(data, path, photo_id)
+            with db.transaction() as cursor:
+                cursor.execute(
+                    f"""UPDATE photos
+                        SET status = 'stored', {', '.join(f'{column} = ?' for _, _, column in VARIANTS)}
+                        WHERE id = ?""",
+                    [variants.get(column) for _, _, column in VARIANTS] + [photo_id]
+                )
+            self.stored += 1
+        except Exception as e:
+            self.failed += 1
+            print(f"Error storing photo {photo_id}: {str(e)}")
+            traceback.print_exc()
+            self._mark(photo_id, 'failed')
+
+    @staticmethod
+    def _write_variants(data, path, photo_id):
+        # Imported here so the app (and its database routes) load without OpenCV
+        import cv2
+        import numpy as np
+
+        img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            raise ValueError("Photo is not a decodable image")
+
+        height, width = img.shape[:2]
+        stem, ext = os.path.splitext(path)
+        paths = {}
+        for suffix, max_width, column in VARIANTS:
+            variant_path = f'{stem}_{suffix}{ext}'
+            if not os.path.exists(variant_path):
+                variant = img
+                if width > max_width:
+                    variant = cv2.resize(img, (max_width, max(1, int(height * max_width / width))),
+                                         interpolation=cv2.INTER_AREA)
+                ok, encoded = cv2.imencode('.jpg', variant, [cv2.IMWRITE_JPEG_QUALITY, PHOTO_VARIANT_QUALITY])
+                if not ok:
+                    raise ValueError(f"Could not encode {suffix} variant")
+                write_file_atomic(variant_path, encoded.tobytes(), tag=photo_id)
+            paths[column] = variant_path
+        return paths
+
+    @staticmethod
+    def _mark(photo_id, status):
+        try:
+            with db.transaction() as cursor:
+                cursor.execute("UPDATE photos SET status = ? WHERE id = ?", (status, photo_id))
+        except Exception as e:
+            print(f"Error updating photo {photo_id}: {str(e)}")
+
+    def stats(self):
+        return {
+            'workers': len(self._threads),
+            'pending': self._jobs.qsize(),
+            'submitted': self.submitted,
+            'stored': self.stored,
+            'failed': self.failed,
+            'inline': self.inline,
+        }
+
+photo_pipeline = PhotoPipeline()
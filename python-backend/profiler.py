@@ -0,0 +1,260 @@
+# python-backend\profiler.py
+"""On-demand profiling of live detection requests.
+
+An admin starts a session for the next N detection requests, or for T
+seconds, on the running server. While it runs, the threads handling those
+requests are tracked: the request thread, and the dispatcher thread that
+runs its frame. Two views are collected:
+
+- python: a sampling thread reads the tracked threads' stacks every
+  PROFILE_SAMPLE_INTERVAL_MS (sys._current_frames) and counts each stack.
+- opencv: tracked threads get a sys.setprofile hook that times every call
+  into a cv2 function or method, keyed by the Python stack that made it.
+
+Both are downloadable as collapsed stacks (`frame;frame;frame count`), the
+input format of flamegraph.pl, speedscope and similar tools; python counts
+are samples, opencv counts are microseconds.
+
+When no session is running, request() and track() return a shared no-op
+context after one attribute check; there is no sampling thread and no
+profile hook. With detection worker processes (EWASTE_DETECT_WORKERS > 0)
+the detection itself runs in the workers, so the stacks only show the
+server side waiting on them.
+"""
+
+import collections
+import contextlib
+import sys
+import threading
+import time
+import types
+
+from config import PROFILE_MAX_SECONDS, PROFILE_SAMPLE_INTERVAL_MS
+
+# Returned by request()/track() while profiling is off
+NOT_PROFILING = contextlib.nullcontext()
+
+def opencv_functions():
+    """{id: qualified name} of the functions in cv2 and its submodules"""
+    import cv2
+
+    names = {}
+    seen = set()
+
+    def walk(module):
+        if id(module) in seen:
+            return
+        seen.add(id(module))
+        for name, value in vars(module).items():
+            if isinstance(value, types.BuiltinFunctionType):
+                names[id(value)] = f'{module.__name__}.{name}'
+            elif isinstance(value, types.ModuleType) and value.__name__.startswith('cv2'):
+                walk(value)
+
+    walk(cv2)
+    return names
+
+def collapse(frame, root=None):
+    """`root;module:function;...` for `frame` and its callers, outermost first"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{frame.f_globals.get('__name__', '?')}:{code.co_name}")
+        frame = frame.f_back
+    if root:
+        names.append(root)
+    return ';'.join(reversed(names))
+
+class ProfileSession:
+    """Counts collected by one profiling run"""
+
+    def __init__(self, requests, seconds, interval):
+        self.requests = requests
+        self.remaining = requests
+        self.seconds = seconds
+        self.interval = interval
+        self.started = time.monotonic()
+        self.started_at = time.strftime("%Y-%m-%d %H:%M:%S")
+        self.finished = None
+        self.python = collections.Counter()
+        self.opencv = collections.Counter()
+        self.samples = 0
+        self.in_flight = 0
+        self.stopped = threading.Event()
+
+    def expired(self):
+        if self.seconds and time.monotonic() - self.started >= self.seconds:
+            return True
+        return self.requests is not None and self.remaining == 0 and self.in_flight == 0
+
+    def status(self):
+        end = self.finished or time.monotonic()
+        return {
+            'running': self.finished is None,
+            'started_at': self.started_at,
+            'elapsed_seconds': round(end - self.started, 3),
+            'requests': self.requests,
+            'requests_remaining': self.remaining,
+            'seconds': self.seconds,
+            'sample_interval_ms': round(self.interval * 1000, 3),
+            'samples': self.samples,
+            'python_stacks': len(self.python),
+            'opencv_stacks': len(self.opencv),
+            'opencv_seconds': round(sum(self.opencv.values()) / 1e6, 3),
+        }
+
+class Profiler:
+    """Starts, runs and stops profiling sessions; one at a time"""
+
+    def __init__(self, sample_interval_ms=PROFILE_SAMPLE_INTERVAL_MS, max_seconds=PROFILE_MAX_SECONDS):
+        self.sample_interval = sample_interval_ms / 1000
+        self.max_seconds = max_seconds
+        # Checked on every request; everything else is only touched while True
+        self.active = False
+        self.session = None
+        self._tracked = {}
+        self._opencv = {}
+        self._calls = threading.local()
+        self._lock = threading.Lock()
+
+    def start(self, requests=None, seconds=None, interval_ms=None):
+        """Profile the next `requests` detection requests and/or `seconds` seconds"""
+        if requests is not None and requests < 1:
+            raise ValueError("requests must be at least 1")
+        if seconds is not None and seconds <= 0:
+            raise ValueError("seconds must be positive")
+        # A request count alone still ends after max_seconds
+        seconds = min(seconds or self.max_seconds, self.max_seconds)
+        interval = interval_ms / 1000 if interval_ms else self.sample_interval
+
+        with self._lock:
+            if self.active:
+                raise RuntimeError("A profiling session is already running")
+            if not self._opencv:
+                self._opencv = opencv_functions()
+            session = self.session = ProfileSession(requests, seconds, interval)
+            self.active = True
+        threading.Thread(target=self._sample, args=(session,), name='profiler-sampler', daemon=True).start()
+        return session.status()
+
+    def stop(self, session=None):
+        """End the running session (only if it is still `session`, when given)"""
+        with self._lock:
+            if session is not None and session is not self.session:
+                return None
+            session = self.session
+            if not self.active or session is None:
+                return session.status() if session else None
+            self.active = False
+            session.finished = time.monotonic()
+            session.stopped.set()
+        return session.status()
+
+    def request(self):
+        """Context for one detection request; counted against the session"""
+        if not self.active:
+            return NOT_PROFILING
+        return self._request()
+
+    @contextlib.contextmanager
+    def _request(self):
+        session = self.session
+        with self._lock:
+            claimed = self.active and session.remaining != 0
+            if claimed:
+                if session.remaining is not None:
+                    session.remaining -= 1
+                session.in_flight += 1
+        if not claimed:
+            yield False
+            return
+        try:
+            with self._track():
+                yield True
+        finally:
+            with self._lock:
+                session.in_flight -= 1
+            if session.expired():
+                self.stop(session)
+
+    def tracked(self):
+        """True if the calling thread is handling a profiled request"""
+        return self.active and threading.get_ident() in self._tracked
+
+    def track(self, profiled=True):
+        """Context that tracks the calling thread (e.g. a dispatcher running a
+        profiled request's frame)"""
+        if not (self.active and profiled):
+            return NOT_PROFILING
+        return self._track()
+
+    @contextlib.contextmanager
+    def _track(self):
+        ident = threading.get_ident()
+        if ident in self._tracked:
+            yield  # Already tracked further up this thread
+            return
+        self._tracked[ident] = threading.current_thread().name
+        previous = sys.getprofile()
+        sys.setprofile(self._profile_opencv)
+        try:
+            yield
+        finally:
+            sys.setprofile(previous)
+            self._tracked.pop(ident, None)
+
+    def _profile_opencv(self, frame, event, arg):
+        # Python-level call/return events are ignored; only C calls matter
+        if event == 'c_call':
+            name = self._opencv.get(id(arg))
+            if name is None:
+                owner = getattr(arg, '__self__', None)
+                module = type(owner).__module__ if owner is not None else None
+                if not module or not module.startswith('cv2'):
+                    return
+                name = f'{module}.{arg.__qualname__}'
+            calls = getattr(self._calls, 'stack', None)
+            if calls is None:
+                calls = self._calls.stack = []
+            calls.append((arg, name, frame, time.perf_counter()))
+        elif event in ('c_return', 'c_exception'):
+            calls = getattr(self._calls, 'stack', None)
+            if not calls or calls[-1][0] is not arg:
+                return
+            _, name, caller, start = calls.pop()
+            elapsed = int((time.perf_counter() - start) * 1e6)
+            session = self.session
+            if session is not None and self.active:
+                stack = collapse(caller, self._tracked.get(threading.get_ident())) + ';' + name
+                with self._lock:
+                    session.opencv[stack] += elapsed
+
+    def _sample(self, session):
+        while not session.stopped.wait(session.interval):
+            frames = sys._current_frames()
+            stacks = [collapse(frames[ident], thread_name)
+                      for ident, thread_name in list(self._tracked.items()) if ident in frames]
+            del frames
+            with self._lock:
+                session.python.update(stacks)
+                session.samples += 1
+            if session.expired():
+                self.stop(session)
+
+    def collapsed(self, view):
+        """Collapsed-stack text of the current or last session"""
+        session = self.session
+        if view not in ('python', 'opencv'):
+            raise ValueError("view must be python or opencv")
+        if session is None:
+            return ''
+        with self._lock:
+            counts = list(getattr(session, view).items())
+        counts.sort(key=lambda item: item[1], reverse=True)
+        return ''.join(f'{stack} {count}\n' for stack, count in counts)
+
+    def status(self):
+        session = self.session
+        return session.status() if session is not None else {'running': False}
+
+profiler = Profiler()
@@ -0,0 +1,401 @@
+# python-backend\retention.py
+"""Retention: archive old detections, coarsen rollups, age out photos.
+
+A background thread runs one pass every RETENTION_INTERVAL_HOURS:
+
+1. Raw face_data rows older than RETENTION_FACE_DATA_DAYS are appended to
+   ``ARCHIVE_DIR/face_data/face_data_<day>.csv.gz`` and then deleted in
+   small batches. Their counts already live in the analytics rollups, which
+   are updated on insert, so dashboards are unaffected.
+2. Minute and hour rollup buckets past their limits are deleted; the day
+   buckets remain as the long-term history.
+3. Photos older than RETENTION_PHOTO_DAYS are downsized into
+   ``ARCHIVE_DIR/photos`` or deleted (with their thumbnails), and their
+   photos rows updated.
+4. Idempotency keys of /events older than RETENTION_EVENT_KEY_DAYS are
+   deleted.
+5. Freed pages are handed back with incremental_vacuum. A database created
+   before incremental auto_vacuum needs one full VACUUM to switch, which
+   blocks writers while it runs; that only happens with
+   RETENTION_FULL_VACUUM set, e.g. for one run in a maintenance window.
+
+Every step is safe to interrupt: archive files are written to a temp file
+and renamed, and rows are deleted only after the file holding them exists.
+"""
+
+import csv
+import datetime
+import gzip
+import io
+import itertools
+import os
+import threading
+import time
+import traceback
+
+import db
+import photo_store
+from config import (
+    ARCHIVE_DIR, PHOTOS_DIR, RETENTION_BATCH_ROWS, RETENTION_ENABLED,
+    RETENTION_EVENT_KEY_DAYS, RETENTION_FACE_DATA_DAYS, RETENTION_FULL_VACUUM,
+    RETENTION_HOUR_BUCKET_DAYS, RETENTION_INTERVAL_HOURS,
+    RETENTION_MINUTE_BUCKET_DAYS, RETENTION_PHOTO_ACTION, RETENTION_PHOTO_DAYS,
+    RETENTION_PHOTO_MAX_WIDTH, RETENTION_PHOTO_QUALITY, RETENTION_VACUUM_PAGES,
+)
+
+FACE_DATA_COLUMNS = ('id', 'timestamp', 'gender', 'age', 'vip_id', 'detection_confidence', 'kiosk_id')
+
+# Seconds after startup before the first pass, to stay clear of model loading
+STARTUP_DELAY = 60
+
+def cutoff_timestamp(days, now=None):
+    """'%Y-%m-%d 00:00:00' of the day `days` days ago; rows before it are old"""
+    now = now or datetime.datetime.now()
+    day = (now - datetime.timedelta(days=days)).date()
+    return day.strftime('%Y-%m-%d 00:00:00')
+
+def _write_atomic(path, write):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+class RetentionPolicy:
+    """Retention settings; defaults come from config"""
+
+    def __init__(self, face_data_days=RETENTION_FACE_DATA_DAYS,
+                 minute_bucket_days=RETENTION_MINUTE_BUCKET_DAYS,
+                 hour_bucket_days=RETENTION_HOUR_BUCKET_DAYS,
+                 photo_days=RETENTION_PHOTO_DAYS, photo_action=RETENTION_PHOTO_ACTION,
+                 photo_max_width=RETENTION_PHOTO_MAX_WIDTH, photo_quality=RETENTION_PHOTO_QUALITY,
+                 event_key_days=RETENTION_EVENT_KEY_DAYS,
+                 batch_rows=RETENTION_BATCH_ROWS, vacuum_pages=RETENTION_VACUUM_PAGES,
+                 full_vacuum=RETENTION_FULL_VACUUM):
+        if photo_action not in ('transcode', 'delete', 'keep'):
+            raise ValueError(f"Unknown photo retention action: {photo_action}")
+        self.face_data_days = face_data_days
+        self.minute_bucket_days = minute_bucket_days
+        self.hour_bucket_days = hour_bucket_days
+        self.photo_days = photo_days
+        self.photo_action = photo_action
+        self.photo_max_width = photo_max_width
+        self.photo_quality = photo_quality
+        self.event_key_days = event_key_days
+        self.batch_rows = max(1, batch_rows)
+        self.vacuum_pages = vacuum_pages
+        self.full_vacuum = full_vacuum
+
+    def as_dict(self):
+        return dict(vars(self))
+
+class RetentionManager:
+    """Runs retention passes on a schedule or on demand"""
+
+    def __init__(self, policy=None, archive_dir=ARCHIVE_DIR, photos_dir=PHOTOS_DIR):
+        self.policy = policy or RetentionPolicy()
+        self.archive_dir = archive_dir
+        self.photos_dir = photos_dir
+        self.last_run = None
+        self.running = False
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    # Scheduling
+
+    def start(self, interval_hours=RETENTION_INTERVAL_HOURS, delay=STARTUP_DELAY):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run_forever, args=(interval_hours * 3600, delay),
+            name='retention', daemon=True
+        )
+        self._thread.start()
+
+    def _run_forever(self, interval, delay):
+        self._wake.wait(delay)
+        while True:
+            self._wake.clear()
+            self.run()
+            self._wake.wait(interval)
+
+    def trigger(self):
+        """Run a pass now on the background thread (starting it if needed)"""
+        if self._thread is None:
+            self.start(delay=0)
+        self._wake.set()
+
+    def run(self):
+        """One full retention pass; returns its summary"""
+        if not self._lock.acquire(blocking=False):
+            return None  # A pass is already running
+        self.running = True
+        started = time.monotonic()
+        summary = {'started_at': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+        try:
+            summary['face_data'] = self.archive_face_data()
+            summary['rollups'] = self.downsample_rollups()
+            summary['photos'] = self.age_photos()
+            summary['event_keys'] = self.prune_event_keys()
+            summary['vacuum'] = self.vacuum()
+        except Exception as e:
+            summary['error'] = str(e)
+            print(f"Error during retention pass: {str(e)}")
+            traceback.print_exc()
+        finally:
+            summary['seconds'] = round(time.monotonic() - started, 2)
+            self.last_run = summary
+            self.running = False
+            self._lock.release()
+        return summary
+
+    # face_data archival
+
+    def archive_face_data(self):
+        if not self.policy.face_data_days:
+            return {'skipped': True}
+        cutoff = cutoff_timestamp(self.policy.face_data_days)
+        days = db.query_all(
+            """SELECT DISTINCT substr(timestamp, 1, 10)
+               FROM face_data
+               WHERE timestamp < ?
+               ORDER BY 1""",
+            (cutoff,)
+        )
+
+        archived = deleted = 0
+        for day, in days:
+            rows, removed = self._archive_day(day)
+            archived += rows
+            deleted += removed
+        return {'cutoff': cutoff, 'days': len(days), 'archived': archived, 'deleted': deleted}
+
+    def _archive_path(self, day):
+        directory = os.path.join(self.archive_dir, 'face_data')
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, f'face_data_{day}.csv.gz')
+
+    def _archive_day(self, day):
+        """Append `day`'s rows to its archive file, then delete them.
+
+        Rows are read and deleted RETENTION_BATCH_ROWS at a time in id order,
+        so a day of any size needs one batch of memory.
+        """
+        next_day = datetime.date.fromisoformat(day) + datetime.timedelta(days=1)
+        start, end = f'{day} 00:00:00', next_day.strftime('%Y-%m-%d 00:00:00')
+        path = self._archive_path(day)
+
+        first_id = db.query_one(
+            "SELECT MIN(id) FROM face_data WHERE timestamp >= ? AND timestamp < ?", (start, end)
+        )[0]
+        if first_id is None:
+            return 0, 0
+
+        # Rows already in the file (a pass interrupted mid-delete) aren't written twice
+        archived_through = self._last_archived_id(path)
+        chunks = self._day_chunks(start, end, max(archived_through, first_id - 1))
+        first_chunk = next(chunks, None)
+
+        written = 0
+        if first_chunk is not None:
+            def write(f):
+                nonlocal written, archived_through
+                with gzip.GzipFile(fileobj=f, mode='wb') as gz:
+                    text = io.TextIOWrapper(gz, encoding='utf-8', newline='')
+                    writer = csv.writer(text)
+                    if archived_through:
+                        # Copy the existing archive, then add the new rows
+                        with gzip.open(path, 'rt', encoding='utf-8', newline='') as existing:
+                            for line in existing:
+                                text.write(line)
+                    else:
+                        writer.writerow(FACE_DATA_COLUMNS)
+                    for rows in itertools.chain([first_chunk], chunks):
+                        writer.writerows(rows)
+                        written += len(rows)
+                        archived_through = rows[-1][0]
+                    text.flush()
+                    text.detach()
+            _write_atomic(path, write)
+
+        # Only once the file is in place, and only rows that are in it
+        return written, self._delete_archived(start, end, archived_through)
+
+    def _day_chunks(self, start, end, after_id):
+        """Lists of up to batch_rows face_data rows of one day, id > after_id, in id order"""
+        while True:
+            # +timestamp keeps the scan on the id order; the timestamp index
+            # would need a sort of the whole day
+            with db.connection() as conn:
+                rows = conn.execute(
+                    f"""SELECT {', '.join(FACE_DATA_COLUMNS)}
+                        FROM face_data
+                        WHERE id > ? AND +timestamp >= ? AND +timestamp < ?
+                        ORDER BY id
+                        LIMIT ?""",
+                    (after_id, start, end, self.policy.batch_rows)
+                ).fetchall()
+            if not rows:
+                return
+            yield rows
+            after_id = rows[-1][0]
+
+    def _delete_archived(self, start, end, through_id):
+        """Delete a day's rows up to `through_id` in small transactions"""
+        deleted = 0
+        while True:
+            with db.transaction() as cursor:
+                cursor.execute(
+                    """DELETE FROM face_data WHERE id IN (
+                           SELECT id FROM face_data
+                           WHERE id <= ? AND +timestamp >= ? AND +timestamp < ?
+                           ORDER BY id
+                           LIMIT ?)""",
+                    (through_id, start, end, self.policy.batch_rows)
+                )
+                removed = cursor.rowcount
+            deleted += removed
+            if removed < self.policy.batch_rows:
+                return deleted
+
+    @staticmethod
+    def _last_archived_id(path):
+        if not os.path.exists(path):
+            return 0
+        last_id = 0
+        with gzip.open(path, 'rt', encoding='utf-8', newline='') as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            for row in reader:
+                last_id = max(last_id, int(row[0]))
+        return last_id
+
+    # Rollup downsampling
+
+    def downsample_rollups(self):
+        deleted = {}
+        for bucket, days in (('minute', self.policy.minute_bucket_days),
+                             ('hour', self.policy.hour_bucket_days)):
+            if not days:
+                continue
+            cutoff = cutoff_timestamp(days)
+            with db.transaction() as cursor:
+                for table in ('face_rollup', 'disposal_rollup'):
+                    cursor.execute(
+                        f"DELETE FROM {table} WHERE bucket = ? AND bucket_start < ?",
+                        (bucket, cutoff)
+                    )
+                    deleted[f'{table}.{bucket}'] = cursor.rowcount
+        return deleted
+
+    def prune_event_keys(self):
+        if not self.policy.event_key_days:
+            return {'skipped': True}
+        cutoff = cutoff_timestamp(self.policy.event_key_days)
+        with db.transaction() as cursor:
+            cursor.execute("DELETE FROM processed_events WHERE processed_at < ?", (cutoff,))
+            return {'deleted': cursor.rowcount}
+
+    # Photos
+
+    def age_photos(self):
+        if not self.policy.photo_days or self.policy.photo_action == 'keep':
+            return {'skipped': True}
+        if not os.path.isdir(self.photos_dir):
+            return {'processed': 0}
+
+        cutoff = time.time() - self.policy.photo_days * 86400
+        processed = failed = 0
+        for directory, _, names in os.walk(self.photos_dir):
+            for name in names:
+                path = os.path.join(directory, name)
+                # Variants follow their original; temp files belong to the photo workers
+                if name.endswith('.tmp') or photo_store.is_variant(path):
+                    continue
+                if os.path.getmtime(path) >= cutoff:
+                    continue
+                try:
+                    if self.policy.photo_action == 'transcode':
+                        self._transcode_photo(path)
+                    else:
+                        self._delete_photo(path)
+                    processed += 1
+                except Exception as e:
+                    failed += 1
+                    print(f"Error ageing photo {path}: {str(e)}")
+        return {'action': self.policy.photo_action, 'processed': processed, 'failed': failed}
+
+    def _transcode_photo(self, path):
+        """Move a downsized, recompressed copy into the archive"""
+        import cv2
+
+        img = cv2.imread(path)
+        if img is None:
+            raise ValueError("not a readable image")
+        height, width = img.shape[:2]
+        if width > self.policy.photo_max_width:
+            scale = self.policy.photo_max_width / width
+            img = cv2.resize(img, (self.policy.photo_max_width, int(height * scale)),
+                             interpolation=cv2.INTER_AREA)
+        ok, encoded = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, self.policy.photo_quality])
+        if not ok:
+            raise ValueError("JPEG encoding failed")
+
+        directory = os.path.join(self.archive_dir, 'photos')
+        os.makedirs(directory, exist_ok=True)
+        archived_path = os.path.join(directory, os.path.splitext(os.path.basename(path))[0] + '.jpg')
+        _write_atomic(archived_path, lambda f: f.write(encoded.tobytes()))
+
+        # The archived copy replaces the variants too; they'd outlive their original
+        with db.transaction() as cursor:
+            cursor.execute(
+                """UPDATE photos SET photo_path = ?, thumbnail_path = NULL, preview_path = NULL
+                   WHERE photo_path = ?""",
+                (archived_path, path)
+            )
+        for variant_path in photo_store.variant_paths(path):
+            os.remove(variant_path)
+        os.remove(path)
+
+    def _delete_photo(self, path):
+        with db.transaction() as cursor:
+            cursor.execute(
+                """UPDATE photos SET photo_path = NULL, thumbnail_path = NULL, preview_path = NULL
+                   WHERE photo_path = ?""",
+                (path,)
+            )
+        for variant_path in photo_store.variant_paths(path):
+            os.remove(variant_path)
+        os.remove(path)
+
+    # Space reclamation
+
+    def vacuum(self):
+        with db.connection() as conn:
+            mode = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+            if mode != 2:
+                # Databases created before incremental mode need one full
+                # VACUUM to switch. It rewrites the whole file under the write
+                # lock, longer than writers wait, so it only runs when asked
+                if not self.policy.full_vacuum:
+                    return {'incremental': False, 'full_vacuum': 'not enabled'}
+                conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                conn.execute('VACUUM')
+                return {'full_vacuum': True}
+
+            freed = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            if freed:
+                conn.execute(f'PRAGMA incremental_vacuum({self.policy.vacuum_pages})').fetchall()
+            return {'free_pages': freed, 'released': min(freed, self.policy.vacuum_pages)}
+
+    def stats(self):
+        return {
+            'enabled': RETENTION_ENABLED,
+            'running': self.running,
+            'policy': self.policy.as_dict(),
+            'last_run': self.last_run,
+        }
+
+retention_manager = RetentionManager()
@@ -0,0 +1,214 @@
+# python-backend\scheduler.py
+"""Fair per-stream scheduling of detection work.
+
+Every kiosk/camera is a stream. A stream holds at most one pending frame:
+a newer frame replaces it and the replaced request is answered straight
+away with a 'skipped' result (latest frame wins). Streams with a pending
+frame wait in a round-robin queue served by a fixed number of dispatcher
+threads, and a stream is never processed twice at once, so its frames stay
+in order for the tracker and one busy camera can't take every slot.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+
+from config import DETECT_CONCURRENCY, DETECT_TIMEOUT, DETECT_WORKERS
+from detect_pool import detection_pool
+from metrics import metrics
+from profiler import profiler
+
+# Streams with nothing pending are forgotten after this many idle seconds
+STREAM_IDLE_TIMEOUT = 300
+
+# Weight of the newest frame in the running service time average
+SERVICE_TIME_ALPHA = 0.2
+
+def default_concurrency():
+    if DETECT_CONCURRENCY > 0:
+        return DETECT_CONCURRENCY
+    if DETECT_WORKERS > 0:
+        return DETECT_WORKERS * 2
+    return os.cpu_count() or 2
+
+class FrameTicket:
+    """One submitted frame; resolved with its detection result"""
+
+    def __init__(self, frame, profiled=False):
+        self.frame = frame
+        self.profiled = profiled
+        self.result = None
+        self._done = threading.Event()
+
+    def resolve(self, result):
+        self.result = result
+        self.frame = None
+        self._done.set()
+
+    def wait(self, timeout=None):
+        if not self._done.wait(timeout):
+            return None
+        return self.result
+
+class StreamState:
+    def __init__(self):
+        self.pending = None
+        self.queued = False
+        self.busy = False
+        self.last_seen = time.monotonic()
+        self.submitted = 0
+        self.processed = 0
+        self.skipped = 0
+
+class FrameScheduler:
+    """Round-robin, latest-frame-wins dispatcher in front of detection"""
+
+    def __init__(self, run, concurrency=None, timeout=DETECT_TIMEOUT):
+        # run(kiosk_id, **frame) -> result dict
+        self._run = run
+        self.concurrency = concurrency or default_concurrency()
+        self.timeout = timeout
+        self._streams = {}
+        self._ready = deque()
+        self._cond = threading.Condition()
+        self._threads = []
+        # Running average of seconds per processed frame, None until one is
+        self.service_time = None
+        self.service_samples = 0
+
+    def start(self):
+        with self._cond:
+            if self._threads:
+                return
+            for i in range(self.concurrency):
+                thread = threading.Thread(target=self._dispatch, name=f'detect-dispatch-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, kiosk_id, **frame):
+        """Queue a frame for `kiosk_id`; returns its FrameTicket"""
+        if not self._threads:
+            self.start()
+        # Submitted from a profiled request: profile the thread that runs it
+        ticket = FrameTicket(frame, profiler.tracked())
+        with self._cond:
+            stream = self._streams.get(kiosk_id)
+            if stream is None:
+                self._evict_idle()
+                stream = self._streams[kiosk_id] = StreamState()
+            stream.last_seen = time.monotonic()
+            stream.submitted += 1
+
+            if stream.pending is not None:
+                stream.skipped += 1
+                stream.pending.resolve({
+                    "gender": "Unknown", "age": 0,
+                    "error": "Frame skipped for a newer one", "skipped": True
+                })
+            stream.pending = ticket
+
+            if not stream.busy and not stream.queued:
+                stream.queued = True
+                self._ready.append(kiosk_id)
+                self._cond.notify()
+        return ticket
+
+    def detect(self, kiosk_id, **frame):
+        """Submit a frame and wait for its result, at most two timeouts"""
+        ticket = self.submit(kiosk_id, **frame)
+        result = ticket.wait(self.timeout)
+        if result is None:
+            if self._withdraw(kiosk_id, ticket):
+                metrics.inc('ewaste_detection_timeouts_total', stage='queued')
+                return {"gender": "Unknown", "age": 0, "error": "Detection timed out"}
+            # Already running: give it another timeout to finish. After that the
+            # caller gets its answer; the stream stays busy until the run ends
+            result = ticket.wait(self.timeout)
+            if result is None:
+                metrics.inc('ewaste_detection_timeouts_total', stage='running')
+                return {"gender": "Unknown", "age": 0, "error": "Detection timed out"}
+        return result
+
+    def _withdraw(self, kiosk_id, ticket):
+        """Drop `ticket` if it hasn't started; True if it was withdrawn"""
+        with self._cond:
+            stream = self._streams.get(kiosk_id)
+            if stream is None or stream.pending is not ticket:
+                return False
+            stream.pending = None
+            stream.skipped += 1
+            return True
+
+    def _evict_idle(self):
+        cutoff = time.monotonic() - STREAM_IDLE_TIMEOUT
+        idle = [kiosk_id for kiosk_id, stream in self._streams.items()
+                if stream.last_seen < cutoff and not (stream.busy or stream.queued)]
+        for kiosk_id in idle:
+            del self._streams[kiosk_id]
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                while not self._ready:
+                    self._cond.wait()
+                kiosk_id = self._ready.popleft()
+                stream = self._streams[kiosk_id]
+                stream.queued = False
+                ticket, stream.pending = stream.pending, None
+                if ticket is None:
+                    continue  # Withdrawn after a timeout
+                stream.busy = True
+
+            start = time.perf_counter()
+            try:
+                with profiler.track(ticket.profiled):
+                    result = self._run(kiosk_id, **ticket.frame)
+            except Exception as e:
+                print(f"Error in scheduled detection: {str(e)}")
+                result = {"gender": "Unknown", "age": 0, "error": str(e)}
+            ticket.resolve(result)
+            elapsed = time.perf_counter() - start
+
+            with self._cond:
+                stream.busy = False
+                stream.processed += 1
+                self.service_samples += 1
+                if self.service_time is None:
+                    self.service_time = elapsed
+                else:
+                    self.service_time += SERVICE_TIME_ALPHA * (elapsed - self.service_time)
+                # Back of the line if another frame arrived meanwhile
+                if stream.pending is not None and not stream.queued:
+                    stream.queued = True
+                    self._ready.append(kiosk_id)
+                    self._cond.notify()
+
+    def waiting(self):
+        """Streams with a frame queued for a dispatcher"""
+        return len(self._ready)
+
+    def active_streams(self, window):
+        """Streams that submitted a frame in the last `window` seconds"""
+        cutoff = time.monotonic() - window
+        with self._cond:
+            return sum(1 for stream in self._streams.values() if stream.last_seen >= cutoff)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'concurrency': self.concurrency,
+                'ready': len(self._ready),
+                'service_ms': round(self.service_time * 1000, 2) if self.service_time is not None else None,
+                'streams': {
+                    str(kiosk_id): {
+                        'submitted': stream.submitted,
+                        'processed': stream.processed,
+                        'skipped': stream.skipped,
+                        'busy': stream.busy,
+                    }
+                    for kiosk_id, stream in self._streams.items()
+                },
+            }
+
+frame_scheduler = FrameScheduler(detection_pool.detect)
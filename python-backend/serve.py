@@ -0,0 +1,101 @@
+# python-backend\serve.py
+"""Production entry point: `python serve.py`.
+
+The listener comes up first, behind a startup gate, and only then is the
+Flask app imported and the database migrated. app.py itself doesn't import
+OpenCV or numpy, so that takes a fraction of a second; until it is done
+every request gets a 503 with Retry-After, so the renderer simply retries.
+From then on the database routes are served while app.warm_up_models()
+imports the detection routes (detection_api), loads the models and warms
+them up; detection, /pacing, the VIP routes and /health answer 503 until
+that has finished.
+
+Requests are served by Werkzeug's threaded server, never with the debugger
+or reloader. This is a deliberate departure from a multi-worker WSGI server:
+the renderer streams frames over the /detect-stream WebSocket, which
+Werkzeug serves and waitress (or gunicorn's sync workers) can't, and a
+multi-process server would load the models once per process. Parallel
+detection comes from the DETECT_WORKERS processes instead. EWASTE_SERVER=
+waitress switches to waitress (a fixed pool of SERVER_THREADS threads, on
+Windows as well as Linux) at the cost of the WebSocket: kiosks then fall
+back to HTTP polling.
+"""
+
+import json
+import threading
+import time
+import traceback
+
+# Imported before the app starts loading on another thread; importing it
+# concurrently with Flask's own werkzeug imports fails half-initialized
+from werkzeug.serving import run_simple
+
+from config import SERVER_BACKEND, SERVER_HOST, SERVER_PORT, SERVER_THREADS
+from metrics import configure_logging
+
+try:
+    import waitress
+except ImportError:  # Optional; only used with EWASTE_SERVER=waitress
+    waitress = None
+
+class StartupGate:
+    """WSGI app that answers 503 until the real app is attached"""
+
+    def __init__(self):
+        self.app = None
+        self.error = None
+
+    def __call__(self, environ, start_response):
+        app = self.app
+        if app is not None:
+            return app(environ, start_response)
+
+        body = json.dumps({
+            'status': 'starting' if self.error is None else 'error',
+            'ready': False,
+            'error': self.error,
+        }).encode()
+        start_response('503 Service Unavailable', [
+            ('Content-Type', 'application/json'),
+            ('Content-Length', str(len(body))),
+            ('Retry-After', '1'),
+            ('Access-Control-Allow-Origin', '*'),
+        ])
+        return [body]
+
+def start_app(gate, app_module=None):
+    """Import and initialize the app, attach it to `gate`, then warm up detection"""
+    start = time.perf_counter()
+    try:
+        if app_module is None:
+            import app as app_module
+        app_module.init_db()
+        gate.app = app_module.app
+        print(f"Serving requests after {time.perf_counter() - start:.2f}s")
+        app_module.warm_up_models()
+    except Exception as e:
+        gate.error = str(e)
+        print(f"Error starting the app: {str(e)}")
+        traceback.print_exc()
+
+def serve(wsgi_app, host=SERVER_HOST, port=SERVER_PORT, threads=SERVER_THREADS, backend=SERVER_BACKEND):
+    if backend == 'waitress':
+        if waitress is not None:
+            print(f"Starting waitress on http://{host}:{port} ({threads} threads); /detect-stream is unavailable")
+            waitress.serve(wsgi_app, host=host, port=port, threads=threads)
+            return
+        print("EWASTE_SERVER=waitress but waitress is not installed; using Werkzeug")
+    elif backend != 'werkzeug':
+        print(f"Unknown EWASTE_SERVER '{backend}'; using Werkzeug")
+
+    print(f"Starting Werkzeug on http://{host}:{port}")
+    run_simple(host, port, wsgi_app, threaded=True, use_reloader=False, use_debugger=False)
+
+def main(app_module=None):
+    configure_logging()
+    gate = StartupGate()
+    threading.Thread(target=start_app, args=(gate, app_module), name='app-startup', daemon=True).start()
+    serve(gate)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,15 @@
+# python-backend\tests\conftest.py
+"""Point every storage path at a scratch directory before config is imported."""
+
+import os
+import sys
+import tempfile
+
+_scratch = tempfile.mkdtemp(prefix='ewaste-tests-')
+os.environ['EWASTE_DB_PATH'] = os.path.join(_scratch, 'test.db')
+os.environ['EWASTE_PHOTOS_DIR'] = os.path.join(_scratch, 'photos')
+os.environ['EWASTE_ARCHIVE_DIR'] = os.path.join(_scratch, 'archive')
+os.environ['EWASTE_VIP_MODELS_DIR'] = os.path.join(_scratch, 'vip_models')
+os.environ['EWASTE_RETENTION'] = '0'
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
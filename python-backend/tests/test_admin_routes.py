@@ -0,0 +1,24 @@
+# python-backend\tests\test_admin_routes.py
+import pytest
+
+import app
+
+@pytest.fixture
+def client():
+    return app.app.test_client()
+
+def test_retention_routes_are_disabled_without_a_token(client, monkeypatch):
+    monkeypatch.setattr(app, 'ADMIN_TOKEN', '')
+    assert client.get('/retention').status_code == 403
+    assert client.post('/retention/run').status_code == 403
+
+def test_retention_run_needs_the_admin_token(client, monkeypatch):
+    monkeypatch.setattr(app, 'ADMIN_TOKEN', 'secret')
+    triggered = []
+    monkeypatch.setattr(app.retention_manager, 'trigger', lambda: triggered.append(True))
+
+    assert client.post('/retention/run', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert not triggered
+    response = client.post('/retention/run', headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 202 and triggered
+    assert client.get('/retention', headers={'Authorization': 'Bearer secret'}).status_code == 200
@@ -0,0 +1,94 @@
+# python-backend\tests\test_events.py
+import datetime
+
+import pytest
+
+import app
+import db
+import events
+import migrations
+
+@pytest.fixture(scope='module', autouse=True)
+def schema():
+    migrations.migrate()
+
+def apply(batch, kiosk_id='test'):
+    with db.transaction() as cursor:
+        return events.apply_batch(cursor, batch, kiosk_id)
+
+def count(table):
+    return db.query_one(f"SELECT COUNT(*) FROM {table}")[0]
+
+def test_renderer_timestamp_is_converted_to_local_time():
+    # Exactly what Date.prototype.toISOString() produces
+    stamp = events.event_timestamp({'timestamp': '2026-10-16T10:00:00.123Z'})
+    expected = datetime.datetime(2026, 10, 16, 10, 0, 0, tzinfo=datetime.timezone.utc).astimezone()
+    assert stamp == expected.strftime(events.TIMESTAMP_FORMAT)
+
+def test_timestamp_with_offset_and_naive():
+    assert events.event_timestamp({'timestamp': '2026-10-16 10:00:00'}) == '2026-10-16 10:00:00'
+    expected = datetime.datetime(2026, 10, 16, 8, 0, tzinfo=datetime.timezone.utc).astimezone()
+    assert events.event_timestamp({'timestamp': '2026-10-16T10:00:00+02:00'}) == \
+        expected.strftime(events.TIMESTAMP_FORMAT)
+
+def test_invalid_timestamp_is_rejected():
+    with pytest.raises(events.EventError):
+        events.event_timestamp({'timestamp': 'yesterday'})
+
+def test_retried_batch_is_not_applied_twice():
+    batch = [
+        {'key': 'idem-d', 'type': 'disposal', 'vip_id': 11, 'waste_type': 'battery',
+         'box_number': '04', 'timestamp': '2026-10-16T10:00:00.000Z'},
+        {'key': 'idem-r', 'type': 'rating', 'vip_id': 11, 'rating': 5},
+    ]
+    disposals, ratings = count('waste_disposal'), count('ratings')
+
+    first = apply(batch)
+    second = apply(batch)
+
+    assert [r['status'] for r in first] == ['applied', 'applied']
+    assert [r['status'] for r in second] == ['duplicate', 'duplicate']
+    assert second[1]['rating_id'] == first[1]['rating_id']
+    assert count('waste_disposal') == disposals + 1
+    assert count('ratings') == ratings + 1
+
+def test_duplicate_key_within_one_batch():
+    event = {'key': 'idem-same', 'type': 'rating', 'vip_id': 12, 'rating': 4}
+    ratings = count('ratings')
+    results = apply([event, dict(event)])
+    assert [r['status'] for r in results] == ['applied', 'duplicate']
+    assert count('ratings') == ratings + 1
+
+def test_failed_batch_rolls_back():
+    ratings = count('ratings')
+    with pytest.raises(events.EventError) as raised:
+        apply([
+            {'key': 'idem-ok', 'type': 'rating', 'vip_id': 13, 'rating': 3},
+            {'key': 'idem-bad', 'type': 'photo', 'photo_id': 999999},
+        ])
+    assert raised.value.index == 1
+    assert count('ratings') == ratings
+    assert db.query_one("SELECT 1 FROM processed_events WHERE event_key = 'idem-ok'") is None
+
+def test_photo_links_to_rating_by_key():
+    with db.transaction() as cursor:
+        cursor.execute("INSERT INTO photos (vip_id, photo_path, timestamp) VALUES (14, 'p.jpg', '2026-10-16 10:00:00')")
+        photo_id = cursor.lastrowid
+    apply([{'key': 'idem-r14', 'type': 'rating', 'vip_id': 14, 'rating': 5}])
+    result = apply([{'key': 'idem-p14', 'type': 'photo', 'photo_id': photo_id, 'rating_key': 'idem-r14'}])
+
+    rating_id = result[0]['rating_id']
+    assert db.query_one("SELECT rating_id FROM photos WHERE id = ?", (photo_id,))[0] == rating_id
+    assert db.query_one("SELECT photo_taken FROM ratings WHERE id = ?", (rating_id,))[0] == 1
+
+def test_save_rating_without_a_rating_still_stores_the_row():
+    # /save-rating has always accepted a missing rating; only /events insists
+    client = app.app.test_client()
+    response = client.post('/save-rating', json={'vip_id': 15})
+    assert response.status_code == 200
+    rating_id = response.get_json()['rating_id']
+    assert db.query_one("SELECT vip_id, rating FROM ratings WHERE id = ?", (rating_id,)) == (15, None)
+    assert db.query_one("SELECT rating_count FROM vip_stats WHERE vip_id = 15")[0] == 0
+
+    with pytest.raises(events.EventError):
+        apply([{'type': 'rating', 'vip_id': 15}])
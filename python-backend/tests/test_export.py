@@ -0,0 +1,65 @@
+# python-backend\tests\test_export.py
+import csv
+import io
+import json
+
+import pytest
+
+import app
+import db
+import export
+import migrations
+
+@pytest.fixture(scope='module', autouse=True)
+def schema():
+    migrations.migrate()
+
+@pytest.fixture(scope='module')
+def inserted():
+    """(id before the rows, their ids); enough rows for two full chunks and a partial one"""
+    before = db.query_one("SELECT COALESCE(MAX(id), 0) FROM waste_disposal")[0]
+    rows = export.EXPORT_CHUNK_ROWS * 2 + 7
+    with db.transaction() as cursor:
+        cursor.executemany(
+            "INSERT INTO waste_disposal (vip_id, waste_type, box_number, timestamp, kiosk_id) VALUES (?, ?, ?, ?, ?)",
+            [(i % 5 or None, 'battery', str(i % 3 + 1), f'2024-03-01 10:{i % 60:02d}:00', 'k1')
+             for i in range(rows)]
+        )
+    ids = [row[0] for row in db.query_all("SELECT id FROM waste_disposal WHERE id > ? ORDER BY id", (before,))]
+    assert len(ids) == rows
+    return before, ids
+
+@pytest.fixture
+def client():
+    return app.app.test_client()
+
+def test_csv_export_spans_chunks_without_gaps_or_repeats(client, inserted):
+    before, ids = inserted
+    response = client.get(f'/export/waste_disposal?format=csv&after_id={before}')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+
+    reader = csv.reader(io.StringIO(response.get_data(as_text=True)))
+    assert next(reader) == list(export.EXPORT_TABLES['waste_disposal'])
+    rows = list(reader)
+    assert [int(row[0]) for row in rows] == ids
+    # NULL comes out as an empty field
+    assert rows[0][2] == '' and rows[1][2] == '1'
+
+def test_ndjson_export_resumes_after_an_id(client, inserted):
+    before, ids = inserted
+    middle = ids[export.EXPORT_CHUNK_ROWS - 1]
+    exported = []
+    for after_id in (before, middle):
+        limit = export.EXPORT_CHUNK_ROWS if after_id == before else ''
+        response = client.get(f'/export/waste_disposal?after_id={after_id}&limit={limit}')
+        assert response.status_code == 200
+        lines = response.get_data(as_text=True).splitlines()
+        exported += [json.loads(line)['id'] for line in lines]
+    assert exported == ids
+    assert len(set(exported)) == len(exported)
+
+def test_bad_export_parameters_are_rejected(client):
+    assert client.get('/export/vip_profiles').status_code == 400
+    assert client.get('/export/ratings?format=xml').status_code == 400
+    assert client.get('/export/ratings?after_id=abc').status_code == 400
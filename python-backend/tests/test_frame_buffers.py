@@ -0,0 +1,31 @@
+# python-backend\tests\test_frame_buffers.py
+"""Frames and state kept across frames must not alias buffers that get reused."""
+
+import io
+
+import numpy as np
+
+import vision
+from motion_gate import MotionGate
+from tracker import FaceTrack
+
+def test_small_thumbnail_is_a_copy():
+    gate = MotionGate(thumb_width=64)
+    gray = np.zeros((30, 40), np.uint8)
+    thumbnail = gate.thumbnail(img=gray)
+    gray[:] = 255
+    assert not thumbnail.any()
+
+def test_small_template_is_a_copy():
+    track = FaceTrack((4, 4, 20, 20), {"gender": "Male", "age": 30})
+    gray = np.zeros((40, 40), np.uint8)
+    track.update_template(gray)
+    gray[:] = 255
+    assert not track.template.any()
+
+def test_request_bodies_get_their_own_buffers():
+    first = vision.read_frame_body(io.BytesIO(b'\x01' * 64), 64)
+    second = vision.read_frame_body(io.BytesIO(b'\x02' * 64), 64)
+    assert first.tolist() == [1] * 64 and second.tolist() == [2] * 64
+    # A short body is returned as read
+    assert vision.read_frame_body(io.BytesIO(b'\x03' * 10), 64).size == 10
@@ -0,0 +1,51 @@
+# python-backend\tests\test_pacing.py
+import pacing
+
+class FakeScheduler:
+    def __init__(self, service_time=None, samples=0, waiting=0, streams=1, concurrency=1):
+        self.service_time = service_time
+        self.service_samples = samples
+        self.concurrency = concurrency
+        self._waiting = waiting
+        self._streams = streams
+
+    def waiting(self):
+        return self._waiting
+
+    def active_streams(self, window):
+        return self._streams
+
+def controller(scheduler):
+    return pacing.PacingController(scheduler, enabled=True, min_interval_ms=100,
+                                   max_interval_ms=2000, headroom=1.0, shed_wait_ms=1000)
+
+def test_cold_first_frame_does_not_shed():
+    # One slow first frame puts load well above 0
+    scheduler = FakeScheduler(service_time=0.8, samples=1)
+    pacer = controller(scheduler)
+    assert pacer.hints()['load'] > 0
+    assert pacer.admit('a') is None
+    assert pacer.admit('a') is None
+    assert pacer.shed == 0
+
+def test_warm_but_idle_server_does_not_shed_early():
+    pacer = controller(FakeScheduler(service_time=0.8, samples=50, waiting=0))
+    assert pacer.admit('a') is None
+    assert pacer.admit('a') is None
+    assert pacer.shed == 0
+
+def test_early_frame_is_shed_when_warm_and_queueing():
+    pacer = controller(FakeScheduler(service_time=0.8, samples=50, waiting=1, concurrency=4))
+    assert pacer.admit('a') is None
+    hints = pacer.admit('a')
+    assert hints is not None and hints['interval_ms'] == 200
+    assert pacer.shed == 1
+
+def test_long_queue_sheds_regardless_of_warmup():
+    pacer = controller(FakeScheduler(service_time=0.5, samples=1, waiting=3))
+    assert pacer.admit('a') is not None
+
+def test_disabled_never_sheds():
+    pacer = pacing.PacingController(FakeScheduler(service_time=5.0, samples=50, waiting=10),
+                                    enabled=False)
+    assert pacer.admit('a') is None
@@ -0,0 +1,116 @@
+# python-backend\tests\test_retention.py
+import contextlib
+import csv
+import datetime
+import gzip
+import os
+import sqlite3
+
+import cv2
+import numpy as np
+import pytest
+
+import db
+import migrations
+import retention
+
+@pytest.fixture(scope='module', autouse=True)
+def schema():
+    migrations.migrate()
+
+@pytest.fixture
+def manager(tmp_path):
+    # Small batches so a day spans several reads and deletes
+    policy = retention.RetentionPolicy(face_data_days=30, batch_rows=3)
+    return retention.RetentionManager(policy, archive_dir=str(tmp_path))
+
+DAY = (datetime.date.today() - datetime.timedelta(days=90)).isoformat()
+
+def insert_rows(count, day=DAY):
+    with db.transaction() as cursor:
+        for i in range(count):
+            cursor.execute(
+                "INSERT INTO face_data (timestamp, gender, age) VALUES (?, 'Male', ?)",
+                (f'{day} 10:00:{i:02d}', 20 + i)
+            )
+
+def archived_ids(manager, day=DAY):
+    with gzip.open(manager._archive_path(day), 'rt', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f)
+        assert next(reader) == list(retention.FACE_DATA_COLUMNS)
+        return [int(row[0]) for row in reader]
+
+def day_count(day=DAY):
+    return db.query_one(
+        "SELECT COUNT(*) FROM face_data WHERE substr(timestamp, 1, 10) = ?", (day,)
+    )[0]
+
+def test_old_day_is_archived_and_deleted(manager):
+    insert_rows(8)
+    summary = manager.archive_face_data()
+    assert summary['archived'] == 8 and summary['deleted'] == 8
+    assert len(archived_ids(manager)) == 8
+    assert day_count() == 0
+
+def test_interrupted_pass_resumes_without_duplicates(manager, monkeypatch):
+    insert_rows(7)
+    # The file is written, then the delete fails part way
+    monkeypatch.setattr(manager, '_delete_archived', lambda *args: 0)
+    manager.archive_face_data()
+    first = archived_ids(manager)
+    assert len(first) == 7 and day_count() == 7
+    monkeypatch.undo()
+
+    insert_rows(2)
+    summary = manager.archive_face_data()
+    ids = archived_ids(manager)
+    assert summary['archived'] == 2 and summary['deleted'] == 9
+    assert ids == sorted(set(ids)) and ids[:7] == first and len(ids) == 9
+    assert day_count() == 0
+
+def test_vacuum_does_not_convert_by_default(manager, tmp_path, monkeypatch):
+    path = str(tmp_path / 'legacy.db')
+    legacy = sqlite3.connect(path, isolation_level=None)
+    legacy.execute('CREATE TABLE t (x)')
+
+    @contextlib.contextmanager
+    def connection():
+        yield legacy
+    monkeypatch.setattr(db, 'connection', connection)
+
+    assert manager.vacuum()['full_vacuum'] == 'not enabled'
+    assert legacy.execute('PRAGMA auto_vacuum').fetchone()[0] == 0
+
+    manager.policy.full_vacuum = True
+    assert manager.vacuum() == {'full_vacuum': True}
+    assert legacy.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+    legacy.close()
+
+def test_transcoded_photo_takes_its_variants_along(tmp_path):
+    photos_dir = tmp_path / 'photos'
+    photos_dir.mkdir()
+    path = str(photos_dir / 'abc.jpg')
+    img = np.full((60, 80, 3), 128, np.uint8)
+    for target in (path, str(photos_dir / 'abc_thumb.jpg'), str(photos_dir / 'abc_preview.jpg')):
+        cv2.imwrite(target, img)
+    with db.transaction() as cursor:
+        cursor.execute(
+            """INSERT INTO photos (photo_path, thumbnail_path, preview_path)
+               VALUES (?, ?, ?)""",
+            (path, str(photos_dir / 'abc_thumb.jpg'), str(photos_dir / 'abc_preview.jpg'))
+        )
+        photo_id = cursor.lastrowid
+
+    policy = retention.RetentionPolicy(photo_days=1, photo_action='transcode')
+    manager = retention.RetentionManager(policy, archive_dir=str(tmp_path / 'archive'),
+                                         photos_dir=str(photos_dir))
+    old = datetime.datetime.now().timestamp() - 3 * 86400
+    for target in photos_dir.iterdir():
+        os.utime(target, (old, old))
+
+    assert manager.age_photos()['processed'] == 1
+    assert list(photos_dir.iterdir()) == []
+    photo_path, thumbnail, preview = db.query_one(
+        "SELECT photo_path, thumbnail_path, preview_path FROM photos WHERE id = ?", (photo_id,)
+    )
+    assert os.path.exists(photo_path) and thumbnail is None and preview is None
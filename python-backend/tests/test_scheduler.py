@@ -0,0 +1,64 @@
+# python-backend\tests\test_scheduler.py
+import threading
+
+from metrics import metrics
+from scheduler import FrameScheduler
+
+class BlockingRun:
+    """Detection stand-in: records what ran, holds `blocked` kiosks until released"""
+
+    def __init__(self, blocked=()):
+        self.blocked = set(blocked)
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.ran = []
+
+    def __call__(self, kiosk_id, frame):
+        self.ran.append((kiosk_id, frame))
+        if kiosk_id in self.blocked:
+            self.started.set()
+            self.release.wait(10)
+        return {"gender": "Unknown", "age": 0, "error": "No face detected", "frame": frame}
+
+def test_streams_take_turns_and_latest_frame_wins():
+    run = BlockingRun(blocked={'a'})
+    scheduler = FrameScheduler(run, concurrency=1, timeout=10)
+    first = scheduler.submit('a', frame=1)
+    assert run.started.wait(5)
+
+    # While a's first frame runs: b and c queue, a's next frames replace each other
+    stale = scheduler.submit('a', frame=2)
+    b = scheduler.submit('b', frame=1)
+    c = scheduler.submit('c', frame=1)
+    latest = scheduler.submit('a', frame=3)
+    assert stale.wait(1)['skipped']
+
+    run.blocked.clear()
+    run.release.set()
+    for ticket in (first, b, c, latest):
+        assert ticket.wait(5) is not None
+    # a went to the back of the line behind b and c, with its newest frame
+    assert run.ran == [('a', 1), ('b', 1), ('c', 1), ('a', 3)]
+
+def test_queued_frame_times_out_and_is_withdrawn():
+    run = BlockingRun(blocked={'a'})
+    scheduler = FrameScheduler(run, concurrency=1, timeout=0.1)
+    scheduler.submit('a', frame=1)
+    assert run.started.wait(5)
+
+    before = metrics.counters('ewaste_detection_timeouts_total').get((('stage', 'queued'),), 0)
+    assert scheduler.detect('b', frame=1)['error'] == 'Detection timed out'
+    assert metrics.counters('ewaste_detection_timeouts_total')[(('stage', 'queued'),)] == before + 1
+
+    run.release.set()
+    # Withdrawn, so it never runs
+    assert scheduler.detect('a', frame=2)['frame'] == 2
+    assert ('b', 1) not in run.ran
+
+def test_running_frame_is_abandoned_after_a_second_timeout():
+    run = BlockingRun(blocked={'a'})
+    scheduler = FrameScheduler(run, concurrency=1, timeout=0.1)
+    result = scheduler.detect('a', frame=1)
+    assert result['error'] == 'Detection timed out'
+    assert metrics.counters('ewaste_detection_timeouts_total')[(('stage', 'running'),)] >= 1
+    run.release.set()
@@ -0,0 +1,25 @@
+# python-backend\tests\test_startup.py
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = '''
+import sys
+import app
+assert 'cv2' not in sys.modules and 'numpy' not in sys.modules, 'app imported the vision stack'
+app.init_db()
+client = app.app.test_client()
+assert client.post('/save-rating', json={'vip_id': 1, 'rating': 4}).status_code == 200
+assert client.post('/events', json={'events': []}).status_code == 200
+assert client.get('/health').status_code == 503
+assert client.post('/detect-face', json={'image': 'x'}).status_code == 503
+assert client.options('/detect-face').status_code < 400
+'''
+
+def test_database_routes_are_served_before_the_vision_stack_loads(tmp_path):
+    env = dict(os.environ, EWASTE_DB_PATH=str(tmp_path / 'startup.db'))
+    completed = subprocess.run([sys.executable, '-c', SCRIPT], cwd=BACKEND_DIR, env=env,
+                               capture_output=True, text=True, timeout=120)
+    assert completed.returncode == 0, completed.stderr
@@ -0,0 +1,97 @@
+# python-backend\tests\test_vip_index.py
+import os
+
+import numpy as np
+import pytest
+
+from vip_index import VipIndex
+
+def embeddings(count, dim=128, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+
+def journal_path(index):
+    return os.path.join(index.directory, f'vip_journal_{index.generation}.log')
+
+def test_replay_restores_adds_updates_and_removals(tmp_path):
+    index = VipIndex(str(tmp_path), 0.6)
+    index.load()
+    index.add(1, embeddings(2, seed=1))
+    index.add(2, embeddings(1, seed=2))
+    index.update(1, embeddings(3, seed=3))
+    index.remove(2)
+
+    reloaded = VipIndex(str(tmp_path), 0.6)
+    assert reloaded.load() == 3
+    assert reloaded.vip_ids() == {1}
+    assert reloaded.match(embeddings(1, seed=3)[:1])[0][0] == 1
+
+def test_update_with_wrong_size_writes_nothing(tmp_path):
+    index = VipIndex(str(tmp_path), 0.6)
+    index.load()
+    index.add(1, embeddings(2))
+    size = os.path.getsize(journal_path(index))
+
+    with pytest.raises(ValueError):
+        index.update(1, embeddings(1, dim=1024))
+
+    assert os.path.getsize(journal_path(index)) == size
+    assert index.size == 2
+    assert VipIndex(str(tmp_path), 0.6).load() == 2
+
+def test_writer_truncates_torn_record(tmp_path):
+    index = VipIndex(str(tmp_path), 0.6)
+    index.load()
+    index.add(1, embeddings(1))
+    size = os.path.getsize(journal_path(index))
+    index.add(2, embeddings(1))
+    with open(journal_path(index), 'r+b') as f:
+        f.truncate(size + 10)
+
+    reloaded = VipIndex(str(tmp_path), 0.6)
+    assert reloaded.load() == 1
+    assert os.path.getsize(journal_path(reloaded)) == size
+
+def test_reader_keeps_partial_record(tmp_path):
+    writer = VipIndex(str(tmp_path), 0.6)
+    writer.load()
+    writer.add(1, embeddings(1))
+    size = os.path.getsize(journal_path(writer))
+    # A record half-way through being appended
+    record = writer._encode(1, 2, embeddings(1))
+    with open(journal_path(writer), 'ab') as f:
+        f.write(record[:20])
+
+    reader = VipIndex(str(tmp_path), 0.6, read_only=True)
+    assert reader.load() == 1
+    assert os.path.getsize(journal_path(reader)) == size + 20
+
+    with open(journal_path(writer), 'ab') as f:
+        f.write(record[20:])
+    assert reader.load() == 2
+    assert reader.vip_ids() == {1, 2}
+
+def test_reader_cannot_write(tmp_path):
+    reader = VipIndex(str(tmp_path), 0.6, read_only=True)
+    reader.load()
+    with pytest.raises(RuntimeError):
+        reader.add(1, embeddings(1))
+    with pytest.raises(RuntimeError):
+        reader.compact()
+    assert not os.path.exists(journal_path(reader))
+
+def test_compact_switches_generation_and_notifies(tmp_path):
+    index = VipIndex(str(tmp_path), 0.6)
+    index.load()
+    index.add(1, embeddings(2, seed=1))
+    index.add(2, embeddings(1, seed=2))
+    index.remove(2)
+    compacted = []
+    index.on_compact.append(lambda: compacted.append(index.generation))
+
+    index.compact()
+
+    assert compacted == [1]
+    reader = VipIndex(str(tmp_path), 0.6, read_only=True)
+    assert reader.load() == 2
+    assert reader.generation == 1
+    assert reader.vip_ids() == {1}
@@ -0,0 +1,18 @@
+# python-backend\tests\test_vip_stats.py
+from collections import deque
+
+from vip_stats import VipRecent
+
+def test_push_keeps_newest_first_when_commits_arrive_out_of_order():
+    buffer = deque([(5, 'e'), (3, 'c')], maxlen=4)
+    VipRecent.push(buffer, (7, 'g'))
+    VipRecent.push(buffer, (6, 'f'))  # committed before 7, callback ran after
+    VipRecent.push(buffer, (6, 'f'))
+    assert [entry[0] for entry in buffer] == [7, 6, 5, 3]
+
+def test_push_on_a_full_buffer_drops_the_oldest():
+    buffer = deque([(9, 'i'), (5, 'e'), (3, 'c')], maxlen=3)
+    VipRecent.push(buffer, (2, 'b'))
+    assert [entry[0] for entry in buffer] == [9, 5, 3]
+    VipRecent.push(buffer, (8, 'h'))
+    assert [entry[0] for entry in buffer] == [9, 8, 5]
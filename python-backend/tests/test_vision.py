@@ -0,0 +1,75 @@
+# python-backend\tests\test_vision.py
+import cv2
+import numpy as np
+
+import config
+import vision
+
+def drawn_face(eye_offset):
+    img = np.full((100, 100, 3), 90, np.uint8)
+    cv2.ellipse(img, (50, 50), (30, 40), 0, 0, 360, (170, 180, 200), -1)
+    for x in (50 - eye_offset, 50 + eye_offset):
+        cv2.circle(img, (x, 40), 5, (40, 40, 40), -1)
+    cv2.ellipse(img, (50, 72), (12, 4), 0, 0, 360, (60, 60, 120), -1)
+    return img
+
+def test_pixel_descriptors_match_with_the_fallback_threshold(monkeypatch, caplog):
+    monkeypatch.setattr(vision, 'EMBEDDING_MODEL', '/nonexistent/nn4.small2.v1.t7')
+    vision.load_vip_models()
+    assert vision.embedding_net is None
+    assert vision.vip_index.threshold == config.VIP_FALLBACK_THRESHOLD
+    assert 'pixel descriptors' in caplog.text
+
+    box = [(10, 5, 80, 90)]
+    enrolled, stranger = drawn_face(12), drawn_face(16)
+    vision.vip_index.add(7, vision.compute_embeddings(enrolled, box))
+
+    # Different faces still look alike as pixels...
+    a, b = vision.compute_embeddings(enrolled, box)[0], vision.compute_embeddings(stranger, box)[0]
+    assert a @ b / (np.linalg.norm(a) * np.linalg.norm(b)) > config.VIP_MATCH_THRESHOLD
+    # ...but only the enrolled one is recognized
+    assert vision.match_vips(stranger, box)[0][0] is None
+    assert vision.match_vips(enrolled, box)[0][0] == 7
+
+class StubDetector:
+    """Returns fixed boxes in the coordinates of whatever it is given"""
+
+    needs_color = False
+
+    def __init__(self, boxes):
+        self.boxes = boxes
+        self.seen = []
+
+    def detect(self, img, gray):
+        self.seen.append(gray.shape)
+        height, width = gray.shape[:2]
+        return [box(width, height) for box in self.boxes]
+
+def test_roi_boxes_come_back_in_full_frame_coordinates(monkeypatch):
+    stub = StubDetector([
+        lambda width, height: (0, 0, 10, 10, 0.9),
+        # Detectors clip to their input, so this one spans the whole crop
+        lambda width, height: (0, 0, width, height, 0.8),
+    ])
+    monkeypatch.setattr(vision, 'face_detector', stub)
+    img = np.zeros((480, 640, 3), np.uint8)
+    gray = np.zeros((480, 640), np.uint8)
+
+    # Radius 200 with a 0.5 margin reaches past the top and bottom of the frame
+    x0, y0, x1, y1 = vision.detection_roi(640, 480, radius=200, margin=0.5)
+    assert (x0, y0, x1, y1) == (20, 0, 620, 480)
+    monkeypatch.setattr(vision, 'detection_roi', lambda w, h: (x0, y0, x1, y1))
+
+    boxes = vision.detect_faces(img, gray, mode='roi', working_width=0)
+    assert stub.seen[-1] == (480, 600)
+    assert boxes == [(20, 0, 10, 10, 0.9), (20, 0, 600, 480, 0.8)]
+
+    # Downsized by 3: boxes are scaled back up and stay inside the frame
+    boxes = vision.detect_faces(img, gray, mode='roi', working_width=200)
+    assert stub.seen[-1] == (160, 200)
+    assert boxes == [(20, 0, 30, 30, 0.9), (20, 0, 600, 480, 0.8)]
+    for x, y, w, h, _ in boxes:
+        assert 0 <= x and 0 <= y and x + w <= 640 and y + h <= 480
+
+    # Full mode passes the detector's boxes through untouched
+    assert vision.detect_faces(img, gray, mode='full') == [(0, 0, 10, 10, 0.9), (0, 0, 640, 480, 0.8)]
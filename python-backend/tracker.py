@@ -0,0 +1,221 @@
+# python-backend\tracker.py
+"""Per-kiosk face tracking between full detections.
+
+Full detection + classification runs every Nth frame. In between, the last
+face box is followed with template matching on the grayscale frame, which
+costs a fraction of a detector pass. Each track keeps smoothed age/gender
+estimates and a vote over recent VIP matches so results don't flicker while
+the same person stands at the bin.
+"""
+
+import itertools
+import threading
+import time
+import traceback
+from collections import Counter, deque
+
+import cv2
+
+import vision
+from metrics import metrics
+from config import (
+    TRACK_AGE_SMOOTHING, TRACK_DETECT_INTERVAL, TRACK_IDLE_TIMEOUT,
+    TRACK_MIN_SCORE, TRACK_VIP_WINDOW,
+)
+
+# Templates are matched at this width at most, whatever the face size
+TEMPLATE_MAX_WIDTH = 48
+
+_track_ids = itertools.count(1)
+
+def _box_iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union else 0.0
+
+class FaceTrack:
+    """One tracked face with its smoothed demographics"""
+
+    def __init__(self, box, result):
+        self.track_id = next(_track_ids)
+        self.box = box
+        self.template = None
+        self.template_scale = 1.0
+        self.age = float(result["age"])
+        self.male_score = self._male_probability(result)
+        self.vip_votes = deque(maxlen=TRACK_VIP_WINDOW)
+        self.vip_votes.append(result.get("vip_id"))
+        self.result = result
+
+    @staticmethod
+    def _male_probability(result):
+        confidence = result.get("gender_confidence", 50.0) / 100.0
+        return confidence if result["gender"] == "Male" else 1.0 - confidence
+
+    def update_template(self, gray):
+        x, y, w, h = self.box
+        scale = min(1.0, TEMPLATE_MAX_WIDTH / w)
+        patch = gray[y:y + h, x:x + w]
+        if scale < 1.0:
+            patch = cv2.resize(patch, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        else:
+            # A slice would pin (and follow) the reused grayscale buffer
+            patch = patch.copy()
+        self.template = patch
+        self.template_scale = scale
+
+    def observe(self, box, result):
+        """Fold a fresh detection into the smoothed estimate"""
+        alpha = TRACK_AGE_SMOOTHING
+        self.box = box
+        self.age = (1 - alpha) * self.age + alpha * result["age"]
+        self.male_score = (1 - alpha) * self.male_score + alpha * self._male_probability(result)
+        self.vip_votes.append(result.get("vip_id"))
+        self.result = result
+
+    def smoothed_result(self, img_width, img_height):
+        """Latest result with the smoothed age/gender/VIP and the current box"""
+        result = dict(self.result)
+        result.update(vision.face_geometry(self.box, img_width, img_height))
+        result["age"] = int(round(self.age))
+        result["gender"] = "Male" if self.male_score >= 0.5 else "Female"
+        result["gender_confidence"] = round(max(self.male_score, 1 - self.male_score) * 100, 2)
+
+        # Majority vote over recent detections; a face outside the circle is never a VIP
+        vip_id, _ = Counter(self.vip_votes).most_common(1)[0]
+        if not result["in_detection_area"]:
+            vip_id = None
+        result["vip_id"] = vip_id
+        result["is_vip"] = vip_id is not None
+        result["track_id"] = self.track_id
+        return result
+
+    def follow(self, gray):
+        """Locate the track in a new frame; returns the match score (0-1)"""
+        img_height, img_width = gray.shape[:2]
+        x, y, w, h = self.box
+
+        # Search a window of twice the face size around the last position
+        sx0, sy0 = max(0, x - w // 2), max(0, y - h // 2)
+        sx1, sy1 = min(img_width, x + w + w // 2), min(img_height, y + h + h // 2)
+        search = gray[sy0:sy1, sx0:sx1]
+        if self.template_scale < 1.0:
+            search = cv2.resize(search, None, fx=self.template_scale, fy=self.template_scale,
+                                interpolation=cv2.INTER_AREA)
+
+        th, tw = self.template.shape[:2]
+        if search.shape[0] < th or search.shape[1] < tw:
+            return 0.0
+
+        scores = cv2.matchTemplate(search, self.template, cv2.TM_CCOEFF_NORMED)
+        _, score, _, (mx, my) = cv2.minMaxLoc(scores)
+        self.box = (
+            sx0 + int(mx / self.template_scale),
+            sy0 + int(my / self.template_scale),
+            w, h
+        )
+        return score
+
+class FaceTracker:
+    """Tracking state for one kiosk/camera"""
+
+    def __init__(self, detect_interval=TRACK_DETECT_INTERVAL, min_score=TRACK_MIN_SCORE):
+        self.detect_interval = max(1, detect_interval)
+        self.min_score = min_score
+        self.track = None
+        self.frames_since_detection = 0
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+        self.full_detections = 0
+        self.tracked_frames = 0
+
+    def process(self, img):
+        """Return the detection result for `img`, detecting or tracking as needed"""
+        with self.lock:
+            self.last_used = time.monotonic()
+            gray = vision.to_grayscale(img)
+            img_height, img_width = gray.shape[:2]
+
+            if self.track is not None and self.frames_since_detection < self.detect_interval:
+                with metrics.stage('track'):
+                    score = self.track.follow(gray)
+                if score >= self.min_score:
+                    self.frames_since_detection += 1
+                    self.tracked_frames += 1
+                    result = self.track.smoothed_result(img_width, img_height)
+                    result["tracked"] = True
+                    return result
+
+            return self._detect(img, gray, img_width, img_height)
+
+    def _detect(self, img, gray, img_width, img_height):
+        self.full_detections += 1
+        self.frames_since_detection = 0
+
+        faces, results = vision.detect_and_classify(img, gray)
+        if not results:
+            self.track = None
+            return {"gender": "Unknown", "age": 0, "error": "No face detected"}
+
+        index = vision.primary_result_index(results)
+        box = faces[index][:4]
+        result = results[index]
+
+        # Same person if the new box overlaps the tracked one; otherwise start over
+        if self.track is not None and _box_iou(self.track.box, box) > 0.3:
+            self.track.observe(box, result)
+        else:
+            self.track = FaceTrack(box, result)
+        self.track.update_template(gray)
+
+        result = self.track.smoothed_result(img_width, img_height)
+        result["tracked"] = False
+        return result
+
+class TrackerRegistry:
+    """FaceTracker per kiosk id, dropping trackers that have gone idle"""
+
+    def __init__(self, idle_timeout=TRACK_IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self._trackers = {}
+        self._lock = threading.Lock()
+
+    def get(self, kiosk_id):
+        with self._lock:
+            tracker = self._trackers.get(kiosk_id)
+            if tracker is None:
+                self._evict_idle()
+                tracker = self._trackers[kiosk_id] = FaceTracker()
+            return tracker
+
+    def _evict_idle(self):
+        cutoff = time.monotonic() - self.idle_timeout
+        for kiosk_id in [k for k, t in self._trackers.items() if t.last_used < cutoff]:
+            del self._trackers[kiosk_id]
+
+    def process(self, kiosk_id, img):
+        try:
+            if img is None or img.size == 0:
+                return {"gender": "Unknown", "age": 0, "error": "Invalid image data"}
+            return self.get(kiosk_id).process(img)
+        except Exception as e:
+            print(f"Error in face tracking: {str(e)}")
+            traceback.print_exc()
+            return {"gender": "Unknown", "age": 0, "error": str(e)}
+
+    def stats(self):
+        with self._lock:
+            return {
+                kiosk_id: {
+                    'full_detections': tracker.full_detections,
+                    'tracked_frames': tracker.tracked_frames,
+                    'track_id': tracker.track.track_id if tracker.track else None,
+                }
+                for kiosk_id, tracker in self._trackers.items()
+            }
+
+face_trackers = TrackerRegistry()
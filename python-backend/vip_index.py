@@ -0,0 +1,336 @@
+# python-backend\vip_index.py
+"""VIP face-embedding index.
+
+Enrolled embeddings (one L2-normalized float32 row per enrolled face photo)
+are kept in contiguous matrices with parallel arrays of VIP ids, so matching
+every face in a frame is one matrix product per segment.
+
+On disk, in VIP_MODELS_DIR:
+
+- ``manifest.json`` names the current generation.
+- ``vip_embeddings_<gen>.npy`` / ``vip_ids_<gen>.npy`` are the compacted base
+  segment, memory-mapped on load.
+- ``vip_journal_<gen>.log`` is an append-only log of enrollments and
+  removals made since that base was written.
+
+Writers append to the journal and publish a new in-memory snapshot; readers
+never lock. Compaction folds the journal into a new base generation once it
+grows past a threshold, so enrollment never rewrites the whole matrix.
+
+Only one process writes (the server). Detection workers open the index
+read-only: they replay the journal up to the last complete record and never
+truncate it, since a partial record at the end may be one the writer is
+still appending.
+"""
+
+import json
+import os
+import struct
+import threading
+
+import numpy as np
+
+MANIFEST_FILE = 'manifest.json'
+
+# Journal record: op (1 byte), vip_id (int64), row count (uint32), dim (uint32),
+# followed by rows * dim float32 values
+_RECORD_HEADER = struct.Struct('<BqII')
+OP_ADD = 1
+OP_REMOVE = 2
+
+def normalize_rows(embeddings):
+    """L2-normalize each row so dot products are cosine similarities"""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if embeddings.ndim == 1:
+        embeddings = embeddings[np.newaxis, :]
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+def _empty_segment():
+    return (np.empty((0, 0), dtype=np.float32), np.empty(0, dtype=np.int64))
+
+def _remove_ids(segments, vip_id):
+    """Copy of `segments` with every row of `vip_id` tombstoned (id -1)"""
+    updated = []
+    for matrix, ids in segments:
+        if np.any(ids == vip_id):
+            ids = np.where(ids == vip_id, -1, ids)
+        updated.append((matrix, ids))
+    return tuple(updated)
+
+class VipIndex:
+    """Enrolled VIP embeddings with vectorized nearest-neighbour lookup"""
+
+    def __init__(self, directory, threshold, compact_threshold=256, read_only=False):
+        self.directory = directory
+        self.threshold = threshold
+        self.compact_threshold = compact_threshold
+        self.read_only = read_only
+        # Called after a compaction has switched generations (e.g. to have
+        # read-only copies in other processes reload)
+        self.on_compact = []
+        self.generation = 0
+        self.journal_records = 0
+        self._journal = None
+        self._lock = threading.RLock()
+        self._compacting = False
+        # (base, tail) pair of (matrix, ids) segments: the memory-mapped base
+        # and the rows enrolled since. Replaced as a whole, never mutated, so
+        # readers can grab the reference without locking. Removed rows have id -1.
+        self._segments = (_empty_segment(), _empty_segment())
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    @property
+    def size(self):
+        """Number of live (not removed) enrolled embeddings"""
+        return int(sum(np.count_nonzero(ids >= 0) for _, ids in self._segments))
+
+    @property
+    def dim(self):
+        for matrix, ids in self._segments:
+            if len(ids):
+                return matrix.shape[1]
+        return None
+
+    def vip_ids(self):
+        """Set of VIP ids with at least one enrolled embedding"""
+        ids = set()
+        for _, segment_ids in self._segments:
+            ids.update(int(i) for i in np.unique(segment_ids) if i >= 0)
+        return ids
+
+    def load(self):
+        """Memory-map the base segment and replay the journal; returns live row count"""
+        with self._lock:
+            manifest_path = self._path(MANIFEST_FILE)
+            generation = 0
+            if os.path.exists(manifest_path):
+                with open(manifest_path) as f:
+                    generation = json.load(f)['generation']
+
+            base = _empty_segment()
+            embeddings_path = self._path(f'vip_embeddings_{generation}.npy')
+            ids_path = self._path(f'vip_ids_{generation}.npy')
+            if os.path.exists(embeddings_path) and os.path.exists(ids_path):
+                # Plain ndarray view over the mapping; avoids np.memmap overhead on every query
+                matrix = np.asarray(np.load(embeddings_path, mmap_mode='r'))
+                ids = np.load(ids_path).astype(np.int64, copy=False)
+                if matrix.ndim != 2 or len(matrix) != len(ids):
+                    raise ValueError(f"VIP index files are inconsistent: {matrix.shape} vs {ids.shape}")
+                base = (matrix, ids)
+
+            self.generation = generation
+            self._segments = (base, _empty_segment())
+            self.journal_records = self._replay_journal()
+            if not self.read_only:
+                self._open_journal()
+            return self.size
+
+    def _replay_journal(self):
+        journal_path = self._path(f'vip_journal_{self.generation}.log')
+        if not os.path.exists(journal_path):
+            return 0
+
+        records = 0
+        valid_bytes = 0
+        with open(journal_path, 'rb') as f:
+            data = f.read()
+        offset = 0
+        while offset + _RECORD_HEADER.size <= len(data):
+            op, vip_id, rows, dim = _RECORD_HEADER.unpack_from(data, offset)
+            end = offset + _RECORD_HEADER.size + rows * dim * 4
+            if end > len(data):
+                break  # Torn write from a crash, or a record still being appended
+            if op == OP_ADD:
+                embeddings = np.frombuffer(data, dtype=np.float32, count=rows * dim,
+                                           offset=offset + _RECORD_HEADER.size).reshape(rows, dim)
+                self._apply_add(vip_id, embeddings)
+            elif op == OP_REMOVE:
+                self._segments = _remove_ids(self._segments, vip_id)
+            offset = valid_bytes = end
+            records += 1
+
+        # Only the writer may cut off the partial record; for a reader it can
+        # be an append in progress
+        if valid_bytes < len(data) and not self.read_only:
+            with open(journal_path, 'r+b') as f:
+                f.truncate(valid_bytes)
+        return records
+
+    def _open_journal(self):
+        if self._journal is not None:
+            self._journal.close()
+        os.makedirs(self.directory, exist_ok=True)
+        self._journal = open(self._path(f'vip_journal_{self.generation}.log'), 'ab')
+
+    def _append_journal(self, records):
+        """Durably append encoded records before they become visible"""
+        if self.read_only:
+            raise RuntimeError("VIP index is open read-only")
+        if self._journal is None:
+            self._open_journal()
+        self._journal.write(b''.join(records))
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self.journal_records += len(records)
+
+    @staticmethod
+    def _encode(op, vip_id, rows=None):
+        if rows is None:
+            return _RECORD_HEADER.pack(op, vip_id, 0, 0)
+        return _RECORD_HEADER.pack(op, vip_id, rows.shape[0], rows.shape[1]) + rows.tobytes()
+
+    def _apply_add(self, vip_id, rows):
+        dim = self.dim
+        if dim is not None and rows.shape[1] != dim:
+            raise ValueError(f"Embedding size {rows.shape[1]} doesn't match index size {dim}")
+
+        # Enrollments accumulate in the in-memory tail; the base is untouched
+        base, (matrix, ids) = self._segments
+        new_ids = np.full(len(rows), vip_id, dtype=np.int64)
+        if len(ids):
+            tail = (np.vstack([matrix, rows]), np.concatenate([ids, new_ids]))
+        else:
+            tail = (np.array(rows, dtype=np.float32), new_ids)
+        self._segments = (base, tail)
+
+    def _check_dim(self, rows):
+        # Before anything is journaled: a bad record would fail every load()
+        dim = self.dim
+        if dim is not None and rows.shape[1] != dim:
+            raise ValueError(f"Embedding size {rows.shape[1]} doesn't match index size {dim}")
+
+    def add(self, vip_id, embeddings):
+        """Append one or more embeddings for `vip_id`"""
+        rows = normalize_rows(embeddings)
+        with self._lock:
+            self._check_dim(rows)
+            self._append_journal([self._encode(OP_ADD, vip_id, rows)])
+            self._apply_add(vip_id, rows)
+        self._maybe_compact()
+
+    def remove(self, vip_id):
+        """Drop every embedding of `vip_id`; returns how many rows were removed"""
+        with self._lock:
+            removed = sum(int(np.count_nonzero(ids == vip_id)) for _, ids in self._segments)
+            if removed:
+                self._append_journal([self._encode(OP_REMOVE, vip_id)])
+                self._segments = _remove_ids(self._segments, vip_id)
+        self._maybe_compact()
+        return removed
+
+    def update(self, vip_id, embeddings):
+        """Replace all embeddings of `vip_id` in one journal write"""
+        rows = normalize_rows(embeddings)
+        with self._lock:
+            self._check_dim(rows)
+            self._append_journal([self._encode(OP_REMOVE, vip_id), self._encode(OP_ADD, vip_id, rows)])
+            self._segments = _remove_ids(self._segments, vip_id)
+            self._apply_add(vip_id, rows)
+        self._maybe_compact()
+
+    def _maybe_compact(self):
+        if self.journal_records < self.compact_threshold or self._compacting:
+            return
+        self._compacting = True
+        threading.Thread(target=self.compact, daemon=True).start()
+
+    def compact(self):
+        """Fold the journal into a new base generation.
+
+        Writes happen under the writer lock, so enrollments wait for the
+        copy, but matching keeps using the old snapshot until the switch.
+        """
+        if self.read_only:
+            raise RuntimeError("VIP index is open read-only")
+        try:
+            with self._lock:
+                live = [(matrix, ids) for matrix, ids in self._segments if np.any(ids >= 0)]
+                matrices = [matrix[ids >= 0] for matrix, ids in live]
+                id_arrays = [ids[ids >= 0] for _, ids in live]
+                generation = self.generation + 1
+
+                if matrices:
+                    matrix = np.ascontiguousarray(np.vstack(matrices), dtype=np.float32)
+                    ids = np.concatenate(id_arrays)
+                else:
+                    matrix = np.empty((0, 0), dtype=np.float32)
+                    ids = np.empty(0, dtype=np.int64)
+
+                self._write_atomic(f'vip_embeddings_{generation}.npy', lambda f: np.save(f, matrix))
+                self._write_atomic(f'vip_ids_{generation}.npy', lambda f: np.save(f, ids))
+                self._write_atomic(MANIFEST_FILE, lambda f: f.write(json.dumps({'generation': generation}).encode()))
+
+                old_generation = self.generation
+                self.generation = generation
+                self.journal_records = 0
+                self._open_journal()
+                base = _empty_segment()
+                if len(ids):
+                    base = (np.asarray(np.load(self._path(f'vip_embeddings_{generation}.npy'), mmap_mode='r')), ids)
+                self._segments = (base, _empty_segment())
+
+                self._remove_generation(old_generation)
+        finally:
+            self._compacting = False
+
+        for callback in self.on_compact:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Error after VIP index compaction: {str(e)}")
+
+    def _write_atomic(self, name, write):
+        path = self._path(name)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _remove_generation(self, generation):
+        for name in (f'vip_embeddings_{generation}.npy', f'vip_ids_{generation}.npy', f'vip_journal_{generation}.log'):
+            try:
+                os.remove(self._path(name))
+            except OSError:
+                # Still mapped by a reader on some platforms; it'll be unused from now on
+                pass
+
+    def match(self, embeddings):
+        """Best VIP for each query embedding.
+
+        Returns a list of (vip_id, similarity); vip_id is None when the best
+        similarity is below the threshold or the index is empty.
+        """
+        queries = normalize_rows(embeddings)
+        best_scores = np.full(len(queries), -np.inf, dtype=np.float32)
+        best_ids = np.full(len(queries), -1, dtype=np.int64)
+
+        for matrix, ids in self._segments:
+            if not len(ids) or matrix.shape[1] != queries.shape[1]:
+                continue
+            similarities = queries @ matrix.T
+            similarities[:, ids < 0] = -np.inf
+            rows = np.argmax(similarities, axis=1)
+            scores = similarities[np.arange(len(queries)), rows]
+            better = scores > best_scores
+            best_scores[better] = scores[better]
+            best_ids[better] = ids[rows[better]]
+
+        return [
+            (int(vip_id) if vip_id >= 0 and score >= self.threshold else None,
+             float(score) if np.isfinite(score) else 0.0)
+            for vip_id, score in zip(best_ids, best_scores)
+        ]
+
+    def stats(self):
+        return {
+            'generation': self.generation,
+            'embeddings': self.size,
+            'vips': len(self.vip_ids()),
+            'journal_records': self.journal_records,
+            'dim': self.dim,
+        }
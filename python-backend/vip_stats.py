@@ -0,0 +1,214 @@
+# python-backend\vip_stats.py
+"""Incrementally maintained VIP statistics.
+
+save_rating and save_waste_disposal update per-VIP running totals
+(vip_stats) and per-waste-type / per-box counters inside their own
+transactions, and recompute vip_profiles.average_rating from the running
+sum. The last ten disposals and ratings of each VIP are kept in in-memory
+ring buffers, loaded from the database the first time a VIP is asked for.
+/get-vip-stats then reads a handful of primary-key rows plus the buffers,
+however long the VIP's history is.
+"""
+
+import threading
+from collections import deque
+
+import db
+from flow_states import vip_key
+
+RECENT_LIMIT = 10
+
+def _update_average_rating(cursor, vip_id):
+    cursor.execute(
+        """UPDATE vip_profiles
+           SET average_rating = (
+               SELECT rating_sum / rating_count FROM vip_stats
+               WHERE vip_id = ? AND rating_count > 0
+           )
+           WHERE vip_id = ?""",
+        (vip_id, vip_id)
+    )
+
+class VipRecent:
+    """Ring buffers of one VIP's latest disposals and ratings, newest first.
+
+    Entries carry the row id first so a buffer filled from the database and
+    a concurrent write can't record the same row twice.
+    """
+
+    def __init__(self, disposals, ratings):
+        self.disposals = deque(disposals, maxlen=RECENT_LIMIT)
+        self.ratings = deque(ratings, maxlen=RECENT_LIMIT)
+
+    @staticmethod
+    def push(buffer, entry):
+        """Insert `entry` in id order; commit callbacks can arrive out of order"""
+        index = 0
+        while index < len(buffer) and buffer[index][0] > entry[0]:
+            index += 1
+        if index < len(buffer) and buffer[index][0] == entry[0]:
+            return  # Already there
+        if len(buffer) == buffer.maxlen:
+            if index == len(buffer):
+                return  # Older than everything kept
+            buffer.pop()
+        buffer.insert(index, entry)
+
+class VipStatsAggregator:
+    """Writes aggregate updates alongside the raw rows and serves the reads"""
+
+    def __init__(self):
+        self._recent = {}
+        self._lock = threading.Lock()
+
+    # Writes; called inside the route's transaction
+
+    def record_disposal(self, cursor, disposal_id, vip_id, waste_type, box_number, timestamp):
+        if vip_id is None:
+            return
+        cursor.execute(
+            """INSERT INTO vip_stats (vip_id, total_disposals, last_disposal)
+               VALUES (?, 1, ?)
+               ON CONFLICT (vip_id) DO UPDATE SET
+                   total_disposals = total_disposals + 1,
+                   last_disposal = excluded.last_disposal""",
+            (vip_id, timestamp)
+        )
+        cursor.execute(
+            """INSERT INTO vip_waste_counts (vip_id, waste_type, count)
+               VALUES (?, ?, 1)
+               ON CONFLICT (vip_id, waste_type) DO UPDATE SET count = count + 1""",
+            (vip_id, waste_type or '')
+        )
+        cursor.execute(
+            """INSERT INTO vip_box_counts (vip_id, box_number, count)
+               VALUES (?, ?, 1)
+               ON CONFLICT (vip_id, box_number) DO UPDATE SET count = count + 1""",
+            (vip_id, box_number or '')
+        )
+
+        entry = (disposal_id, waste_type, box_number, timestamp)
+        cursor.on_commit.append(lambda: self._push(vip_id, 'disposals', entry))
+
+    def record_rating(self, cursor, rating_id, vip_id, rating, timestamp):
+        if vip_id is None:
+            return
+        counted = 0 if rating is None else 1
+        cursor.execute(
+            """INSERT INTO vip_stats (vip_id, rating_count, rating_sum, last_rating)
+               VALUES (?, ?, COALESCE(?, 0), ?)
+               ON CONFLICT (vip_id) DO UPDATE SET
+                   rating_count = rating_count + excluded.rating_count,
+                   rating_sum = rating_sum + excluded.rating_sum,
+                   last_rating = excluded.last_rating""",
+            (vip_id, counted, rating, timestamp)
+        )
+        _update_average_rating(cursor, vip_id)
+
+        entry = [rating_id, rating, timestamp, 0]
+        cursor.on_commit.append(lambda: self._push(vip_id, 'ratings', entry))
+
+    def record_photo(self, cursor, vip_id, rating_id):
+        """Mark a buffered rating as having its photo taken once committed"""
+        if vip_id is None or rating_id is None:
+            return
+        cursor.on_commit.append(lambda: self._mark_photo(vip_id, rating_id))
+
+    def _push(self, vip_id, kind, entry):
+        with self._lock:
+            recent = self._recent.get(vip_key(vip_id))
+            if recent is not None:
+                VipRecent.push(getattr(recent, kind), entry)
+
+    def _mark_photo(self, vip_id, rating_id):
+        with self._lock:
+            recent = self._recent.get(vip_key(vip_id))
+            if recent is None:
+                return
+            for entry in recent.ratings:
+                if entry[0] == vip_key(rating_id):
+                    entry[3] = 1
+
+    # Reads
+
+    def _load_recent(self, vip_id):
+        with db.connection() as conn:
+            disposals = conn.execute(
+                """SELECT id, waste_type, box_number, timestamp
+                   FROM waste_disposal
+                   WHERE vip_id = ?
+                   ORDER BY id DESC
+                   LIMIT ?""",
+                (vip_id, RECENT_LIMIT)
+            ).fetchall()
+            ratings = conn.execute(
+                """SELECT id, rating, timestamp, photo_taken
+                   FROM ratings
+                   WHERE vip_id = ?
+                   ORDER BY id DESC
+                   LIMIT ?""",
+                (vip_id, RECENT_LIMIT)
+            ).fetchall()
+        return VipRecent(disposals, [list(row) for row in ratings])
+
+    def recent(self, vip_id):
+        """(disposals, ratings) of the VIP's latest rows, newest first"""
+        key = vip_key(vip_id)
+        with self._lock:
+            recent = self._recent.get(key)
+            if recent is None:
+                # Loaded under the lock so no committed write can slip between
+                # the query and the buffer becoming visible
+                recent = self._recent[key] = self._load_recent(vip_id)
+            disposals = [list(entry[1:]) for entry in recent.disposals]
+            ratings = [list(entry[1:]) for entry in recent.ratings]
+        return disposals, ratings
+
+    def totals(self, vip_id):
+        """Running totals and per-type/per-box counters for `vip_id`"""
+        with db.connection() as conn:
+            row = conn.execute(
+                """SELECT total_disposals, rating_count, rating_sum, last_disposal, last_rating
+                   FROM vip_stats WHERE vip_id = ?""",
+                (vip_id,)
+            ).fetchone()
+            waste_counts = conn.execute(
+                "SELECT waste_type, count FROM vip_waste_counts WHERE vip_id = ?",
+                (vip_id,)
+            ).fetchall()
+            box_counts = conn.execute(
+                "SELECT box_number, count FROM vip_box_counts WHERE vip_id = ?",
+                (vip_id,)
+            ).fetchall()
+
+        total_disposals, rating_count, rating_sum, last_disposal, last_rating = row or (0, 0, 0, None, None)
+        return {
+            'total_disposals': total_disposals,
+            'rating_count': rating_count,
+            'average_rating': round(rating_sum / rating_count, 2) if rating_count else 0.0,
+            'last_disposal': last_disposal,
+            'last_rating': last_rating,
+            'waste_types': dict(waste_counts),
+            'boxes': dict(box_counts),
+        }
+
+    def stats(self, vip_id):
+        disposals, ratings = self.recent(vip_id)
+        totals = self.totals(vip_id)
+
+        # Rolling average over the ratings in the ring buffer
+        recent_values = [rating for rating, _, _ in ratings if isinstance(rating, (int, float))]
+        totals['recent_average_rating'] = (
+            round(sum(recent_values) / len(recent_values), 2) if recent_values else 0.0
+        )
+        return disposals, ratings, totals
+
+    def invalidate(self, vip_id=None):
+        """Drop buffered history (one VIP, or all) so it's reloaded on next read"""
+        with self._lock:
+            if vip_id is None:
+                self._recent.clear()
+            else:
+                self._recent.pop(vip_key(vip_id), None)
+
+vip_stats_aggregator = VipStatsAggregator()
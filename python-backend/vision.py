@@ -0,0 +1,598 @@
+# python-backend\vision.py
+"""Face detection and age/gender inference pipeline"""
+
+import base64
+import logging
+import os
+import random
+import threading
+import time
+import traceback
+
+import cv2
+import numpy as np
+
+from config import (
+    AGE_MODEL, AGE_PROTO, DETECTION_MODE, DETECTION_RADIUS,
+    DNN_BACKEND, DNN_TARGET, DNN_THREADS, EMBEDDING_MODEL, FACE_DETECTOR, GENDER_MODEL, GENDER_PROTO,
+    HAAR_MAX_INPUT_WIDTH, HAAR_MIN_NEIGHBORS, HAAR_MIN_SIZE, HAAR_SCALE_FACTOR,
+    ROI_MARGIN, ROI_WORKING_WIDTH, SSD_CONFIDENCE, SSD_INPUT_SIZE, SSD_MODEL, SSD_PROTO,
+    VIP_COMPACT_THRESHOLD, VIP_FALLBACK_THRESHOLD, VIP_MATCH_THRESHOLD, VIP_MODELS_DIR,
+)
+from metrics import metrics
+from vip_index import VipIndex
+
+log = logging.getLogger(__name__)
+
+# Global variables
+face_detector = None
+age_net = None
+gender_net = None
+embedding_net = None
+vip_index = None
+
+# cv2.dnn.Net objects hold per-call state between setInput() and forward(),
+# so concurrent requests have to take turns on each network
+_age_net_lock = threading.Lock()
+_gender_net_lock = threading.Lock()
+_embedding_net_lock = threading.Lock()
+
+# Levi & Hassner age/gender networks: 227x227 BGR input with per-channel mean
+AGE_GENDER_INPUT_SIZE = (227, 227)
+AGE_GENDER_MEAN = (78.4263377603, 87.7689143744, 114.895847746)
+AGE_BUCKETS = ['(0-2)', '(4-6)', '(8-12)', '(15-20)', '(25-32)', '(38-43)', '(48-53)', '(60-100)']
+AGE_BUCKET_MIDPOINTS = np.array([1, 5, 10, 17.5, 28.5, 40.5, 50.5, 70], dtype=np.float32)
+GENDER_LABELS = ['Male', 'Female']
+
+# Extra context around a detected face box before cropping for classification
+FACE_CROP_PADDING = 0.2
+
+# OpenFace embedding network: 96x96 RGB input scaled to 0-1, 128-d output
+EMBEDDING_INPUT_SIZE = (96, 96)
+# Fallback descriptor: equalized grayscale thumbnail of the face
+FALLBACK_EMBEDDING_SIZE = (32, 32)
+
+DNN_BACKENDS = {
+    'default': cv2.dnn.DNN_BACKEND_DEFAULT,
+    'opencv': cv2.dnn.DNN_BACKEND_OPENCV,
+    'openvino': cv2.dnn.DNN_BACKEND_INFERENCE_ENGINE,
+    'cuda': cv2.dnn.DNN_BACKEND_CUDA,
+}
+
+DNN_TARGETS = {
+    'cpu': cv2.dnn.DNN_TARGET_CPU,
+    'opencl': cv2.dnn.DNN_TARGET_OPENCL,
+    'opencl_fp16': cv2.dnn.DNN_TARGET_OPENCL_FP16,
+    'cuda': cv2.dnn.DNN_TARGET_CUDA,
+    'cuda_fp16': cv2.dnn.DNN_TARGET_CUDA_FP16,
+}
+
+def _configure_net(net):
+    net.setPreferableBackend(DNN_BACKENDS.get(DNN_BACKEND, cv2.dnn.DNN_BACKEND_DEFAULT))
+    net.setPreferableTarget(DNN_TARGETS.get(DNN_TARGET, cv2.dnn.DNN_TARGET_CPU))
+    return net
+
+def load_dnn_net(proto_path, model_path):
+    """Load a Caffe network with the configured backend/target.
+
+    Returns None when the weights file isn't installed so callers can fall
+    back to the heuristics.
+    """
+    if not os.path.exists(proto_path) or not os.path.exists(model_path):
+        print(f"DNN model not found ({os.path.basename(model_path)}), skipping")
+        return None
+
+    return _configure_net(cv2.dnn.readNetFromCaffe(proto_path, model_path))
+
+def load_haar_cascade():
+    """OpenCV's bundled frontal-face cascade, or None if it can't be read"""
+    path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+    cascade = cv2.CascadeClassifier(path)
+    if cascade.empty():
+        print(f"Error: Couldn't load face cascade from {path}")
+        return None
+    return cascade
+
+def load_vip_models(read_only=False):
+    """Load the face embedding network and the enrolled VIP index.
+
+    `read_only` is for detection workers: they match against the index but
+    only the server writes it.
+    """
+    global embedding_net, vip_index
+
+    start = time.perf_counter()
+    threshold = VIP_MATCH_THRESHOLD
+    if os.path.exists(EMBEDDING_MODEL):
+        embedding_net = _configure_net(cv2.dnn.readNetFromTorch(EMBEDDING_MODEL))
+        print("Face embedding model loaded successfully")
+    else:
+        embedding_net = None
+        # Pixel descriptors of different people are far more alike than embeddings
+        threshold = VIP_FALLBACK_THRESHOLD
+        if not read_only:
+            log.warning("Face embedding model not found (%s): VIP matching uses pixel "
+                        "descriptors with threshold %.2f", os.path.basename(EMBEDDING_MODEL), threshold)
+
+    if embedding_net is not None:
+        metrics.set('ewaste_model_load_seconds', time.perf_counter() - start, model='embedding')
+
+    start = time.perf_counter()
+    index = VipIndex(VIP_MODELS_DIR, threshold, VIP_COMPACT_THRESHOLD, read_only=read_only)
+    count = index.load()
+    vip_index = index
+    metrics.set('ewaste_model_load_seconds', time.perf_counter() - start, model='vip_index')
+    print(f"VIP index loaded: {count} enrolled embeddings")
+
+class HaarFaceDetector:
+    """Viola-Jones cascade detector"""
+
+    name = 'haar'
+    needs_color = False
+
+    def __init__(self, cascade, scale_factor=HAAR_SCALE_FACTOR, min_neighbors=HAAR_MIN_NEIGHBORS,
+                 min_size=HAAR_MIN_SIZE, max_input_width=HAAR_MAX_INPUT_WIDTH):
+        self.cascade = cascade
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = min_size
+        self.max_input_width = max_input_width
+
+    def detect(self, img, gray):
+        """Return a list of (x, y, w, h, confidence) boxes in `gray` pixel coordinates.
+
+        The cascade has no calibrated score, so confidence is None.
+        """
+        scale = 1.0
+        if self.max_input_width and gray.shape[1] > self.max_input_width:
+            scale = self.max_input_width / gray.shape[1]
+            gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+        min_size = max(1, int(round(self.min_size * scale)))
+        faces = self.cascade.detectMultiScale(
+            gray,
+            scaleFactor=self.scale_factor,
+            minNeighbors=self.min_neighbors,
+            minSize=(min_size, min_size),
+            flags=cv2.CASCADE_SCALE_IMAGE
+        )
+
+        return [
+            (int(x / scale), int(y / scale), int(w / scale), int(h / scale), None)
+            for (x, y, w, h) in faces
+        ]
+
+class SsdFaceDetector:
+    """ResNet-10 SSD face detector (models/deploy.prototxt.txt)"""
+
+    name = 'ssd'
+    needs_color = True
+
+    # The SSD was trained on BGR input with this mean subtracted
+    MEAN = (104.0, 177.0, 123.0)
+
+    def __init__(self, net, input_size=SSD_INPUT_SIZE, confidence_threshold=SSD_CONFIDENCE):
+        self.net = net
+        self.input_size = input_size
+        self.confidence_threshold = confidence_threshold
+        self._lock = threading.Lock()
+
+    def detect(self, img, gray):
+        """Return a list of (x, y, w, h, confidence) boxes, confidence in 0-1"""
+        if img.ndim == 2:
+            img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+        img_height, img_width = img.shape[:2]
+
+        blob = cv2.dnn.blobFromImage(
+            img, 1.0, (self.input_size, self.input_size), self.MEAN, swapRB=False, crop=False
+        )
+        detections = _forward_batch(self.net, self._lock, blob)[0, 0]
+
+        # Rows are [image_id, label, confidence, x0, y0, x1, y1] with normalized coords
+        detections = detections[detections[:, 2] >= self.confidence_threshold]
+        boxes = []
+        for confidence, x0, y0, x1, y1 in detections[:, 2:7]:
+            x0 = int(max(0.0, x0) * img_width)
+            y0 = int(max(0.0, y0) * img_height)
+            x1 = int(min(1.0, x1) * img_width)
+            y1 = int(min(1.0, y1) * img_height)
+            if x1 > x0 and y1 > y0:
+                boxes.append((x0, y0, x1 - x0, y1 - y0, float(confidence)))
+        return boxes
+
+def create_face_detector(name, **settings):
+    """Build a face detector by name ('haar' or 'ssd').
+
+    `settings` override the configured per-detector parameters, e.g.
+    `create_face_detector('ssd', confidence_threshold=0.7)`. Returns None
+    if the requested detector's model files aren't available.
+    """
+    if name == 'ssd':
+        net = load_dnn_net(SSD_PROTO, SSD_MODEL)
+        return SsdFaceDetector(net, **settings) if net is not None else None
+
+    if name == 'haar':
+        cascade = load_haar_cascade()
+        return HaarFaceDetector(cascade, **settings) if cascade is not None else None
+
+    raise ValueError(f"Unknown face detector: {name}")
+
+def select_face_detector(name, **settings):
+    """Switch the detector used by analyze_frame(); returns True on success"""
+    global face_detector
+
+    detector = create_face_detector(name, **settings)
+    if detector is None:
+        return False
+    face_detector = detector
+    return True
+
+def init_models(read_only_index=False):
+    """Initialize computer vision models"""
+    global age_net, gender_net
+
+    try:
+        if DNN_THREADS > 0:
+            cv2.setNumThreads(DNN_THREADS)
+
+        # Load face detection classifier
+        start = time.perf_counter()
+
+        # The cascade doubles as the fallback if the configured detector can't load
+        if not select_face_detector(FACE_DETECTOR):
+            print(f"Face detector '{FACE_DETECTOR}' unavailable, using haar")
+            if not select_face_detector('haar'):
+                return False
+
+        print(f"Face detection model loaded successfully ({face_detector.name})")
+        metrics.set('ewaste_model_load_seconds', time.perf_counter() - start, model='face_detector')
+
+        # Age/gender networks are optional; without them we use heuristics
+        start = time.perf_counter()
+        age_net = load_dnn_net(AGE_PROTO, AGE_MODEL)
+        gender_net = load_dnn_net(GENDER_PROTO, GENDER_MODEL)
+        if age_net is not None and gender_net is not None:
+            print(f"Age/gender models loaded (backend={DNN_BACKEND}, target={DNN_TARGET})")
+            metrics.set('ewaste_model_load_seconds', time.perf_counter() - start, model='age_gender')
+
+        load_vip_models(read_only_index)
+
+        return True
+    except Exception as e:
+        print(f"Error loading models: {str(e)}")
+        traceback.print_exc()
+        return False
+
+def warm_up(width=640, height=480):
+    """Run one dummy inference through every loaded network.
+
+    OpenCV allocates its buffers and picks kernels on the first call, so
+    without this the first real frame after a start is several times slower.
+    """
+    if face_detector is None:
+        return
+    start = time.perf_counter()
+    img = np.zeros((height, width, 3), dtype=np.uint8)
+    box = [(width // 4, height // 4, width // 2, height // 2)]
+    # Keep the dummy frame out of the stage timings
+    with metrics.capture():
+        face_detector.detect(img, to_grayscale(img))
+        if age_net is not None and gender_net is not None:
+            classify_faces(img, box)
+        if embedding_net is not None:
+            compute_embeddings(img, box)
+    metrics.set('ewaste_model_load_seconds', time.perf_counter() - start, model='warm_up')
+
+def read_frame_body(stream, content_length):
+    """Read a binary request body straight into a uint8 array (one copy).
+
+    Every request gets its own buffer: under the threaded server each
+    request runs on a new thread, so per-thread buffers were never reused,
+    and a frame can outlive its response (a timed-out detection still
+    running on it, or a face track's template).
+    """
+    buf = bytearray(content_length)
+    view = memoryview(buf)
+    read = 0
+    while read < content_length:
+        n = stream.readinto(view[read:])
+        if not n:
+            break
+        read += n
+    return np.frombuffer(buf, dtype=np.uint8, count=read)
+
+def data_url_bytes(image_data):
+    """Encoded image bytes (uint8 array) from a base64 data URL"""
+    header, encoded = image_data.split(',', 1)
+    return np.frombuffer(base64.b64decode(encoded), np.uint8)
+
+def decode_data_url(image_data):
+    """Decode a base64 data URL (as sent by canvas.toDataURL) into a BGR image"""
+    return cv2.imdecode(data_url_bytes(image_data), cv2.IMREAD_COLOR)
+
+def read_image_file(path):
+    """Load an image file from disk as BGR (None if unreadable)"""
+    return cv2.imread(path, cv2.IMREAD_COLOR)
+
+def decode_frame_bytes(frame_bytes, width=None, height=None, channels=None):
+    """Decode a binary frame.
+
+    Without dimensions the bytes are treated as an encoded image (JPEG/PNG).
+    With width and height they are raw pixels: 1 channel for grayscale, 3 for BGR.
+    """
+    if width is None or height is None:
+        return cv2.imdecode(frame_bytes, cv2.IMREAD_COLOR)
+
+    channels = channels or 1
+    if channels not in (1, 3):
+        raise ValueError(f"Unsupported channel count: {channels}")
+    expected = width * height * channels
+    if frame_bytes.size < expected:
+        raise ValueError(f"Expected {expected} bytes for {width}x{height}x{channels}, got {frame_bytes.size}")
+
+    shape = (height, width) if channels == 1 else (height, width, 3)
+    return frame_bytes[:expected].reshape(shape)
+
+def crop_faces(img, boxes, padding=FACE_CROP_PADDING):
+    """Crop padded BGR face regions for the classification networks"""
+    img_height, img_width = img.shape[:2]
+    crops = []
+    for (x, y, w, h) in boxes:
+        pad_x = int(w * padding)
+        pad_y = int(h * padding)
+        x0, y0 = max(0, x - pad_x), max(0, y - pad_y)
+        x1, y1 = min(img_width, x + w + pad_x), min(img_height, y + h + pad_y)
+        crop = img[y0:y1, x0:x1]
+        if crop.ndim == 2:
+            crop = cv2.cvtColor(crop, cv2.COLOR_GRAY2BGR)
+        crops.append(crop)
+    return crops
+
+def _forward_batch(net, lock, blob):
+    with lock:
+        net.setInput(blob)
+        return net.forward()
+
+def classify_faces(img, boxes):
+    """Estimate gender and age for every face box in one forward pass per network.
+
+    Returns one dict per box with gender, age and their confidences (0-100).
+    """
+    if not boxes:
+        return []
+
+    if age_net is None or gender_net is None:
+        return [estimate_age_gender_heuristic(w, h) for (x, y, w, h) in boxes]
+
+    # All faces of the frame go into a single NCHW batch
+    blob = cv2.dnn.blobFromImages(
+        crop_faces(img, boxes), 1.0, AGE_GENDER_INPUT_SIZE,
+        AGE_GENDER_MEAN, swapRB=False, crop=False
+    )
+    gender_probs = _forward_batch(gender_net, _gender_net_lock, blob)
+    age_probs = _forward_batch(age_net, _age_net_lock, blob)
+
+    predictions = []
+    for gender_p, age_p in zip(gender_probs, age_probs):
+        gender_idx = int(np.argmax(gender_p))
+        # Expected age over the buckets is steadier than the arg-max bucket
+        age = float(np.dot(age_p, AGE_BUCKET_MIDPOINTS))
+        predictions.append({
+            "gender": GENDER_LABELS[gender_idx],
+            "gender_confidence": round(float(gender_p[gender_idx]) * 100, 2),
+            "age": int(round(age)),
+            "age_confidence": round(float(np.max(age_p)) * 100, 2),
+        })
+    return predictions
+
+def compute_embeddings(img, boxes):
+    """Face embeddings for every box, one row per face (not normalized)"""
+    if embedding_net is not None:
+        blob = cv2.dnn.blobFromImages(
+            crop_faces(img, boxes, padding=0), 1.0 / 255, EMBEDDING_INPUT_SIZE,
+            (0, 0, 0), swapRB=True, crop=False
+        )
+        return _forward_batch(embedding_net, _embedding_net_lock, blob).reshape(len(boxes), -1)
+
+    gray = to_grayscale(img)
+    descriptors = np.empty((len(boxes), FALLBACK_EMBEDDING_SIZE[0] * FALLBACK_EMBEDDING_SIZE[1]), dtype=np.float32)
+    for i, (x, y, w, h) in enumerate(boxes):
+        thumb = cv2.equalizeHist(cv2.resize(gray[y:y + h, x:x + w], FALLBACK_EMBEDDING_SIZE, interpolation=cv2.INTER_AREA))
+        descriptors[i] = thumb.ravel()
+    # Zero-mean each descriptor so cosine similarity ignores overall brightness
+    return descriptors - descriptors.mean(axis=1, keepdims=True)
+
+def match_vips(img, boxes):
+    """(vip_id, similarity) for each face box against the enrolled VIP index"""
+    if not boxes or vip_index is None or not vip_index.size:
+        return [(None, 0.0)] * len(boxes)
+    return vip_index.match(compute_embeddings(img, boxes))
+
+def enrollment_embedding(img):
+    """Embedding of the largest face in an enrollment photo, or None if there is no face"""
+    faces = detect_faces(img, to_grayscale(img), mode='full')
+    if not faces:
+        return None
+    x, y, w, h, _ = max(faces, key=lambda face: face[2] * face[3])
+    return compute_embeddings(img, [(x, y, w, h)])[0]
+
+def estimate_age_gender_heuristic(w, h):
+    """Fallback when the age/gender networks aren't installed"""
+    # Simple heuristic for gender
+    face_ratio = w / h
+    gender = "Male" if face_ratio > 0.9 else "Female"
+
+    # Simple age estimation using face size as a rough indicator
+    face_area = w * h
+    age = 25 + int(face_area / 1000) + random.randint(-5, 5)
+    age = max(18, min(65, age))  # Clamp between 18-65
+
+    return {
+        "gender": gender,
+        "gender_confidence": round(random.uniform(75, 95), 2),
+        "age": int(age),
+        "age_confidence": round(random.uniform(70, 90), 2),
+    }
+
+def detection_roi(img_width, img_height, radius=DETECTION_RADIUS, margin=ROI_MARGIN):
+    """Bounding box (x0, y0, x1, y1) of the detection circle plus margin, clipped to the frame"""
+    half = radius * (1 + margin)
+    center_x, center_y = img_width / 2, img_height / 2
+    x0 = max(0, int(center_x - half))
+    y0 = max(0, int(center_y - half))
+    x1 = min(img_width, int(np.ceil(center_x + half)))
+    y1 = min(img_height, int(np.ceil(center_y + half)))
+    return x0, y0, x1, y1
+
+def detect_faces(img, gray, mode=DETECTION_MODE, working_width=ROI_WORKING_WIDTH):
+    """Run the face detector and return boxes in full-frame pixel coordinates.
+
+    In 'roi' mode only the detection circle's bounding box is searched,
+    optionally downsized to `working_width`, and the boxes are mapped back.
+    """
+    if mode != 'roi':
+        return face_detector.detect(img, gray)
+
+    img_height, img_width = gray.shape[:2]
+    x0, y0, x1, y1 = detection_roi(img_width, img_height)
+    roi_gray = gray[y0:y1, x0:x1]
+    roi_img = img[y0:y1, x0:x1]
+
+    scale = 1.0
+    if working_width and roi_gray.shape[1] > working_width:
+        scale = working_width / roi_gray.shape[1]
+        roi_gray = cv2.resize(roi_gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        # Only resize the color crop for detectors that actually read it
+        roi_img = (
+            cv2.resize(roi_img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            if face_detector.needs_color else roi_gray
+        )
+
+    return [
+        (x0 + int(x / scale), y0 + int(y / scale), int(w / scale), int(h / scale), confidence)
+        for (x, y, w, h, confidence) in face_detector.detect(roi_img, roi_gray)
+    ]
+
+def to_grayscale(img):
+    """Grayscale view of a frame (raw grayscale uploads are returned as-is)"""
+    if img.ndim == 2:
+        return img
+    with metrics.stage('grayscale'):
+        return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+def face_geometry(box, img_width, img_height):
+    """Normalized face coordinates and distance from the frame centre for a box"""
+    x, y, w, h = box
+
+    # Calculate face coordinates as percentages
+    face_coords = {
+        "x": float(x) / img_width,
+        "y": float(y) / img_height,
+        "width": float(w) / img_width,
+        "height": float(h) / img_height
+    }
+
+    # Check if face is in center detection area
+    face_center_x = x + w/2
+    face_center_y = y + h/2
+    img_center_x = img_width / 2
+    img_center_y = img_height / 2
+
+    # Calculate if face is in detection circle
+    distance_from_center = np.sqrt(
+        (face_center_x - img_center_x)**2 +
+        (face_center_y - img_center_y)**2
+    )
+
+    in_detection_area = distance_from_center < DETECTION_RADIUS
+
+    return {
+        "face_coords": face_coords,
+        "in_detection_area": bool(in_detection_area),  # Explicitly convert to bool
+        "distance_from_center": float(distance_from_center)  # For debugging
+    }
+
+def assign_vip(result, vip_id, similarity):
+    """Fill in is_vip/vip_id on a face result from its VIP index match"""
+    result["is_vip"] = vip_id is not None
+    result["vip_id"] = vip_id
+    result["vip_similarity"] = round(similarity, 4)
+    return result
+
+def build_face_result(face, prediction, img_width, img_height):
+    """Assemble the /detect-face result dict for one detected face"""
+    x, y, w, h, detection_confidence = face
+    log.debug("face x=%d y=%d w=%d h=%d", x, y, w, h)
+
+    result = {
+        "gender": prediction["gender"],
+        "age": int(prediction["age"]),  # Ensure it's an integer
+        "gender_confidence": prediction["gender_confidence"],
+        "age_confidence": prediction["age_confidence"],
+        "face_confidence": (
+            round(detection_confidence * 100, 2) if detection_confidence is not None
+            else round(85.0 + random.uniform(0, 10), 2)
+        ),
+    }
+    result.update(face_geometry((x, y, w, h), img_width, img_height))
+
+    log.debug("face distance_from_center=%.1f in_area=%s",
+              result['distance_from_center'], result['in_detection_area'])
+
+    return assign_vip(result, None, 0.0)
+
+def primary_result_index(results):
+    """Index of the face to report: first in the detection area, else the first found"""
+    for i, result in enumerate(results):
+        if result.get("in_detection_area", False):
+            return i
+    return 0
+
+def detect_and_classify(img, gray):
+    """Full pipeline over a frame; returns (faces, results) in matching order"""
+    with metrics.stage('detect'):
+        faces = [face for face in detect_faces(img, gray) if face[2] > 0 and face[3] > 0]
+
+    log.debug("detected faces=%d", len(faces))
+
+    with metrics.stage('classify'):
+        predictions = classify_faces(img, [face[:4] for face in faces])
+    img_height, img_width = img.shape[:2]
+    results = [
+        build_face_result(face, prediction, img_width, img_height)
+        for face, prediction in zip(faces, predictions)
+    ]
+
+    # Only faces inside the detection circle can be VIPs
+    in_area = [i for i, result in enumerate(results) if result["in_detection_area"]]
+    with metrics.stage('vip_match'):
+        matches = match_vips(img, [faces[i][:4] for i in in_area])
+    for i, (vip_id, similarity) in zip(in_area, matches):
+        assign_vip(results[i], vip_id, similarity)
+
+    return faces, results
+
+def analyze_frame(img):
+    """Detect faces, estimate age and gender on a decoded BGR or grayscale frame"""
+    try:
+        if img is None or img.size == 0:
+            return {"gender": "Unknown", "age": 0, "error": "Invalid image data"}
+
+        # Get original dimensions for scaling
+        img_height, img_width = img.shape[:2]
+        log.debug("frame width=%d height=%d", img_width, img_height)
+
+        _, results = detect_and_classify(img, to_grayscale(img))
+
+        # Return the first face in detection area, or first face if none in area
+        if not results:
+            return {"gender": "Unknown", "age": 0, "error": "No face detected"}
+
+        result = results[primary_result_index(results)]
+        log.debug("result %s", result)
+        return result
+
+    except Exception as e:
+        print(f"Error in face detection: {str(e)}")
+        traceback.print_exc()
+        return {"gender": "Unknown", "age": 0, "error": str(e)}